@@ -4,22 +4,20 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from openai import AzureOpenAI
 import os
-from dotenv import load_dotenv
+import config
 import PyPDF2
 import docx
 from pptx import Presentation
 import io
 import re
 
-load_dotenv()
-
 app = FastAPI(title="Tacit Knowledge Bot")
 
 # Initialize Azure OpenAI
 client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version="2024-02-01",
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+    api_key=config.AZURE_OPENAI_KEY,
+    api_version=config.AZURE_OPENAI_API_VERSION,
+    azure_endpoint=config.AZURE_OPENAI_ENDPOINT
 )
 
 documents = []
@@ -0,0 +1,144 @@
+"""Synthetic corpora and document fixtures for the benchmark suite"""
+import io
+import random
+from typing import List
+
+import docx
+from pptx import Presentation
+from pptx.util import Inches
+
+# Domain terms sprinkled into the generated text so queries have realistic hits
+DOMAIN_TERMS = [
+    "vpn", "firewall", "onboarding", "payroll", "kubernetes", "deployment", "invoice",
+    "backup", "escalation", "runbook", "incident", "certificate", "database", "migration",
+    "procurement", "laptop", "password", "sharepoint", "outage", "rollback", "compliance",
+]
+
+
+def make_vocabulary(size: int = 5000, seed: int = 0) -> List[str]:
+    """Build a deterministic vocabulary of pronounceable pseudo-words"""
+    rng = random.Random(seed)
+    consonants = "bcdfghjklmnprstvwz"
+    vowels = "aeiou"
+    words = set(DOMAIN_TERMS)
+    while len(words) < size:
+        length = rng.randint(2, 5)
+        words.add("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(length)))
+    return sorted(words)
+
+
+class SyntheticCorpus:
+    """Deterministic generator of chunks and questions with a Zipf-like word distribution"""
+
+    def __init__(self, vocabulary_size: int = 5000, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.vocabulary = make_vocabulary(vocabulary_size, seed)
+        self.weights = [1.0 / (rank + 1) for rank in range(len(self.vocabulary))]
+        self.rng.shuffle(self.vocabulary)
+
+    def sentence(self, words: int = 12) -> str:
+        tokens = self.rng.choices(self.vocabulary, weights=self.weights, k=words)
+        return " ".join(tokens).capitalize() + "."
+
+    def text(self, characters: int) -> str:
+        sentences = []
+        length = 0
+        while length < characters:
+            sentence = self.sentence(self.rng.randint(8, 20))
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        return " ".join(sentences)
+
+    def documents(self, count: int, chunk_size: int = 1000) -> List[dict]:
+        """Documents shaped like the entries main.py stores after an upload"""
+        docs = []
+        for i in range(count):
+            content = self.text(chunk_size)
+            docs.append({
+                "content": content,
+                "filename": f"synthetic_{i:07d}.txt",
+                "file_type": "txt",
+                "size": len(content)
+            })
+        return docs
+
+    def questions(self, count: int) -> List[str]:
+        """Questions mixing frequent, rare and domain terms"""
+        questions = []
+        for _ in range(count):
+            terms = self.rng.sample(self.vocabulary[:len(self.vocabulary) // 4], 2)
+            terms.append(self.rng.choice(DOMAIN_TERMS))
+            questions.append(f"What is the {' '.join(terms)} procedure?")
+        return questions
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: List[str], line_length: int = 90) -> bytes:
+    """Write a minimal multi-page PDF with one Helvetica text stream per page"""
+    objects = []
+    page_ids = []
+    font_id = 3
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(None)  # page tree, filled in once the page ids are known
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page_text in pages:
+        lines = [page_text[i:i + line_length] for i in range(0, len(page_text), line_length)]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        stream_bytes = stream.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream_bytes) + stream_bytes + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (font_id, content_id)
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref_offset = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+    return out.getvalue()
+
+
+def make_docx(paragraphs: List[str]) -> bytes:
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def make_pptx(slides: List[str]) -> bytes:
+    presentation = Presentation()
+    layout = presentation.slide_layouts[6]
+    for slide_text in slides:
+        slide = presentation.slides.add_slide(layout)
+        box = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(6))
+        box.text_frame.text = slide_text
+    out = io.BytesIO()
+    presentation.save(out)
+    return out.getvalue()
+
+
+def make_fixtures(corpus: SyntheticCorpus, count: int, pages: int = 5, page_chars: int = 2000) -> dict:
+    """Generate `count` PDF, DOCX and PPTX files keyed by extension"""
+    fixtures = {"pdf": [], "docx": [], "pptx": []}
+    for _ in range(count):
+        parts = [corpus.text(page_chars) for _ in range(pages)]
+        fixtures["pdf"].append(make_pdf(parts))
+        fixtures["docx"].append(make_docx(parts))
+        fixtures["pptx"].append(make_pptx(parts))
+    return fixtures
@@ -0,0 +1,157 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Local stand-in for Azure OpenAI / OpenAI (services/stub_llm.py). When set, every
+# app and service sends completions and embeddings there instead of the provider.
+LLM_STUB_URL = os.getenv("LLM_STUB_URL")
+
+AZURE_OPENAI_KEY = "stub" if LLM_STUB_URL else os.getenv("AZURE_OPENAI_KEY")
+AZURE_OPENAI_ENDPOINT = LLM_STUB_URL or os.getenv("AZURE_OPENAI_ENDPOINT")
+AZURE_OPENAI_API_VERSION = "2024-02-01"
+
+OPENAI_API_KEY = "stub" if LLM_STUB_URL else os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = f"{LLM_STUB_URL.rstrip('/')}/v1" if LLM_STUB_URL else None
+
+# Stub server behaviour: latency before the first token, spread and shape of the
+# latency distribution (fixed, uniform, normal or lognormal), and streaming speed
+STUB_LLM_LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "400"))
+STUB_LLM_LATENCY_JITTER_MS = float(os.getenv("STUB_LLM_LATENCY_JITTER_MS", "100"))
+STUB_LLM_LATENCY_DISTRIBUTION = os.getenv("STUB_LLM_LATENCY_DISTRIBUTION", "lognormal")
+STUB_LLM_TOKENS_PER_SECOND = float(os.getenv("STUB_LLM_TOKENS_PER_SECOND", "50"))
+STUB_LLM_EMBEDDING_DIMENSIONS = int(os.getenv("STUB_LLM_EMBEDDING_DIMENSIONS", "1536"))
+STUB_LLM_SEED = os.getenv("STUB_LLM_SEED")
+# Fraction of completions the stub rejects with 429 + Retry-After, to exercise client backoff
+STUB_LLM_THROTTLE_RATE = float(os.getenv("STUB_LLM_THROTTLE_RATE", "0"))
+STUB_LLM_RETRY_AFTER_S = float(os.getenv("STUB_LLM_RETRY_AFTER_S", "1"))
+
+# Client-side limits for the completion deployment. Azure grants 6 RPM per 1000 TPM;
+# requests whose estimated queue wait exceeds the SLO are shed with a 503. 0 disables a limit.
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "120000"))
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "720"))
+LLM_QUEUE_SLO_MS = float(os.getenv("LLM_QUEUE_SLO_MS", "3000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_MS = float(os.getenv("LLM_BACKOFF_BASE_MS", "500"))
+LLM_BACKOFF_MAX_MS = float(os.getenv("LLM_BACKOFF_MAX_MS", "20000"))
+
+# Chat sessions: idle sessions expire, and history beyond the token budget is folded into a summary
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_HISTORY_TOKEN_BUDGET = int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", "1500"))
+
+# PDF extraction: backend (auto, pypdfium2, pymupdf or pypdf2), worker processes for
+# documents with at least PDF_PARALLEL_MIN_PAGES pages, and pages kept in the content-hash cache
+PDF_EXTRACTION_BACKEND = os.getenv("PDF_EXTRACTION_BACKEND", "auto")
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+PDF_PAGE_CACHE_SIZE = int(os.getenv("PDF_PAGE_CACHE_SIZE", "20000"))
+
+# Documents are split into chunks of about CHUNK_SIZE characters along slide, page and
+# paragraph boundaries; prompts include at most CONTEXT_CHARS_PER_DOC of each document
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CONTEXT_CHARS_PER_DOC = int(os.getenv("CONTEXT_CHARS_PER_DOC", "4000"))
+
+# Context compression: prompts keep only the question-relevant sentences of the retrieved
+# context, up to CONTEXT_TOKEN_BUDGET estimated tokens in total (0 sends the context uncut)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+
+# Mail uploads (.eml/.mbox) are parsed MAIL_PARSE_BATCH messages at a time in a worker thread;
+# MAIL_STRIP_QUOTES drops quoted replies, forwarded history and signatures before indexing
+MAIL_PARSE_BATCH = int(os.getenv("MAIL_PARSE_BATCH", "200"))
+MAIL_STRIP_QUOTES = os.getenv("MAIL_STRIP_QUOTES", "true").lower() == "true"
+
+# GET /documents returns DOCUMENTS_PAGE_SIZE entries per page unless a limit is given, and never more than the max
+DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "100"))
+DOCUMENTS_MAX_PAGE_SIZE = int(os.getenv("DOCUMENTS_MAX_PAGE_SIZE", "1000"))
+
+# Deleted documents are tombstoned; once they reach CORPUS_COMPACTION_RATIO of the live corpus a
+# background job reclaims them, CORPUS_COMPACTION_BATCH per event-loop turn
+CORPUS_COMPACTION_RATIO = float(os.getenv("CORPUS_COMPACTION_RATIO", "0.1"))
+CORPUS_COMPACTION_BATCH = int(os.getenv("CORPUS_COMPACTION_BATCH", "256"))
+
+# Admin endpoints (snapshots) require this value in the X-Admin-Token header; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Corpus snapshots: named snapshots live next to SNAPSHOT_PATH, and a replica started with
+# SNAPSHOT_RESTORE_ON_STARTUP loads SNAPSHOT_PATH (if present) before serving
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshots/corpus.tkbsnap")
+SNAPSHOT_RESTORE_ON_STARTUP = os.getenv("SNAPSHOT_RESTORE_ON_STARTUP", "true").lower() == "true"
+
+# Async RAG path (RAGService.aquery): CHAT_RETRIEVAL=vector answers sessionless /chat requests
+# from the Pinecone index instead of the keyword corpus; connection pool sizes per worker for the
+# OpenAI and vector clients, and per-request timeout
+CHAT_RETRIEVAL = os.getenv("CHAT_RETRIEVAL", "keyword")
+RAG_HTTP_POOL_SIZE = int(os.getenv("RAG_HTTP_POOL_SIZE", "100"))
+RAG_VECTOR_POOL_SIZE = int(os.getenv("RAG_VECTOR_POOL_SIZE", "100"))
+RAG_REQUEST_TIMEOUT_S = float(os.getenv("RAG_REQUEST_TIMEOUT_S", "30"))
+
+# Retrieval micro-batching: questions arriving within the window share one corpus pass
+# (and one embedding call on the vector path); 0 disables batching
+RETRIEVAL_BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5"))
+RETRIEVAL_BATCH_MAX = int(os.getenv("RETRIEVAL_BATCH_MAX", "64"))
+
+# Two-stage retrieval: each document is summarized at ingest by its top KEYWORDS_PER_DOCUMENT
+# words; on corpora of at least RETRIEVAL_TWO_STAGE_MIN_DOCUMENTS documents a question first
+# picks RETRIEVAL_FANOUT candidates from those summaries and only they are scored (0 = flat search)
+KEYWORDS_PER_DOCUMENT = int(os.getenv("KEYWORDS_PER_DOCUMENT", "96"))
+RETRIEVAL_FANOUT = int(os.getenv("RETRIEVAL_FANOUT", "50"))
+RETRIEVAL_TWO_STAGE_MIN_DOCUMENTS = int(os.getenv("RETRIEVAL_TWO_STAGE_MIN_DOCUMENTS", "1000"))
+# Vector path: per-document centroid vectors live in this Pinecone namespace
+DOCUMENT_SUMMARY_NAMESPACE = os.getenv("DOCUMENT_SUMMARY_NAMESPACE", "document-summaries")
+
+# Vector index for DocumentProcessor: "pinecone", or "local" for the in-process store in
+# services/vector_store.py, saved under VECTOR_STORE_PATH. Its scan uses VECTOR_QUANTIZATION
+# codes (none, int8 or binary) and re-scores VECTOR_RESCORE_FACTOR x top_k candidates exactly
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "vectors")
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "int8")
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+
+# Tenants: each API key (TENANT_API_KEYS, "key=tenant,...") gets its own corpus and sessions. The
+# unauthenticated X-Tenant-ID header selects a tenant only if TENANT_HEADER_ENABLED and no API
+# keys are configured; tenants bound to a key always require it. Resident tenants share
+# TENANT_RESIDENT_BYTES characters of text; past that the least recently used, and any idle for
+# TENANT_IDLE_SECONDS, are written to TENANT_DATA_DIR and reloaded on demand. Uploads beyond
+# TENANT_QUOTA_BYTES per tenant are rejected. 0 disables the budget, idle eviction or quota
+TENANT_API_KEYS = os.getenv("TENANT_API_KEYS", "")
+TENANT_HEADER_ENABLED = os.getenv("TENANT_HEADER_ENABLED", "false").lower() == "true"
+TENANT_DATA_DIR = os.getenv("TENANT_DATA_DIR", "tenants")
+TENANT_RESIDENT_BYTES = int(os.getenv("TENANT_RESIDENT_BYTES", str(512 * 1024 * 1024)))
+TENANT_QUOTA_BYTES = int(os.getenv("TENANT_QUOTA_BYTES", "0"))
+TENANT_IDLE_SECONDS = float(os.getenv("TENANT_IDLE_SECONDS", "1800"))
+
+# Diagnostics (admin endpoints): LOOP_LAG_MONITOR starts the event-loop lag monitor at startup,
+# logging the blocking stack of any stall over LOOP_LAG_THRESHOLD_MS; profiles are capped at
+# PROFILE_MAX_SECONDS
+LOOP_LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "false").lower() == "true"
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# Query log: one JSON line per answered question, appended in batches every QUERY_LOG_FLUSH_S
+# ("" disables it). At startup the QUERY_LOG_WARM_TOP_N most frequent questions in the last
+# QUERY_LOG_WARM_TAIL_BYTES of the log are retrieved into the retrieval cache (question -> doc
+# IDs per corpus version, RETRIEVAL_CACHE_SIZE entries) before /health reports ready. A log
+# that would grow past QUERY_LOG_MAX_BYTES is rotated to PATH.1 (0 never rotates)
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "logs/queries.jsonl")
+QUERY_LOG_FLUSH_S = float(os.getenv("QUERY_LOG_FLUSH_S", "1.0"))
+QUERY_LOG_MAX_BYTES = int(os.getenv("QUERY_LOG_MAX_BYTES", str(256 * 1024 * 1024)))
+QUERY_LOG_WARM_TOP_N = int(os.getenv("QUERY_LOG_WARM_TOP_N", "200"))
+QUERY_LOG_WARM_TAIL_BYTES = int(os.getenv("QUERY_LOG_WARM_TAIL_BYTES", str(64 * 1024 * 1024)))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "10000"))
+
+# Extractive fast path: when the best sentence of the retrieved documents contains at least
+# EXTRACTIVE_MIN_CONFIDENCE of the question's terms (and the question has EXTRACTIVE_MIN_TERMS
+# or more), up to EXTRACTIVE_MAX_SENTENCES cited sentences are returned without an LLM call
+EXTRACTIVE_ANSWERS = os.getenv("EXTRACTIVE_ANSWERS", "false").lower() == "true"
+EXTRACTIVE_MIN_CONFIDENCE = float(os.getenv("EXTRACTIVE_MIN_CONFIDENCE", "0.8"))
+EXTRACTIVE_MIN_TERMS = int(os.getenv("EXTRACTIVE_MIN_TERMS", "2"))
+EXTRACTIVE_MAX_SENTENCES = int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "2"))
+
+# Typo tolerance: question terms of FUZZY_MIN_TERM_LENGTH+ letters that are not corpus words are
+# expanded to up to FUZZY_MAX_EXPANSIONS corpus words within FUZZY_MAX_EDITS edits (1 below 8
+# letters); a document matching only an expansion scores FUZZY_WEIGHT for that term (0 disables)
+FUZZY_WEIGHT = float(os.getenv("FUZZY_WEIGHT", "0.5"))
+FUZZY_MIN_TERM_LENGTH = int(os.getenv("FUZZY_MIN_TERM_LENGTH", "5"))
+FUZZY_MAX_EDITS = int(os.getenv("FUZZY_MAX_EDITS", "2"))
+FUZZY_MAX_EXPANSIONS = int(os.getenv("FUZZY_MAX_EXPANSIONS", "3"))
@@ -1,16 +1,38 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Request, Header, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 import os
-import PyPDF2
-import docx
-from pptx import Presentation
-import io
+import time
+import asyncio
+import json
 import re
-from typing import List
+import sys
+from typing import AsyncIterator, Dict, List, Optional
 import logging
+import threading
+import uuid
 import openai
+import config
+from services import metrics
+from services.singleflight import SingleFlight, StreamingSingleFlight, normalize_question, run_until_disconnected
+from services.rate_limiter import RateLimiter, Overloaded
+from services.sessions import SessionStore
+from services.tenants import DEFAULT_TENANT, QuotaExceeded, Tenant, TenantRegistry, parse_api_keys, valid_tenant_name
+from services.pdf_extraction import pdf_extractor
+from services import legacy_office
+from services.file_types import detect_file_type
+from services.office_extraction import docx_sections, pptx_sections
+from services.chunking import chunk_sections, describe_location, page_sections, text_sections
+from services.mail_extraction import MailThreader, iter_raw_messages, mail_sections, parse_messages
+from services.corpus import STOP_WORDS, SORT_KEYS, Corpus, decode_cursor, filter_key, parse_filters, query_terms, top_keywords
+from services import snapshot
+from services.batching import MicroBatcher
+from services.profiling import allocations, loop_monitor, profiler
+from services.cache import LRUCache
+from services.query_log import QueryLog, top_questions
+from services.extractive import extract_answer
+from services.compression import compress_passages
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -18,9 +40,9 @@ logger = logging.getLogger(__name__)
 
 # Configure for Azure OpenAI
 openai.api_type = "azure"
-openai.api_key = os.getenv("AZURE_OPENAI_KEY")
-openai.api_base = os.getenv("AZURE_OPENAI_ENDPOINT")
-openai.api_version = "2024-02-01"
+openai.api_key = config.AZURE_OPENAI_KEY
+openai.api_base = config.AZURE_OPENAI_ENDPOINT
+openai.api_version = config.AZURE_OPENAI_API_VERSION
 
 app = FastAPI(
     title="Tacit Knowledge Bot",
@@ -28,8 +50,45 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Global storage for documents
-documents = []
+# Per-tenant document storage: each tenant's Corpus is indexed by doc ID and metadata, and its
+# version is bumped whenever the document set changes, so cached and coalesced answers never
+# mix corpora. Each tenant also has its own multi-turn conversations (bounded server-side
+# history and per-session retrieval cache). Cold tenants are evicted to disk
+tenants = TenantRegistry(
+    data_dir=config.TENANT_DATA_DIR,
+    resident_bytes=config.TENANT_RESIDENT_BYTES,
+    quota_bytes=config.TENANT_QUOTA_BYTES,
+    idle_seconds=config.TENANT_IDLE_SECONDS,
+    make_sessions=lambda: SessionStore(
+        max_sessions=config.SESSION_MAX_SESSIONS,
+        ttl_seconds=config.SESSION_TTL_SECONDS,
+        history_token_budget=config.SESSION_HISTORY_TOKEN_BUDGET
+    )
+)
+TENANT_API_KEYS = parse_api_keys(config.TENANT_API_KEYS)
+# Tenants bound to an API key are only reachable with that key
+KEYED_TENANTS = set(TENANT_API_KEYS.values())
+
+# Concurrent identical questions share one in-flight answer (or token stream)
+chat_flight = SingleFlight()
+chat_streams = StreamingSingleFlight()
+
+# Doc IDs retrieved per (tenant, question, corpus version, filters), prefilled at startup from the query log
+retrieval_cache = LRUCache(config.RETRIEVAL_CACHE_SIZE)
+query_log = (QueryLog(config.QUERY_LOG_PATH, flush_interval=config.QUERY_LOG_FLUSH_S, max_bytes=config.QUERY_LOG_MAX_BYTES)
+             if config.QUERY_LOG_PATH else None)
+# /health reports ready once the warm-up has run
+warmup = {"ready": False, "questions": 0, "seconds": None}
+
+# Keeps completions within the deployment's TPM/RPM quota and sheds load past the SLO
+llm_limiter = RateLimiter(
+    tokens_per_minute=config.LLM_TPM_LIMIT,
+    requests_per_minute=config.LLM_RPM_LIMIT,
+    queue_slo=config.LLM_QUEUE_SLO_MS / 1000.0,
+    max_retries=config.LLM_MAX_RETRIES,
+    backoff_base=config.LLM_BACKOFF_BASE_MS / 1000.0,
+    backoff_max=config.LLM_BACKOFF_MAX_MS / 1000.0,
+)
 
 # CORS middleware
 app.add_middleware(
@@ -40,72 +99,388 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Track in-flight requests, route latency and the per-request stage breakdown"""
+    start = time.perf_counter()
+    traced_at = allocations.begin() if allocations.running else None
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    try:
+        with metrics.request_scope() as timings:
+            response = await call_next(request)
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec()
+    
+    route = request.scope.get("route")
+    route_path = route.path if route else "unmatched"
+    elapsed = time.perf_counter() - start
+    if traced_at is not None and allocations.running:
+        allocations.record(f"{request.method} {route_path}", traced_at)
+    metrics.REQUEST_LATENCY.labels(route_path, request.method).observe(elapsed)
+    metrics.REQUESTS.labels(route_path, request.method, str(response.status_code)).inc()
+    
+    if timings:
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+        logger.info(f"{request.method} {route_path} took {elapsed * 1000:.1f} ms ({metrics.server_timing_header(timings)})")
+    return response
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints are only reachable with the configured ADMIN_TOKEN"""
+    if not config.ADMIN_TOKEN or x_admin_token != config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+async def current_tenant(x_api_key: Optional[str] = Header(None), x_tenant_id: Optional[str] = Header(None)):
+    """The tenant a request acts on: its API key's tenant, else the X-Tenant-ID header, else the default tenant.
+    
+    The header is an unauthenticated claim, so it is only honoured when TENANT_HEADER_ENABLED is set and
+    no API keys are configured; a tenant bound to an API key is never served without that key.
+    """
+    if x_api_key is not None:
+        name = TENANT_API_KEYS.get(x_api_key)
+        if name is None:
+            raise HTTPException(status_code=401, detail="Unknown API key")
+    else:
+        if x_tenant_id and config.TENANT_HEADER_ENABLED and not TENANT_API_KEYS:
+            name = x_tenant_id
+        else:
+            name = DEFAULT_TENANT
+        if name in KEYED_TENANTS:
+            raise HTTPException(status_code=401, detail="API key required")
+    if not valid_tenant_name(name):
+        raise HTTPException(status_code=400, detail=f"Invalid tenant name: {name}")
+    tenant = await tenants.get(name)
+    # Pinned until the response is sent, so a concurrent eviction never drops it mid-request
+    tenant.active += 1
+    try:
+        yield tenant
+    finally:
+        tenant.active -= 1
+
+def snapshot_path(name: Optional[str] = None, tenant: str = DEFAULT_TENANT) -> str:
+    """Named snapshots are confined to the directory of SNAPSHOT_PATH; other tenants default to <tenant>.tkbsnap there"""
+    directory = os.path.dirname(config.SNAPSHOT_PATH) or "."
+    if not name:
+        return config.SNAPSHOT_PATH if tenant == DEFAULT_TENANT else os.path.join(directory, f"{tenant}.tkbsnap")
+    return os.path.join(directory, os.path.basename(name))
+
+@app.on_event("startup")
+async def restore_snapshot_on_startup():
+    if config.SNAPSHOT_RESTORE_ON_STARTUP and os.path.exists(config.SNAPSHOT_PATH):
+        start = time.perf_counter()
+        try:
+            tenant = await tenants.install(DEFAULT_TENANT, snapshot.load_corpus(config.SNAPSHOT_PATH))
+            update_corpus_gauges()
+            logger.info(f"Restored {len(tenant.corpus)} documents from {config.SNAPSHOT_PATH} in {time.perf_counter() - start:.2f} s")
+        except Exception as e:
+            logger.error(f"Error restoring snapshot {config.SNAPSHOT_PATH}: {e}")
+
+async def evict_idle_tenants():
+    """Tenants that stop sending requests are evicted without waiting for another tenant's request"""
+    while True:
+        await asyncio.sleep(min(config.TENANT_IDLE_SECONDS, 60))
+        try:
+            evicted = tenants.enforce()
+            if evicted:
+                logger.info(f"Evicted idle tenants: {', '.join(evicted)}")
+                update_corpus_gauges()
+        except Exception as e:
+            logger.error(f"Error evicting idle tenants: {e}")
+
+def retrieval_cache_key(tenant: Tenant, question: str, filters: Optional[dict]) -> tuple:
+    return (tenant.name, normalize_question(question), tenant.corpus.version, filter_key(filters))
+
+async def warm_up():
+    """Retrieve the query log's most frequent questions into the retrieval cache, then report ready"""
+    start = time.perf_counter()
+    try:
+        frequent = await asyncio.to_thread(top_questions, config.QUERY_LOG_PATH, config.QUERY_LOG_WARM_TOP_N,
+                                           config.QUERY_LOG_WARM_TAIL_BYTES)
+        by_tenant = {}
+        for name, question, filters, _ in frequent:
+            if valid_tenant_name(name):
+                by_tenant.setdefault(name, []).append((question, filters))
+        for name, requests in by_tenant.items():
+            tenant = await tenants.get(name)
+            for offset in range(0, len(requests), config.RETRIEVAL_BATCH_MAX):
+                batch = requests[offset:offset + config.RETRIEVAL_BATCH_MAX]
+                for (question, filters), docs in zip(batch, find_relevant_batch(batch, tenant.corpus)):
+                    retrieval_cache.put(retrieval_cache_key(tenant, question, filters), [doc["doc_id"] for doc in docs])
+                    warmup["questions"] += 1
+                # Requests that arrive meanwhile (health checks) are not held up
+                await asyncio.sleep(0)
+        metrics.WARMUP_QUESTIONS.set(warmup["questions"])
+        logger.info(f"Warmed the retrieval cache with {warmup['questions']} frequent questions in {time.perf_counter() - start:.2f} s")
+    except Exception as e:
+        logger.error(f"Error warming up from query log {config.QUERY_LOG_PATH}: {e}")
+    finally:
+        warmup["seconds"] = round(time.perf_counter() - start, 3)
+        warmup["ready"] = True
+
+@app.on_event("startup")
+def start_query_log_and_warm_up():
+    # Registered after the snapshot restore, so warm-up retrieves from the restored corpus
+    if query_log is None or config.QUERY_LOG_WARM_TOP_N <= 0:
+        warmup["ready"] = True
+    else:
+        asyncio.get_running_loop().create_task(warm_up())
+    if query_log is not None:
+        query_log.start()
+
+@app.on_event("shutdown")
+async def flush_query_log():
+    if query_log is not None:
+        await query_log.close()
+
+@app.on_event("shutdown")
+async def flush_tenant_snapshots():
+    # Tenants evicted just before shutdown are still being written
+    await tenants.flush()
+
+@app.on_event("shutdown")
+async def close_worker_pools():
+    # Only close the RAG clients if the vector path ever created them
+    if "services.rag_service" in sys.modules:
+        await vector_rag().aclose()
+    pdf_extractor.shutdown()
+
+def log_query(tenant: Tenant, question: str, filters: Optional[dict], started: float, doc_ids, served: str,
+              stream: bool = False, mode: Optional[str] = None, compression: Optional[dict] = None):
+    """Queue a query log entry; `served` is computed, cached (retrieval cache hit), session or coalesced"""
+    if query_log is not None:
+        query_log.record({
+            "tenant": tenant.name,
+            "question": question,
+            "normalized": normalize_question(question),
+            "filters": filters or None,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "doc_ids": doc_ids,
+            "served": served,
+            "mode": mode,
+            "context_ratio": compression["ratio"] if compression else None,
+            "stream": stream
+        })
+
+@app.on_event("startup")
+def start_loop_lag_monitor():
+    if config.LOOP_LAG_MONITOR:
+        loop_monitor.start()
+
+@app.on_event("startup")
+def start_tenant_eviction():
+    if config.TENANT_IDLE_SECONDS:
+        asyncio.get_running_loop().create_task(evict_idle_tenants())
+
 # Serve static files
 try:
     app.mount("/static", StaticFiles(directory="static"), name="static")
 except:
     pass
 
-def extract_text_from_pdf(file_content: bytes) -> str:
-    """Extract text from PDF file"""
+def extract_sections_from_pdf(file_content: bytes) -> List[dict]:
+    """Extract text from PDF file, one section per page"""
     try:
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        return page_sections(pdf_extractor.extract_pages(file_content))
     except Exception as e:
         logger.error(f"Error extracting PDF text: {e}")
-        return ""
+        return []
 
-def extract_text_from_docx(file_content: bytes) -> str:
-    """Extract text from Word document"""
+def extract_sections_from_docx(file_content: bytes) -> List[dict]:
+    """Extract paragraphs, tables, headers and footers from Word document"""
     try:
-        doc_file = io.BytesIO(file_content)
-        doc = docx.Document(doc_file)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        return docx_sections(file_content)
     except Exception as e:
         logger.error(f"Error extracting DOCX text: {e}")
-        return ""
+        return []
 
-def extract_text_from_pptx(file_content: bytes) -> str:
-    """Extract text from PowerPoint presentation"""
+def extract_sections_from_pptx(file_content: bytes) -> List[dict]:
+    """Extract slide text, tables, grouped shapes and notes from PowerPoint presentation"""
     try:
-        ppt_file = io.BytesIO(file_content)
-        prs = Presentation(ppt_file)
-        text = ""
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + "\n"
-        return text
+        return pptx_sections(file_content)
     except Exception as e:
         logger.error(f"Error extracting PPTX text: {e}")
-        return ""
+        return []
 
-def find_relevant_documents(question: str, documents: List[dict], threshold: int = 1) -> List[dict]:
-    """Find documents relevant to the question"""
-    if not documents:
+def extract_sections_from_doc(file_content: bytes) -> List[dict]:
+    """Extract text from a legacy Word 97-2003 document"""
+    try:
+        return text_sections(legacy_office.extract_text_from_doc(file_content), paragraph_break=r"\n")
+    except Exception as e:
+        logger.error(f"Error extracting DOC text: {e}")
         return []
+
+def extract_sections_from_ppt(file_content: bytes) -> List[dict]:
+    """Extract text from a legacy PowerPoint 97-2003 presentation"""
+    try:
+        return [{"kind": "slide", "text": text} for text in legacy_office.iter_ppt_text(file_content)]
+    except Exception as e:
+        logger.error(f"Error extracting PPT text: {e}")
+        return []
+
+def extract_sections_from_txt(file_content: bytes) -> List[dict]:
+    return text_sections(file_content.decode("utf-8"))
+
+SECTION_EXTRACTORS = {
+    "txt": extract_sections_from_txt,
+    "pdf": extract_sections_from_pdf,
+    "docx": extract_sections_from_docx,
+    "doc": extract_sections_from_doc,
+    "pptx": extract_sections_from_pptx,
+    "ppt": extract_sections_from_ppt,
+}
+
+def document_keywords(text: str) -> List[str]:
+    """Ingest-time summary of a document for the coarse retrieval stage"""
+    return top_keywords(text, config.KEYWORDS_PER_DOCUMENT, STOP_WORDS)
+
+def match_terms(terms, documents: List[dict], candidates: Optional[List[int]] = None) -> dict:
+    """Map each term to the positions of the documents containing it, in one pass over the corpus.
     
-    stop_words = {'what', 'how', 'where', 'when', 'why', 'who', 'is', 'are', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'about', 'can', 'could', 'should', 'would', 'do', 'does', 'did'}
+    With `candidates`, only those positions are scanned (the result of a metadata filter).
+    """
+    matches = {term: set() for term in terms}
+    positions = range(len(documents)) if candidates is None else candidates
+    for position in positions:
+        content_lower = documents[position]["content"].lower()
+        for term in matches:
+            if term in content_lower:
+                matches[term].add(position)
+    return matches
+
+def expand_terms(question_words: List[str], vocabulary) -> Dict[str, List[str]]:
+    """Near spellings from the corpus vocabulary for question words that are not corpus words"""
+    expansions = {}
+    if not config.FUZZY_WEIGHT:
+        return expansions
+    for word in set(question_words):
+        if len(word) < config.FUZZY_MIN_TERM_LENGTH or word in vocabulary:
+            continue
+        max_edits = min(config.FUZZY_MAX_EDITS, 1 if len(word) < 8 else 2)
+        near = vocabulary.near(word, max_edits, config.FUZZY_MAX_EXPANSIONS)
+        metrics.FUZZY_TERMS.labels("expanded" if near else "unmatched").inc()
+        if near:
+            expansions[word] = near
+    return expansions
+
+def expanded_terms(question_words: List[str], expansions: Dict[str, List[str]]) -> set:
+    terms = set(question_words)
+    for near in expansions.values():
+        terms.update(near)
+    return terms
+
+def rank_documents(question_words: List[str], matches: dict, threshold: int = 1, limit: int = 3,
+                   expansions: Optional[Dict[str, List[str]]] = None) -> List[int]:
+    """Positions of the best-scoring documents, one point per matched question word.
     
-    question_words = [word.lower().strip('.,!?') for word in question.split() 
-                     if len(word) > 2 and word.lower() not in stop_words]
+    A document containing only a near spelling of a word (from `expansions`) scores
+    FUZZY_WEIGHT for it instead; `threshold` counts the words matched either way.
+    """
+    scores = {}
+    matched = {}
+    for word in question_words:
+        hits = dict.fromkeys(matches.get(word, ()), 1)
+        for near in (expansions or {}).get(word, ()):
+            for position in matches.get(near, ()):
+                hits.setdefault(position, config.FUZZY_WEIGHT)
+        for position, weight in hits.items():
+            scores[position] = scores.get(position, 0) + weight
+            matched[position] = matched.get(position, 0) + 1
+    ranked = sorted((item for item in scores.items() if matched[item[0]] >= threshold), key=lambda item: (-item[1], item[0]))
+    return [position for position, _ in ranked[:limit]]
+
+def find_relevant_documents(question: str, documents: List[dict], threshold: int = 1,
+                            candidates: Optional[List[int]] = None) -> List[dict]:
+    """Find documents relevant to the question, among `candidates` if given"""
+    if not documents or candidates == []:
+        return []
     
-    relevant_docs = []
-    for doc in documents:
-        content_lower = doc["content"].lower()
-        relevance_score = sum(1 for word in question_words if word in content_lower)
-        if relevance_score >= threshold:
-            relevant_docs.append((doc, relevance_score))
+    question_words = query_terms(question)
+    matches = match_terms(set(question_words), documents, candidates)
+    return [documents[position] for position in rank_documents(question_words, matches, threshold)]
+
+def find_relevant_batch(requests: List[tuple], source: Corpus, fanout: Optional[int] = None) -> List[List[dict]]:
+    """Retrieval for a batch of (question, filters) pairs with one corpus pass per distinct filter.
+    
+    Metadata filters are resolved to a doc ID set first. On large corpora each question
+    then picks `fanout` candidate documents from the keyword index, and only those are
+    scored in full; questions whose terms match no document keywords fall back to
+    scoring every document that passes the filter.
+    """
+    fanout = config.RETRIEVAL_FANOUT if fanout is None else fanout
+    two_stage = fanout > 0 and len(source) >= config.RETRIEVAL_TWO_STAGE_MIN_DOCUMENTS
+    groups = {}
+    for position, (question, filters) in enumerate(requests):
+        groups.setdefault(filter_key(filters), (filters, []))[1].append(position)
+    
+    results = [[] for _ in requests]
+    for filters, positions in groups.values():
+        candidates = source.filter_ids(filters)
+        if not source.documents or candidates == []:
+            continue
+        question_words = {position: query_terms(requests[position][0]) for position in positions}
+        expansions = {position: expand_terms(question_words[position], source.vocabulary) for position in positions}
+        terms = {position: expanded_terms(question_words[position], expansions[position]) for position in positions}
+        
+        shortlists = {}
+        if two_stage:
+            allowed = set(candidates) if candidates is not None else None
+            for position in positions:
+                shortlist = source.keyword_candidates(terms[position], fanout, allowed)
+                if shortlist:
+                    shortlists[position] = shortlist
+        if len(shortlists) == len(positions):
+            candidates = sorted(set().union(*shortlists.values()))
+        
+        matches = match_terms(set().union(*terms.values()), source.documents, candidates)
+        for position in positions:
+            question_matches = matches
+            if position in shortlists and len(shortlists) > 1:
+                # Other questions' candidates were scanned too; rank only this question's own
+                shortlist = set(shortlists[position])
+                question_matches = {term: found & shortlist for term, found in matches.items()}
+            ranked = rank_documents(question_words[position], question_matches, threshold=1, expansions=expansions[position])
+            results[position] = [source.documents[doc_id] for doc_id in ranked]
+    return results
+
+def find_relevant_tenant_batch(requests: List[tuple]) -> List[List[dict]]:
+    """Retrieval for a batch of (question, filters, corpus) triples, one find_relevant_batch per corpus"""
+    results = [None] * len(requests)
+    by_corpus = {}
+    for position, (_, _, source) in enumerate(requests):
+        by_corpus.setdefault(id(source), (source, []))[1].append(position)
+    for source, positions in by_corpus.values():
+        found = find_relevant_batch([requests[position][:2] for position in positions], source)
+        for position, docs in zip(positions, found):
+            results[position] = docs
+    return results
+
+# Concurrent questions arriving within a few milliseconds are retrieved together, across tenants
+retrieval_batcher = MicroBatcher(
+    find_relevant_tenant_batch,
+    window=config.RETRIEVAL_BATCH_WINDOW_MS / 1000.0,
+    max_batch=config.RETRIEVAL_BATCH_MAX,
+    name="retrieval"
+)
+
+def find_session_documents(session, question: str, source: Corpus, filters: Optional[dict] = None) -> List[dict]:
+    """Retrieval for a follow-up question, only matching terms this session has not seen yet"""
+    documents = source.documents
+    cache = session.retrieval_cache((source.version, filter_key(filters)))
+    question_words = query_terms(question)
+    expansions = expand_terms(question_words, source.vocabulary)
+    new_terms = {term for term in expanded_terms(question_words, expansions) if term not in cache}
+    for word in set(question_words):
+        metrics.record_cache("session_retrieval", word not in new_terms)
+    if new_terms:
+        with metrics.span("filter"):
+            candidates = source.filter_ids(filters)
+        cache.update(match_terms(new_terms, documents, candidates))
     
-    relevant_docs.sort(key=lambda x: x[1], reverse=True)
-    return [doc[0] for doc in relevant_docs[:3]]
+    positions = rank_documents(question_words, cache, expansions=expansions)
+    if not positions:
+        # Follow-ups like "and what port does it use?" keep talking about the same documents
+        positions = session.last_documents
+    session.last_documents = positions
+    return [documents[position] for position in positions]
 
 @app.get("/")
 def read_root():
@@ -133,48 +508,56 @@ def read_root():
         return HTMLResponse(content=html_content)
 
 @app.get("/api")
-def api_status():
+def api_status(tenant: Tenant = Depends(current_tenant)):
     """API status endpoint"""
     return {
         "message": "🤖 Tacit Knowledge Bot is LIVE!",
         "status": "healthy",
-        "documents_loaded": len(documents),
+        "tenant": tenant.name,
+        "documents_loaded": len(tenant.corpus),
         "azure_openai_available": bool(openai.api_key and openai.api_base)
     }
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint; 503 while the startup warm-up is still running"""
+    if not warmup["ready"]:
+        return JSONResponse({"status": "warming", "warmup": warmup}, status_code=503)
     return {
         "status": "healthy",
-        "documents": len(documents),
+        "warmup": warmup,
+        "documents": sum(len(tenant.corpus) for tenant in tenants.resident()),
+        "tenants_resident": len(tenants.resident()),
         "azure_openai_connected": bool(openai.api_key and openai.api_base),
         "version": "1.0.0"
     }
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload and process documents"""
+async def upload_file(file: UploadFile = File(...), tags: str = Form(""), tenant: Tenant = Depends(current_tenant)):
+    """Upload and process documents; `tags` is an optional comma-separated list to filter on later"""
     try:
         logger.info(f"Processing file: {file.filename}")
         
-        filename = file.filename.lower()
+        # Mailboxes can be many GB, so they are streamed from the spooled upload rather than read whole
+        head = await file.read(4096)
+        await file.seek(0)
+        mail_type = detect_file_type(head, file.filename)
+        if mail_type in ("eml", "mbox"):
+            return await ingest_mail(file, mail_type, tenant, tags)
+        
         content = await file.read()
         
-        # Extract text based on file type
-        if filename.endswith('.txt'):
-            text_content = content.decode("utf-8")
-        elif filename.endswith('.pdf'):
-            text_content = extract_text_from_pdf(content)
-        elif filename.endswith('.docx') or filename.endswith('.doc'):
-            text_content = extract_text_from_docx(content)
-        elif filename.endswith('.pptx') or filename.endswith('.ppt'):
-            text_content = extract_text_from_pptx(content)
-        else:
-            return {
-                "status": "error", 
-                "message": f"Unsupported file type: {file.filename}. Supports: PDF, Word, PowerPoint, TXT"
-            }
+        # Extract text based on the detected format, whatever the extension says
+        with metrics.span("extract"):
+            file_type = detect_file_type(content, file.filename)
+            if file_type not in SECTION_EXTRACTORS:
+                return {
+                    "status": "error", 
+                    "message": f"Unsupported file type: {file.filename}. Supports: PDF, Word, PowerPoint, TXT, EML, MBOX"
+                }
+            # Off the event loop: a large PDF or Office file takes seconds to extract
+            sections = await asyncio.to_thread(SECTION_EXTRACTORS[file_type], content)
+            text_content, chunks = chunk_sections(sections, config.CHUNK_SIZE)
         
         if not text_content.strip():
             return {
@@ -182,20 +565,38 @@ async def upload_file(file: UploadFile = File(...)):
                 "message": f"No text could be extracted from {file.filename}"
             }
         
+        try:
+            tenants.check_quota(tenant, len(text_content))
+        except QuotaExceeded as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=413)
+        
         # Store document
-        documents.append({
-            "content": text_content,
-            "filename": file.filename,
-            "file_type": filename.split('.')[-1],
-            "size": len(text_content)
-        })
+        tag_list = [tag.strip().lower() for tag in tags.split(",") if tag.strip()]
+        # Filenames are not unique, so the vectors of this upload are found again by its own ID
+        document_id = str(uuid.uuid4())
+        with metrics.span("index"):
+            doc_id = tenant.corpus.add({
+                "content": text_content,
+                "filename": file.filename,
+                "file_type": file_type,
+                "size": len(text_content),
+                "chunks": chunks,
+                "keywords": document_keywords(text_content),
+                "tags": tag_list,
+                "document_id": document_id
+            })
+            tenants.enforce(keep=tenant.name)
+            update_corpus_gauges()
+        await index_vectors(tenant, [{"content": text_content, "filename": file.filename, "sections": sections,
+                                      "file_type": file_type, "tags": tag_list, "document_id": document_id}])
         
         logger.info(f"Successfully processed {file.filename}, extracted {len(text_content)} characters")
         
         return {
             "filename": file.filename,
+            "doc_id": doc_id,
             "status": "success",
-            "message": f"Successfully processed {file.filename}! Total docs: {len(documents)}",
+            "message": f"Successfully processed {file.filename}! Total docs: {len(tenant.corpus)}",
             "extracted_characters": len(text_content)
         }
         
@@ -203,11 +604,407 @@ async def upload_file(file: UploadFile = File(...)):
         logger.error(f"Error processing file {file.filename}: {e}")
         return {"status": "error", "message": f"Error processing file: {str(e)}"}
 
+async def ingest_mail(file: UploadFile, mail_type: str, tenant: Tenant, tags: str) -> dict:
+    """Index each message of an .eml or .mbox upload as an email document.
+    
+    Messages already in the tenant's corpus (by Message-ID) are skipped, and every
+    message records the thread it belongs to, joining threads indexed by earlier uploads.
+    """
+    corpus = tenant.corpus
+    threader = MailThreader(corpus.message_thread, corpus.subject_thread)
+    # Message-IDs met in this upload; earlier uploads are looked up in the corpus
+    seen = set()
+    
+    tag_list = [tag.strip().lower() for tag in tags.split(",") if tag.strip()]
+    counts = {"indexed": 0, "duplicate": 0, "empty": 0, "malformed": 0}
+    threads = set()
+    characters = quoted = 0
+    messages = iter_raw_messages(file.file, mail_type)
+    # This batch's new messages, embedded for the vector path once the batch is indexed
+    vector_documents = []
+    try:
+        while True:
+            with metrics.span("extract"):
+                batch = await asyncio.to_thread(parse_messages, messages, config.MAIL_PARSE_BATCH, config.MAIL_STRIP_QUOTES)
+            if not batch:
+                break
+            with metrics.span("index"):
+                for message in batch:
+                    if message is None:
+                        counts["malformed"] += 1
+                        continue
+                    if message["message_id"] in seen or corpus.message_thread(message["message_id"]) is not None:
+                        counts["duplicate"] += 1
+                        continue
+                    seen.add(message["message_id"])
+                    if not message["body"]:
+                        counts["empty"] += 1
+                        continue
+                    sections = mail_sections(message)
+                    text_content, chunks = chunk_sections(sections, config.CHUNK_SIZE)
+                    tenants.check_quota(tenant, len(text_content))
+                    thread_id = threader.thread_of(message)
+                    document_id = str(uuid.uuid4())
+                    corpus.add({
+                        "content": text_content,
+                        "filename": message["subject"] or "(no subject)",
+                        "file_type": "email",
+                        "size": len(text_content),
+                        "chunks": chunks,
+                        "keywords": document_keywords(text_content),
+                        "tags": tag_list,
+                        "mailbox": file.filename,
+                        "message_id": message["message_id"],
+                        "thread_id": thread_id,
+                        "in_reply_to": message["in_reply_to"],
+                        "from": message["from"],
+                        "sent_at": message["sent_at"],
+                        "document_id": document_id
+                    })
+                    vector_documents.append({"content": text_content, "filename": message["subject"] or "(no subject)",
+                                             "sections": sections, "file_type": "email", "tags": tag_list,
+                                             "document_id": document_id})
+                    counts["indexed"] += 1
+                    threads.add(thread_id)
+                    characters += len(text_content)
+                    quoted += message["quoted_characters"]
+            await index_vectors(tenant, vector_documents)
+            vector_documents = []
+    except QuotaExceeded as e:
+        # The messages indexed before the quota ran out are searchable on the vector path too
+        await index_vectors(tenant, vector_documents)
+        return JSONResponse({"status": "error", "message": str(e), "messages_indexed": counts["indexed"]}, status_code=413)
+    finally:
+        for outcome, count in counts.items():
+            metrics.MAIL_MESSAGES.labels(outcome).inc(count)
+        tenants.enforce(keep=tenant.name)
+        update_corpus_gauges()
+    
+    logger.info(f"Indexed {counts['indexed']} messages from {file.filename} ({counts['duplicate']} duplicates, "
+                f"{quoted} quoted characters stripped)")
+    return {
+        "filename": file.filename,
+        "status": "success",
+        "message": f"Indexed {counts['indexed']} messages from {file.filename}! Total docs: {len(corpus)}",
+        "messages_indexed": counts["indexed"],
+        "duplicates_skipped": counts["duplicate"],
+        "empty_skipped": counts["empty"],
+        "malformed_skipped": counts["malformed"],
+        "threads": len(threads),
+        "extracted_characters": characters,
+        "quoted_characters_stripped": quoted
+    }
+
+SYSTEM_PROMPT = "You are a helpful knowledge assistant. Be clear, concise, and cite sources when using document information."
+MAX_ANSWER_TOKENS = 500
+# Status logged for requests abandoned by their client (nginx's convention); nobody receives it
+CLIENT_CLOSED_REQUEST = 499
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) used for quota accounting"""
+    return len(text) // 4 + 1
+
+def select_context(doc: dict, question_words: List[str]) -> str:
+    """The document's best-matching chunks, in reading order, within the per-document budget"""
+    content = doc["content"]
+    chunks = doc.get("chunks")
+    if not chunks or len(content) <= config.CONTEXT_CHARS_PER_DOC:
+        return content
+    
+    scored = []
+    for position, chunk in enumerate(chunks):
+        chunk_lower = content[chunk["start"]:chunk["end"]].lower()
+        scored.append((-sum(1 for word in question_words if word in chunk_lower), position))
+    scored.sort()
+    
+    selected = []
+    used = 0
+    for _, position in scored:
+        chunk = chunks[position]
+        length = chunk["end"] - chunk["start"]
+        if selected and used + length > config.CONTEXT_CHARS_PER_DOC:
+            continue
+        selected.append(position)
+        used += length
+    
+    parts = []
+    for position in sorted(selected):
+        chunk = chunks[position]
+        location = describe_location(chunk)
+        text = content[chunk["start"]:chunk["end"]].strip()
+        parts.append(f"[{location}] {text}" if location else text)
+    return "\n...\n".join(parts)
+
+def build_prompt(question: str, relevant_docs: List[dict]):
+    """Assemble the completion prompt, the source note appended to the answer and the context compression stats"""
+    compression = None
+    if relevant_docs:
+        question_words = query_terms(question)
+        passages = [select_context(doc, question_words) for doc in relevant_docs]
+        passages, compression = compress_passages(question_words, passages, config.CONTEXT_TOKEN_BUDGET)
+        context_parts = []
+        doc_names = []
+        for doc, passage in zip(relevant_docs, passages):
+            doc_type = "📧" if doc['file_type'] == 'email' else "📄"
+            if passage:
+                context_parts.append(f"=== {doc_type} {doc['filename']} ===\n{passage}")
+            doc_names.append(doc['filename'])
+        
+        context = "\n\n".join(context_parts)
+        prompt = f"Based on these documents, answer the question clearly and concisely:\n\n{context}\n\nQuestion: {question}\n\nAnswer:"
+        source_info = f" (Based on: {', '.join(doc_names)})"
+    else:
+        prompt = f"Answer this general question: {question}"
+        source_info = " (General knowledge)"
+    return prompt, source_info, compression
+
+async def retrieve_documents(question: str, tenant: Tenant, session=None, filters: Optional[dict] = None):
+    """Relevant documents and how retrieval was served (session, cached or computed)"""
+    with metrics.span("retrieval"):
+        if session is not None:
+            return find_session_documents(session, question, tenant.corpus, filters), "session"
+        key = retrieval_cache_key(tenant, question, filters)
+        doc_ids = retrieval_cache.get(key)
+        metrics.record_cache("retrieval", doc_ids is not None)
+        if doc_ids is not None:
+            return [tenant.corpus.documents[doc_id] for doc_id in doc_ids], "cached"
+        relevant_docs = await retrieval_batcher.submit((question, filters, tenant.corpus))
+        retrieval_cache.put(key, [doc["doc_id"] for doc in relevant_docs])
+        return relevant_docs, "computed"
+
+def build_messages(question: str, relevant_docs: List[dict], session=None):
+    """Completion messages, source note and context compression stats; only built for questions the LLM answers"""
+    with metrics.span("prompt"):
+        prompt, source_info, compression = build_prompt(question, relevant_docs)
+        history = session.messages() if session is not None else []
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, *history, {"role": "user", "content": prompt}]
+    return messages, source_info, compression
+
+def extractive_answer(question: str, relevant_docs: List[dict], session=None) -> Optional[dict]:
+    """The fast path's cited sentences if it is enabled and confident; follow-ups in a session always go to the LLM"""
+    if not config.EXTRACTIVE_ANSWERS or session is not None:
+        return None
+    with metrics.span("extractive"):
+        return extract_answer(question, query_terms(question), relevant_docs, config.EXTRACTIVE_MIN_CONFIDENCE,
+                              config.EXTRACTIVE_MIN_TERMS, config.EXTRACTIVE_MAX_SENTENCES)
+
+def vector_rag():
+    """The Pinecone-backed RAGService, imported on first use so keyword deployments need none of its clients"""
+    from services.rag_service import rag_service
+    return rag_service
+
+def vector_index():
+    """The DocumentProcessor that writes the vector index, imported on first use like `vector_rag`"""
+    from services.document_processor import doc_processor
+    return doc_processor
+
+async def index_vectors(tenant: Tenant, documents: List[dict]):
+    """Embed and index uploaded documents for the vector path (CHAT_RETRIEVAL=vector), off the event loop"""
+    if config.CHAT_RETRIEVAL != "vector" or not documents:
+        return
+    for result in await asyncio.to_thread(vector_index().process_documents, documents, tenant.namespace):
+        if result["status"] != "success":
+            logger.error(f"Error indexing vectors for tenant {tenant.name}: {result['message']}")
+
+async def delete_vectors(tenant: Tenant, deleted: List[dict]):
+    """Delete the vectors of deleted documents so the vector path stops returning them"""
+    document_ids = [doc["document_id"] for doc in deleted if doc.get("document_id")]
+    if config.CHAT_RETRIEVAL != "vector" or not document_ids:
+        return
+    result = await asyncio.to_thread(vector_index().delete_document, filters={"document_id": document_ids},
+                                     namespace=tenant.namespace)
+    if result["status"] != "success":
+        logger.error(f"Error deleting vectors for tenant {tenant.name}: {result['message']}")
+
+async def vector_answer(question: str, tenant: Tenant, filters: Optional[dict] = None) -> dict:
+    """Answer from the vector index through RAGService (CHAT_RETRIEVAL=vector)"""
+    started = time.perf_counter()
+    with metrics.span("llm"):
+        answer = await vector_rag().aquery(question, filters, tenant.namespace)
+    failed = answer.startswith("Error:")
+    if not failed:
+        metrics.record_answer("llm")
+    log_query(tenant, question, filters, started, [], "vector", mode=None if failed else "llm")
+    result = {"question": question, "answer": answer, "source_doc_ids": [], "mode": "llm"}
+    if failed:
+        result.update({"source": "Error", "mode": None})
+    return result
+
+def estimate_message_tokens(messages: List[dict]) -> int:
+    return sum(estimate_tokens(message["content"]) for message in messages) + MAX_ANSWER_TOKENS
+
+async def answer_question(question: str, tenant: Tenant, session=None, filters: Optional[dict] = None) -> dict:
+    """Retrieve context and get a completion for one question"""
+    if config.CHAT_RETRIEVAL == "vector" and session is None:
+        return await vector_answer(question, tenant, filters)
+    started = time.perf_counter()
+    relevant_docs, served = await retrieve_documents(question, tenant, session, filters)
+    
+    extracted = extractive_answer(question, relevant_docs, session)
+    if extracted is not None:
+        metrics.record_answer("extractive")
+        cited = sorted({citation["doc_id"] for citation in extracted["citations"]})
+        logger.info(f"Answered question from {len(cited)} documents without the LLM (confidence {extracted['confidence']})")
+        log_query(tenant, question, filters, started, [doc['doc_id'] for doc in relevant_docs], served, mode="extractive")
+        return {
+            "question": question,
+            "answer": extracted["answer"],
+            "documents_used": len(cited),
+            "source_documents": [tenant.corpus.documents[doc_id]['filename'] for doc_id in cited],
+            "source_doc_ids": cited,
+            "mode": "extractive",
+            "confidence": extracted["confidence"],
+            "citations": extracted["citations"]
+        }
+    
+    # Get AI response using Azure OpenAI API
+    messages, source_info, compression = build_messages(question, relevant_docs, session)
+    estimated_tokens = estimate_message_tokens(messages)
+    llm_start = time.perf_counter()
+    response = await llm_limiter.call(
+        lambda: openai.ChatCompletion.acreate(
+            engine="gpt-35-turbo",
+            messages=messages,
+            max_tokens=MAX_ANSWER_TOKENS,
+            temperature=0.7
+        ),
+        tokens=estimated_tokens
+    )
+    # Only prompts that were actually sent count towards the context metrics
+    metrics.record_context(compression)
+    if response.get("usage"):
+        llm_limiter.reconcile(estimated_tokens, response["usage"]["total_tokens"])
+    
+    # Without streaming the first token arrives together with the whole completion
+    llm_elapsed = time.perf_counter() - llm_start
+    metrics.record_stage("llm", llm_elapsed)
+    metrics.LLM_TIME_TO_FIRST_TOKEN.observe(llm_elapsed)
+    answer = response.choices[0].message.content
+    metrics.record_answer("llm")
+    
+    logger.info(f"Successfully answered question using {len(relevant_docs)} documents")
+    
+    result = {
+        "question": question,
+        "answer": answer + source_info,
+        "documents_used": len(relevant_docs),
+        "source_documents": [doc['filename'] for doc in relevant_docs] if relevant_docs else [],
+        "source_doc_ids": [doc['doc_id'] for doc in relevant_docs],
+        "mode": "llm",
+        "context_compression": compression
+    }
+    if session is not None:
+        tenant.sessions.record_turn(session, question, answer)
+        result["session_id"] = session.session_id
+        result["turn"] = session.turns
+    log_query(tenant, question, filters, started, result["source_doc_ids"], served, mode="llm", compression=compression)
+    return result
+
+async def stream_answer(question: str, tenant: Tenant, session=None, filters: Optional[dict] = None):
+    """Yield the answer as it is generated, followed by the source note"""
+    try:
+        started = time.perf_counter()
+        if config.CHAT_RETRIEVAL == "vector" and session is None:
+            async for token in vector_rag().astream(question, filters, tenant.namespace):
+                yield token
+            metrics.record_answer("llm")
+            log_query(tenant, question, filters, started, [], "vector", stream=True, mode="llm")
+            return
+        relevant_docs, served = await retrieve_documents(question, tenant, session, filters)
+        doc_ids = [doc["doc_id"] for doc in relevant_docs]
+        
+        extracted = extractive_answer(question, relevant_docs, session)
+        if extracted is not None:
+            metrics.record_answer("extractive")
+            log_query(tenant, question, filters, started, doc_ids, served, stream=True, mode="extractive")
+            yield extracted["answer"]
+            return
+        
+        messages, source_info, compression = build_messages(question, relevant_docs, session)
+        llm_start = time.perf_counter()
+        first_token = True
+        answer_parts = []
+        response = await llm_limiter.call(
+            lambda: openai.ChatCompletion.acreate(
+                engine="gpt-35-turbo",
+                messages=messages,
+                max_tokens=MAX_ANSWER_TOKENS,
+                temperature=0.7,
+                stream=True
+            ),
+            tokens=estimate_message_tokens(messages)
+        )
+        metrics.record_context(compression)
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.get("content")
+            if token:
+                if first_token:
+                    metrics.LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - llm_start)
+                    first_token = False
+                answer_parts.append(token)
+                yield token
+        metrics.record_stage("llm", time.perf_counter() - llm_start)
+        metrics.record_answer("llm")
+        
+        logger.info(f"Successfully streamed answer using {len(relevant_docs)} documents")
+        if session is not None:
+            tenant.sessions.record_turn(session, question, "".join(answer_parts))
+        log_query(tenant, question, filters, started, doc_ids, served, stream=True, mode="llm", compression=compression)
+        yield source_info
+    except Overloaded:
+        # Raised before the first token, so open_stream can still answer 503
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming chat: {e}")
+        yield f"Error: {str(e)}"
+
+async def stream_session_answer(question: str, tenant: Tenant, session, filters: Optional[dict] = None):
+    # One turn at a time per session, so each answer sees the previous one in its history
+    async with session.lock:
+        async for token in stream_answer(question, tenant, session, filters):
+            yield token
+
+async def open_stream(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Wait for the first token before the response starts, so a request shed in the
+    limiter queue gets a 503 instead of a 200 with an error in the body"""
+    try:
+        first = await tokens.__anext__()
+    except StopAsyncIteration:
+        first = ""
+    
+    async def stream():
+        yield first
+        async for token in tokens:
+            yield token
+    return stream()
+
+async def until_disconnected(request: Request, awaitable):
+    """`awaitable`'s result, or None once the client has gone away and the work was cancelled"""
+    result = await run_until_disconnected(request, awaitable)
+    if result is None:
+        metrics.CHAT_DISCONNECTS.inc()
+    return result
+
 @app.post("/chat")
-async def chat(question: str = Form(...)):
-    """Chat with the knowledge bot"""
+async def chat(request: Request, question: str = Form(...), stream: bool = Form(False), session_id: Optional[str] = Form(None),
+               filename: Optional[str] = Form(None), file_type: Optional[str] = Form(None), tags: Optional[str] = Form(None),
+               uploaded_after: Optional[str] = Form(None), uploaded_before: Optional[str] = Form(None),
+               tenant: Tenant = Depends(current_tenant)):
+    """Chat with the knowledge bot; pass a session_id to continue a conversation.
+    
+    filename, file_type and tags take comma-separated alternatives and uploaded_after/
+    uploaded_before take ISO dates or epoch seconds; they restrict which documents are searched.
+    """
+    started = time.perf_counter()
+    try:
+        filters = parse_filters(filename, file_type, tags, uploaded_after, uploaded_before)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": f"Invalid upload date filter: {e}"}, status_code=400)
+    
     try:
-        if not openai.api_key or not openai.api_base:
+        if config.CHAT_RETRIEVAL != "vector" and (not openai.api_key or not openai.api_base):
             return {
                 "question": question,
                 "answer": "Azure OpenAI API key or endpoint not configured. Please check environment variables.",
@@ -216,72 +1013,346 @@ async def chat(question: str = Form(...)):
         
         logger.info(f"Processing question: {question}")
         
-        # Find relevant documents
-        relevant_docs = find_relevant_documents(question, documents, threshold=1)
+        if stream:
+            # Streams commit to a 200 on the first byte, so shed before starting one
+            llm_limiter.admit(estimate_tokens(SYSTEM_PROMPT + question) + MAX_ANSWER_TOKENS)
         
-        if relevant_docs:
-            context_parts = []
-            doc_names = []
-            for doc in relevant_docs:
-                doc_type = "📧" if doc['file_type'] == 'email' else "📄"
-                context_parts.append(f"=== {doc_type} {doc['filename']} ===\n{doc['content']}")
-                doc_names.append(doc['filename'])
+        if session_id:
+            # Answers depend on the conversation so far, so sessions are never coalesced
+            session = tenant.sessions.get_or_create(session_id)
+            if stream:
+                tokens = await until_disconnected(request, open_stream(stream_session_answer(question, tenant, session, filters)))
+                if tokens is None:
+                    return Response(status_code=CLIENT_CLOSED_REQUEST)
+                return StreamingResponse(tokens, media_type="text/plain; charset=utf-8", headers={"X-Session-Id": session.session_id})
             
-            context = "\n\n".join(context_parts)
-            prompt = f"Based on these documents, answer the question clearly and concisely:\n\n{context}\n\nQuestion: {question}\n\nAnswer:"
-            source_info = f" (Based on: {', '.join(doc_names)})"
-        else:
-            prompt = f"Answer this general question: {question}"
-            source_info = " (General knowledge)"
+            async def answer_in_session():
+                async with session.lock:
+                    return await answer_question(question, tenant, session, filters)
+            result = await until_disconnected(request, answer_in_session())
+            if result is None:
+                return Response(status_code=CLIENT_CLOSED_REQUEST)
+            with metrics.span("serialize"):
+                return JSONResponse(result)
         
-        # Get AI response using Azure OpenAI API
-        response = openai.ChatCompletion.create(
-            engine="gpt-35-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful knowledge assistant. Be clear, concise, and cite sources when using document information."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
+        # Identical questions against the same tenant corpus and filters share one retrieval + completion
+        flight_key = (tenant.name, normalize_question(question), tenant.corpus.version, filter_key(filters))
         
-        answer = response.choices[0].message.content
+        if stream:
+            broadcast, shared = chat_streams.join(flight_key, lambda: stream_answer(question, tenant, filters=filters))
+            metrics.record_cache("chat_coalesce", shared)
+            if shared:
+                log_query(tenant, question, filters, started, None, "coalesced", stream=True)
+            # Only this subscriber stops waiting on a disconnect; the broadcast keeps serving the others
+            tokens = await until_disconnected(request, open_stream(broadcast.subscribe()))
+            if tokens is None:
+                return Response(status_code=CLIENT_CLOSED_REQUEST)
+            return StreamingResponse(tokens, media_type="text/plain; charset=utf-8")
         
-        logger.info(f"Successfully answered question using {len(relevant_docs)} documents")
+        flight = await until_disconnected(request, chat_flight.do(flight_key, lambda: answer_question(question, tenant, filters=filters)))
+        if flight is None:
+            return Response(status_code=CLIENT_CLOSED_REQUEST)
+        result, shared = flight
+        metrics.record_cache("chat_coalesce", shared)
+        if shared:
+            log_query(tenant, question, filters, started, result["source_doc_ids"], "coalesced", mode=result["mode"])
         
-        return {
-            "question": question,
-            "answer": answer + source_info,
-            "documents_used": len(relevant_docs),
-            "source_documents": [doc['filename'] for doc in relevant_docs] if relevant_docs else []
-        }
+        with metrics.span("serialize"):
+            return JSONResponse({**result, "question": question})
         
+    except Overloaded as e:
+        logger.warning(f"Shedding chat request: {e}")
+        return JSONResponse(
+            {"question": question, "answer": "The assistant is busy right now, please try again shortly.", "source": "Error"},
+            status_code=503,
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
     except Exception as e:
         logger.error(f"Error processing chat: {e}")
         return {"question": question, "answer": f"Error: {str(e)}"}
 
-@app.get("/documents")
-def list_documents():
-    """List all uploaded documents"""
+@app.post("/sessions")
+def create_session(tenant: Tenant = Depends(current_tenant)):
+    """Start a conversation; pass the returned session_id to /chat"""
+    session = tenant.sessions.create()
+    return {"session_id": session.session_id}
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str, tenant: Tenant = Depends(current_tenant)):
+    """Conversation history kept for a session"""
+    session = tenant.sessions.get(session_id)
+    if session is None:
+        return JSONResponse({"status": "error", "message": f"Unknown session: {session_id}"}, status_code=404)
     return {
-        "total_documents": len(documents),
-        "documents": [
-            {
-                "filename": doc["filename"],
-                "type": doc["file_type"],
-                "size": doc.get("size", 0),
-                "icon": "📧" if doc["file_type"] == "email" else "📄"
-            } for doc in documents
-        ]
+        "session_id": session.session_id,
+        "turns": session.turns,
+        "summary": session.summary,
+        "history": session.history
+    }
+
+@app.delete("/sessions/{session_id}")
+def end_session(session_id: str, tenant: Tenant = Depends(current_tenant)):
+    """Forget a conversation"""
+    return {"session_id": session_id, "deleted": tenant.sessions.delete(session_id)}
+
+DOCUMENT_FIELDS = ("doc_id", "filename", "type", "size", "tags", "uploaded_at", "icon")
+
+def document_summary(doc: dict, fields=DOCUMENT_FIELDS) -> dict:
+    """Listing entry for one document, restricted to the requested fields"""
+    summary = {
+        "doc_id": doc["doc_id"],
+        "filename": doc["filename"],
+        "type": doc["file_type"],
+        "size": doc.get("size", 0),
+        "tags": doc["tags"],
+        "uploaded_at": doc["uploaded_at"],
+        "icon": "📧" if doc["file_type"] == "email" else "📄"
     }
+    return {field: summary[field] for field in fields}
+
+def stream_document_lines(docs, fields, batch_size: int = 500):
+    """NDJSON lines for the listing, sent a batch at a time"""
+    lines = []
+    for doc in docs:
+        lines.append(json.dumps(document_summary(doc, fields)) + "\n")
+        if len(lines) >= batch_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+@app.get("/documents")
+def list_documents(limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None,
+                   sort: str = "uploaded_at", order: str = "asc", format: str = "json",
+                   filename: Optional[str] = None, file_type: Optional[str] = None, tags: Optional[str] = None,
+                   uploaded_after: Optional[str] = None, uploaded_before: Optional[str] = None,
+                   tenant: Tenant = Depends(current_tenant)):
+    """List uploaded documents a page at a time.
+    
+    Pass the returned next_cursor back (with the same filters) to get the following page;
+    it carries the sort order. `fields` selects a
+    comma-separated subset of the entry fields, `sort` is uploaded_at or size, and
+    format=ndjson streams one document per line (every remaining document unless a limit is given).
+    The same filters as /chat narrow the listing; `counts` always covers the whole corpus.
+    """
+    corpus = tenant.corpus
+    try:
+        selected = tuple(field.strip() for field in fields.split(",") if field.strip()) if fields else DOCUMENT_FIELDS
+        unknown = [field for field in selected if field not in DOCUMENT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(DOCUMENT_FIELDS)}")
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unsupported sort: {sort}. Available: {', '.join(SORT_KEYS)}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unsupported order: {order}")
+        filters = parse_filters(filename, file_type, tags, uploaded_after, uploaded_before)
+        descending = order == "desc"
+        
+        if format == "ndjson":
+            if limit is None:
+                after = None
+                if cursor:
+                    sort, descending, after = decode_cursor(cursor)
+                docs = corpus.iter_sorted(sort, descending, after, filters)
+            else:
+                docs, _ = corpus.page(limit, sort, descending, cursor, filters)
+            return StreamingResponse(stream_document_lines(docs, selected), media_type="application/x-ndjson")
+        
+        page_size = min(limit if limit is not None else config.DOCUMENTS_PAGE_SIZE, config.DOCUMENTS_MAX_PAGE_SIZE)
+        docs, next_cursor = corpus.page(page_size, sort, descending, cursor, filters)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    
+    with metrics.span("serialize"):
+        return JSONResponse({
+            "total_documents": len(corpus),
+            "counts": corpus.stats(),
+            "documents": [document_summary(doc, selected) for doc in docs],
+            "next_cursor": next_cursor
+        })
+
+def update_corpus_gauges():
+    """Corpus gauges cover every resident tenant"""
+    resident = tenants.resident()
+    metrics.CORPUS_DOCUMENTS.set(sum(len(tenant.corpus) for tenant in resident))
+    metrics.CORPUS_CHARACTERS.set(sum(tenant.corpus.total_size for tenant in resident))
+    metrics.CORPUS_TOMBSTONES.set(sum(len(tenant.corpus.tombstones) for tenant in resident))
+
+async def compact_corpus(tenant: Tenant):
+    """Reclaim a tenant's deleted documents in the background, a batch per event-loop turn"""
+    try:
+        start = time.perf_counter()
+        pending = len(tenant.corpus.tombstones)
+        await tenant.corpus.compact(config.CORPUS_COMPACTION_BATCH)
+        metrics.CORPUS_COMPACTIONS.inc()
+        logger.info(f"Compacted {pending} deleted documents of tenant {tenant.name} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    except Exception as e:
+        logger.error(f"Error compacting corpus of tenant {tenant.name}: {e}")
+    finally:
+        tenant.compaction_task = None
+        update_corpus_gauges()
+
+def delete_from_corpus(tenant: Tenant, doc_ids) -> List[dict]:
+    """Tombstone documents and start compaction once enough have piled up"""
+    deleted = tenant.corpus.delete(doc_ids)
+    if tenant.compaction_task is None and tenant.corpus.needs_compaction(config.CORPUS_COMPACTION_RATIO):
+        tenant.compaction_task = asyncio.get_running_loop().create_task(compact_corpus(tenant))
+    update_corpus_gauges()
+    return deleted
+
+@app.delete("/documents/{doc_id}")
+async def delete_document(doc_id: int, tenant: Tenant = Depends(current_tenant)):
+    """Delete one document by the doc_id returned from /upload"""
+    deleted = delete_from_corpus(tenant, [doc_id])
+    if not deleted:
+        return JSONResponse({"status": "error", "message": f"Unknown document: {doc_id}"}, status_code=404)
+    await delete_vectors(tenant, deleted)
+    return {"message": f"Deleted {deleted[0]['filename']}", "deleted": [doc_id], "remaining": len(tenant.corpus)}
 
 @app.delete("/documents")
-def clear_documents():
-    """Clear all documents"""
-    global documents
-    count = len(documents)
-    documents = []
-    return {"message": f"Cleared {count} documents", "remaining": 0}
+async def clear_documents(doc_ids: Optional[str] = None, filename: Optional[str] = None, file_type: Optional[str] = None,
+                          tags: Optional[str] = None, uploaded_after: Optional[str] = None, uploaded_before: Optional[str] = None,
+                          tenant: Tenant = Depends(current_tenant)):
+    """Delete the documents matching the given IDs (comma-separated) or filters; with neither, clear all documents"""
+    corpus = tenant.corpus
+    try:
+        filters = parse_filters(filename, file_type, tags, uploaded_after, uploaded_before)
+        ids = [int(doc_id) for doc_id in doc_ids.split(",") if doc_id.strip()] if doc_ids else []
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    
+    if not filters and not ids:
+        count = len(corpus)
+        live = [doc for doc in corpus.documents if doc is not None and corpus.is_live(doc["doc_id"])]
+        corpus.clear()
+        update_corpus_gauges()
+        await delete_vectors(tenant, live)
+        return {"message": f"Cleared {count} documents", "remaining": 0}
+    
+    if filters:
+        matching = corpus.filter_ids(filters)
+        if ids:
+            matching = set(matching)
+            ids = [doc_id for doc_id in ids if doc_id in matching]
+        else:
+            ids = matching
+    deleted = delete_from_corpus(tenant, ids)
+    await delete_vectors(tenant, deleted)
+    return {
+        "message": f"Deleted {len(deleted)} documents",
+        "deleted": [doc["doc_id"] for doc in deleted],
+        "remaining": len(corpus)
+    }
+
+@app.post("/admin/snapshot", dependencies=[Depends(require_admin)])
+async def create_snapshot(name: Optional[str] = None, tenant: Tenant = Depends(current_tenant)):
+    """Write the tenant's corpus and its indexes to a snapshot file"""
+    path = snapshot_path(name, tenant.name)
+    corpus = tenant.corpus
+    try:
+        start = time.perf_counter()
+        # Serializing is a consistent copy taken on the event loop; only the file write runs in a thread
+        sections = corpus.snapshot_sections()
+        metadata = {"documents": len(corpus), "corpus_version": corpus.version, "tenant": tenant.name}
+        table = await asyncio.to_thread(snapshot.write_snapshot, path, sections, metadata)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Wrote snapshot {path} ({len(corpus)} documents) in {elapsed:.2f} s")
+        return {"status": "success", "path": path, "bytes": os.path.getsize(path),
+                "documents": metadata["documents"], "created_at": table["created_at"], "seconds": round(elapsed, 3)}
+    except Exception as e:
+        logger.error(f"Error writing snapshot {path}: {e}")
+        return JSONResponse({"status": "error", "message": f"Error writing snapshot: {str(e)}"}, status_code=500)
+
+@app.post("/admin/restore", dependencies=[Depends(require_admin)])
+async def restore_snapshot(name: Optional[str] = None, verify: bool = False, tenant: Tenant = Depends(current_tenant)):
+    """Replace the tenant's corpus with the contents of a snapshot file"""
+    path = snapshot_path(name, tenant.name)
+    if not os.path.exists(path):
+        return JSONResponse({"status": "error", "message": f"Snapshot not found: {path}"}, status_code=404)
+    try:
+        start = time.perf_counter()
+        restored = await asyncio.to_thread(snapshot.load_corpus, path, verify)
+        await tenants.install(tenant.name, restored)
+        update_corpus_gauges()
+        elapsed = time.perf_counter() - start
+        logger.info(f"Restored {len(restored)} documents for tenant {tenant.name} from {path} in {elapsed:.2f} s")
+        return {"status": "success", "path": path, "documents": len(restored), "seconds": round(elapsed, 3)}
+    except Exception as e:
+        logger.error(f"Error restoring snapshot {path}: {e}")
+        return JSONResponse({"status": "error", "message": f"Error restoring snapshot: {str(e)}"}, status_code=500)
+
+@app.get("/admin/tenants", dependencies=[Depends(require_admin)])
+def list_tenants():
+    """Resident and evicted tenants with their sizes"""
+    return {
+        "resident_bytes": tenants.resident_bytes(),
+        "resident_budget": tenants.resident_budget,
+        "tenants": tenants.stats()
+    }
+
+@app.post("/admin/tenants/{name}/evict", dependencies=[Depends(require_admin)])
+async def evict_tenant(name: str):
+    """Write a tenant to disk and drop it from memory now"""
+    if not tenants.evict(name):
+        return JSONResponse({"status": "error", "message": f"Tenant {name} is not resident or is busy"}, status_code=409)
+    update_corpus_gauges()
+    return {"status": "success", "tenant": name}
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def run_profiler(seconds: float = 10.0, interval_ms: float = 5.0, thread: str = "all"):
+    """Sample stacks for `seconds` and return them collapsed, one "frame;frame;... count" line per stack.
+    
+    thread=loop samples only the event loop thread. Feed the output to flamegraph.pl or speedscope.
+    """
+    if not 0 < seconds <= config.PROFILE_MAX_SECONDS or interval_ms <= 0:
+        return JSONResponse({"status": "error", "message": f"seconds must be in (0, {config.PROFILE_MAX_SECONDS:g}] and interval_ms positive"},
+                            status_code=400)
+    if thread not in ("all", "loop"):
+        return JSONResponse({"status": "error", "message": f"Unsupported thread: {thread}. Available: all, loop"}, status_code=400)
+    try:
+        collapsed = await profiler.profile(seconds, interval_ms / 1000.0, threading.get_ident() if thread == "loop" else None)
+    except RuntimeError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=409)
+    return PlainTextResponse(collapsed)
+
+@app.get("/admin/loop-lag", dependencies=[Depends(require_admin)])
+def loop_lag_report():
+    """Recent event-loop stalls with the stack that was blocking"""
+    return {"running": loop_monitor.running, "threshold_ms": loop_monitor.threshold * 1000, "stalls": list(loop_monitor.stalls)}
+
+@app.post("/admin/loop-lag/start", dependencies=[Depends(require_admin)])
+async def start_loop_lag(threshold_ms: Optional[float] = None):
+    if threshold_ms is not None:
+        loop_monitor.threshold = threshold_ms / 1000.0
+    loop_monitor.start()
+    return {"running": True, "threshold_ms": loop_monitor.threshold * 1000}
+
+@app.post("/admin/loop-lag/stop", dependencies=[Depends(require_admin)])
+async def stop_loop_lag():
+    loop_monitor.stop()
+    return {"running": False}
+
+@app.get("/admin/tracemalloc", dependencies=[Depends(require_admin)])
+def tracemalloc_report(limit: int = 20):
+    """Traced memory growth per route and the top allocation sites since tracing started"""
+    return allocations.report(limit)
+
+@app.post("/admin/tracemalloc/start", dependencies=[Depends(require_admin)])
+def start_tracemalloc(frames: int = 10):
+    """Start tracing allocations (slows every allocation down noticeably while on)"""
+    allocations.start(frames)
+    return {"tracing": True}
+
+@app.post("/admin/tracemalloc/stop", dependencies=[Depends(require_admin)])
+def stop_tracemalloc():
+    allocations.stop()
+    return {"tracing": False}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
 
 if __name__ == "__main__":
     import uvicorn
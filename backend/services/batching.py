@@ -0,0 +1,68 @@
+import asyncio
+import inspect
+import time
+from typing import Any, Callable, List
+
+from services import metrics
+
+
+class MicroBatcher:
+    """Collect items submitted within a short window and process them in one call.
+
+    `process` takes a list of items and returns (or resolves to) a list of results
+    in the same order. A batch is dispatched when the window since its first item
+    has elapsed or when it reaches `max_batch`; a window of 0 processes each item
+    on its own. A caller that stops waiting does not affect the rest of its batch.
+    """
+
+    def __init__(self, process: Callable[[List[Any]], Any], window: float, max_batch: int, name: str):
+        self.process = process
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.name = name
+        self._pending: List[tuple] = []
+        self._timer = None
+        metrics.BATCH_WINDOW.labels(name).set(window)
+        metrics.BATCH_MAX_SIZE.labels(name).set(self.max_batch)
+
+    async def submit(self, item: Any) -> Any:
+        if self.window <= 0 or self.max_batch == 1:
+            return (await self._call([item]))[0]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._dispatch(batch))
+
+    async def _call(self, items: List[Any]) -> List[Any]:
+        results = self.process(items)
+        if inspect.isawaitable(results):
+            results = await results
+        return results
+
+    async def _dispatch(self, batch: List[tuple]):
+        dispatched = time.perf_counter()
+        metrics.BATCH_SIZE.labels(self.name).observe(len(batch))
+        for _, _, submitted in batch:
+            metrics.BATCH_WAIT.labels(self.name).observe(dispatched - submitted)
+        try:
+            results = await self._call([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,114 @@
+import re
+from typing import List, Tuple
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Sentence ends, paragraph breaks, and line breaks where a capitalized line follows one that does not
+# end mid-phrase, so headings, mail headers and list items stand alone (the sections chunk_sections
+# joins are one line apart); a line continuing in lowercase is a soft wrap inside a sentence
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\s*\n\s*\n\s*|(?<=[^\s,;(])[ \t]*\n\s*(?=[A-Z0-9\"'(\[•*-])")
+
+
+def text_sections(text: str, paragraph_break: str = r"\n\s*\n") -> List[dict]:
+    """Sections for unstructured text: one per paragraph, blank-line separated by default"""
+    sections = []
+    for index, paragraph in enumerate(p.strip() for p in re.split(paragraph_break, text)):
+        if paragraph:
+            sections.append({"kind": "paragraph", "text": paragraph, "paragraph": index})
+    return sections
+
+
+def page_sections(pages: List[str]) -> List[dict]:
+    return [{"kind": "page", "text": page.strip(), "page": number}
+            for number, page in enumerate(pages, start=1) if page.strip()]
+
+
+def describe_location(chunk: dict) -> str:
+    """Human-readable origin of a chunk, e.g. 'slide 3' or 'pages 2-4'"""
+    for key in ("slide", "page", "paragraph"):
+        if key in chunk:
+            first, last = chunk[key]
+            label = key if first == last else f"{key}s"
+            return f"{label} {first}" if first == last else f"{label} {first}-{last}"
+    return ""
+
+
+def sentence_spans(text: str, start: int = 0, end: int = None) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the sentences in text[start:end], whitespace trimmed"""
+    end = len(text) if end is None else end
+    spans = []
+    position = start
+    for match in _SENTENCE_BREAK.finditer(text, start, end):
+        if match.start() > position:
+            spans.append((position, match.start()))
+        position = match.end()
+    spans.append((position, end))
+    trimmed = []
+    for first, last in spans:
+        sentence = text[first:last]
+        stripped = sentence.strip()
+        if stripped:
+            first += len(sentence) - len(sentence.lstrip())
+            trimmed.append((first, first + len(stripped)))
+    return trimmed
+
+
+def _split_long(text: str, chunk_size: int) -> List[str]:
+    """Split an oversized section at sentence boundaries, hard-wrapping very long sentences"""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text):
+        while len(sentence) > chunk_size:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:chunk_size])
+            sentence = sentence[chunk_size:]
+        if current and len(current) + 1 + len(sentence) > chunk_size:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_sections(sections: List[dict], chunk_size: int = 1000) -> Tuple[str, List[dict]]:
+    """Join sections into one text and pack consecutive sections into chunks.
+
+    Chunks never straddle a slide or page boundary, and are returned as character
+    spans (`start`, `end`) into the joined text plus the range of slides, pages
+    or paragraphs they cover, so chunk text is never stored twice.
+    """
+    parts = []
+    chunks = []
+    offset = 0
+    current = None
+
+    def close():
+        nonlocal current
+        if current is not None:
+            chunks.append(current)
+            current = None
+
+    for section in sections:
+        location_key = next((key for key in ("slide", "page", "paragraph") if key in section), None)
+        for piece in _split_long(section["text"], chunk_size):
+            start = offset
+            parts.append(piece + "\n")
+            offset += len(piece) + 1
+            boundary = (current is not None and location_key in ("slide", "page")
+                        and current.get(location_key, (None, None))[1] != section[location_key])
+            if current is None or boundary or offset - current["start"] > chunk_size:
+                close()
+                current = {"start": start, "kinds": []}
+                if location_key:
+                    current[location_key] = (section[location_key], section[location_key])
+            current["end"] = offset
+            if section["kind"] not in current["kinds"]:
+                current["kinds"].append(section["kind"])
+            if location_key:
+                first, _ = current.get(location_key, (section[location_key], None))
+                current[location_key] = (first, section[location_key])
+    close()
+    return "".join(parts), chunks
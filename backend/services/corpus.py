@@ -0,0 +1,566 @@
+import array
+import asyncio
+import base64
+import bisect
+import heapq
+import json
+import math
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from services.mail_extraction import normalize_subject
+from services.trigram import TrigramIndex, vocabulary_words
+
+# Metadata fields with a bitmap index; filters on these are resolved before any scoring
+INDEXED_FIELDS = ("filename", "file_type", "tags")
+# Fields the vector stores can also filter on; document_id picks out single uploads
+VECTOR_FILTER_FIELDS = INDEXED_FIELDS + ("document_id",)
+# Orders the document listing can be returned in
+SORT_KEYS = ("uploaded_at", "size")
+
+
+def iter_bits(bitmap: int) -> Iterator[int]:
+    """Positions of the set bits of an integer bitmap, lowest first"""
+    bits = bin(bitmap)[:1:-1]
+    position = bits.find("1")
+    while position != -1:
+        yield position
+        position = bits.find("1", position + 1)
+
+
+class Bitmap:
+    """Mutable bitmap over doc IDs, stored from the byte of its lowest ID onwards.
+
+    Setting a bit is O(1), and values held by few recent documents (a filename, a new
+    tag) stay a few bytes long instead of growing with the corpus.
+    """
+    __slots__ = ("first_byte", "data")
+
+    def __init__(self, first_byte: int = 0, data: bytes = b""):
+        self.first_byte = first_byte
+        self.data = bytearray(data)
+
+    def add(self, position: int):
+        byte, bit = divmod(position, 8)
+        if not self.data:
+            self.first_byte = byte
+        elif byte < self.first_byte:
+            self.data[0:0] = bytes(self.first_byte - byte)
+            self.first_byte = byte
+        index = byte - self.first_byte
+        if len(self.data) <= index:
+            self.data.extend(bytes(index + 1 - len(self.data)))
+        self.data[index] |= 1 << bit
+
+    def discard(self, position: int):
+        byte, bit = divmod(position, 8)
+        index = byte - self.first_byte
+        if 0 <= index < len(self.data):
+            self.data[index] &= ~(1 << bit) & 0xFF
+
+    def __contains__(self, position: int) -> bool:
+        byte, bit = divmod(position, 8)
+        index = byte - self.first_byte
+        return 0 <= index < len(self.data) and bool(self.data[index] & (1 << bit))
+
+    def __bool__(self) -> bool:
+        return any(self.data)
+
+    def __int__(self) -> int:
+        return int.from_bytes(self.data, "little") << (8 * self.first_byte)
+
+
+STOP_WORDS = {'what', 'how', 'where', 'when', 'why', 'who', 'is', 'are', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'about', 'can', 'could', 'should', 'would', 'do', 'does', 'did'}
+
+
+def query_terms(question: str) -> List[str]:
+    """Lowercased question words worth matching against documents"""
+    return [word.lower().strip('.,!?') for word in question.split()
+            if len(word) > 2 and word.lower() not in STOP_WORDS]
+
+
+def top_keywords(text: str, limit: int, stop_words=frozenset()) -> List[str]:
+    """The document's most frequent words (longer than two letters), most frequent first"""
+    counts = Counter(word for word in re.findall(r"\w+", text.lower()) if len(word) > 2 and word not in stop_words)
+    return [word for word, _ in counts.most_common(limit)]
+
+
+def parse_timestamp(value) -> Optional[float]:
+    """Epoch seconds from an epoch number or an ISO 8601 date/datetime string"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+def parse_filters(filename: str = None, file_type: str = None, tags: str = None,
+                  uploaded_after: str = None, uploaded_before: str = None) -> dict:
+    """Build a filter dict from comma-separated form values; empty values are ignored.
+
+    Values within a field are alternatives (any may match); fields are combined with AND.
+    """
+    filters = {}
+    for field, raw in (("filename", filename), ("file_type", file_type), ("tags", tags)):
+        values = [value.strip() for value in (raw or "").split(",") if value.strip()]
+        if field != "filename":
+            # Types and tags are stored lowercase; filenames keep their case for the vector index
+            values = [value.lower() for value in values]
+        if values:
+            filters[field] = values
+    after = parse_timestamp(uploaded_after)
+    before = parse_timestamp(uploaded_before)
+    if after is not None:
+        filters["uploaded_after"] = after
+    if before is not None:
+        filters["uploaded_before"] = before
+    return filters
+
+
+def metadata_filter(filters: Optional[dict]) -> Optional[dict]:
+    """The same filters as a Pinecone metadata filter"""
+    if not filters:
+        return None
+    clauses = {}
+    for field in VECTOR_FILTER_FIELDS:
+        if filters.get(field):
+            clauses[field] = {"$in": filters[field]}
+    uploaded_at = {}
+    if filters.get("uploaded_after") is not None:
+        uploaded_at["$gte"] = filters["uploaded_after"]
+    if filters.get("uploaded_before") is not None:
+        uploaded_at["$lte"] = filters["uploaded_before"]
+    if uploaded_at:
+        clauses["uploaded_at"] = uploaded_at
+    return clauses or None
+
+
+def matches_filters(metadata: dict, filters: Optional[dict]) -> bool:
+    """Whether one record's metadata passes the filters, for stores without a bitmap index"""
+    if not filters:
+        return True
+    for field in VECTOR_FILTER_FIELDS:
+        values = filters.get(field)
+        if values:
+            value = metadata.get(field)
+            present = {str(v).lower() for v in (value if isinstance(value, list) else [value]) if v is not None}
+            if not present & {v.lower() for v in values}:
+                return False
+    uploaded_at = metadata.get("uploaded_at")
+    if filters.get("uploaded_after") is not None and (uploaded_at is None or uploaded_at < filters["uploaded_after"]):
+        return False
+    if filters.get("uploaded_before") is not None and (uploaded_at is None or uploaded_at > filters["uploaded_before"]):
+        return False
+    return True
+
+
+def filter_key(filters: Optional[dict]) -> tuple:
+    """Hashable form of a filter dict, for cache and coalescing keys"""
+    if not filters:
+        return ()
+    return tuple(sorted((field, tuple(value) if isinstance(value, list) else value) for field, value in filters.items()))
+
+
+def encode_cursor(sort: str, descending: bool, after: list) -> str:
+    """Opaque pagination cursor: the sort order and the sort key of the last item returned"""
+    raw = json.dumps([sort, descending, after], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, bool, list]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort, descending, after = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Malformed cursor: {cursor}") from e
+    if sort not in SORT_KEYS or not isinstance(after, list):
+        raise ValueError(f"Malformed cursor: {cursor}")
+    return sort, bool(descending), after
+
+
+class Corpus:
+    """Uploaded documents addressed by integer doc ID, with per-field bitmap indexes.
+
+    A document's ID is its position in `documents`. Field indexes map each value to
+    a Bitmap of the IDs carrying it, so adding a document is O(1). Upload times only
+    ever increase, so ID order is upload order and a date range is a contiguous ID
+    range. A (size, doc ID) index and aggregate counts are kept up to date on every
+    change, so listings never walk the whole corpus.
+
+    Deleting only sets a tombstone bit, which every lookup masks out, so it never waits
+    on or invalidates a running query. `compact` later releases the deleted documents'
+    content and index bits a batch at a time; doc IDs are never reused.
+    """
+
+    def __init__(self):
+        self.documents: List[dict] = []
+        self.uploaded_at: List[float] = []
+        self.version = 0
+        self._field_bitmaps: Dict[str, Dict[str, Bitmap]] = {field: {} for field in INDEXED_FIELDS}
+        self._by_size: List[Tuple[int, int]] = []
+        self.type_counts: Counter = Counter()
+        self.tag_counts: Counter = Counter()
+        self.total_size = 0
+        self._deleted = Bitmap()
+        self.deleted_count = 0
+        # Deleted documents whose content and index bits are still held
+        self.tombstones: List[int] = []
+        # Coarse retrieval index: ingest-time top keyword -> IDs of the documents it summarizes
+        self._keyword_postings: Dict[str, List[int]] = {}
+        # Email lookups for de-duplication and threading: Message-ID -> live doc ID,
+        # normalized subject -> thread of the first email indexed with it
+        self._message_ids: Dict[str, int] = {}
+        self._subject_threads: Dict[str, str] = {}
+        # Every word of every document, for expanding misspelled question terms
+        self.vocabulary = TrigramIndex()
+
+    def __len__(self):
+        return len(self.documents) - self.deleted_count
+
+    def is_live(self, doc_id: int) -> bool:
+        return 0 <= doc_id < len(self.documents) and doc_id not in self._deleted
+
+    def get(self, doc_id: int) -> Optional[dict]:
+        return self.documents[doc_id] if self.is_live(doc_id) else None
+
+    @staticmethod
+    def _field_values(doc: dict, field: str) -> List[str]:
+        value = doc.get(field)
+        values = value if isinstance(value, list) else [value]
+        return [str(v).lower() for v in values if v not in (None, "")]
+
+    def add(self, doc: dict) -> int:
+        doc_id = len(self.documents)
+        uploaded_at = max(doc.get("uploaded_at") or time.time(), self.uploaded_at[-1] if self.uploaded_at else 0.0)
+        doc["doc_id"] = doc_id
+        doc["uploaded_at"] = uploaded_at
+        doc.setdefault("tags", [])
+        self.documents.append(doc)
+        self.uploaded_at.append(uploaded_at)
+
+        for field in INDEXED_FIELDS:
+            for value in self._field_values(doc, field):
+                self._field_bitmaps[field].setdefault(value, Bitmap()).add(doc_id)
+        for keyword in doc.get("keywords") or ():
+            self._keyword_postings.setdefault(keyword, []).append(doc_id)
+        self._index_message(doc)
+        self.vocabulary.add(vocabulary_words(doc.get("content", "")))
+        bisect.insort(self._by_size, (doc.get("size", 0), doc_id))
+        self.type_counts[doc.get("file_type")] += 1
+        self.tag_counts.update(doc["tags"])
+        self.total_size += doc.get("size", 0)
+        self.version += 1
+        return doc_id
+
+    def clear(self):
+        self.documents = []
+        self.uploaded_at = []
+        self._field_bitmaps = {field: {} for field in INDEXED_FIELDS}
+        self._by_size = []
+        self.type_counts = Counter()
+        self.tag_counts = Counter()
+        self.total_size = 0
+        self._deleted = Bitmap()
+        self.deleted_count = 0
+        self.tombstones = []
+        self._keyword_postings = {}
+        self._message_ids = {}
+        self._subject_threads = {}
+        self.vocabulary = TrigramIndex()
+        self.version += 1
+
+    def _index_message(self, doc: dict):
+        if doc.get("message_id"):
+            self._message_ids[doc["message_id"]] = doc["doc_id"]
+            self._subject_threads.setdefault(normalize_subject(doc["filename"]), doc["thread_id"])
+
+    def message_thread(self, message_id: str) -> Optional[str]:
+        """Thread of the live email with this Message-ID, or None if it is not indexed"""
+        doc_id = self._message_ids.get(message_id)
+        return None if doc_id is None else self.documents[doc_id]["thread_id"]
+
+    def subject_thread(self, subject: str) -> Optional[str]:
+        """Thread of the first email indexed with this normalized subject"""
+        return self._subject_threads.get(subject)
+
+    def delete(self, doc_ids) -> List[dict]:
+        """Tombstone documents; they disappear from lookups at once and are reclaimed by `compact`"""
+        deleted = []
+        for doc_id in doc_ids:
+            if not self.is_live(doc_id):
+                continue
+            doc = self.documents[doc_id]
+            self._deleted.add(doc_id)
+            self.tombstones.append(doc_id)
+
+            key = (doc.get("size", 0), doc_id)
+            position = bisect.bisect_left(self._by_size, key)
+            if position < len(self._by_size) and self._by_size[position] == key:
+                del self._by_size[position]
+            self.type_counts[doc.get("file_type")] -= 1
+            self.tag_counts.subtract(doc["tags"])
+            self.type_counts += Counter()
+            self.tag_counts += Counter()
+            self.total_size -= doc.get("size", 0)
+            # A deleted message may be uploaded again
+            if self._message_ids.get(doc.get("message_id")) == doc_id:
+                del self._message_ids[doc["message_id"]]
+            deleted.append(doc)
+        if deleted:
+            self.deleted_count += len(deleted)
+            self.version += 1
+        return deleted
+
+    def needs_compaction(self, ratio: float) -> bool:
+        return bool(self.tombstones) and len(self.tombstones) >= ratio * max(len(self), 1)
+
+    def purge(self, limit: int) -> int:
+        """Reclaim up to `limit` tombstoned documents; returns how many are still pending"""
+        for doc_id in self.tombstones[:limit]:
+            doc = self.documents[doc_id]
+            for field in INDEXED_FIELDS:
+                bitmaps = self._field_bitmaps[field]
+                for value in self._field_values(doc, field):
+                    bitmap = bitmaps.get(value)
+                    if bitmap is None:
+                        continue
+                    bitmap.discard(doc_id)
+                    if not bitmap:
+                        del bitmaps[value]
+            for keyword in doc.get("keywords") or ():
+                postings = self._keyword_postings.get(keyword)
+                if postings and doc_id in postings:
+                    postings.remove(doc_id)
+                    if not postings:
+                        del self._keyword_postings[keyword]
+            # The slot keeps the doc ID reserved; the tombstone bit keeps it out of every lookup
+            self.documents[doc_id] = None
+        del self.tombstones[:limit]
+        return len(self.tombstones)
+
+    async def compact(self, batch_size: int = 256):
+        """Purge all pending tombstones, yielding to the event loop between batches"""
+        while self.purge(batch_size):
+            await asyncio.sleep(0)
+
+    def stats(self) -> dict:
+        """Aggregate counts, maintained incrementally rather than computed per call"""
+        return {
+            "total_documents": len(self),
+            "total_size": self.total_size,
+            "by_type": dict(self.type_counts),
+            "by_tag": dict(self.tag_counts),
+        }
+
+    def field_values(self, field: str) -> List[str]:
+        return sorted(self._field_bitmaps[field])
+
+    def filter_bitmap(self, filters: Optional[dict]) -> Optional[int]:
+        """Bitmap of the live doc IDs matching `filters`, or None when every document matches"""
+        if not filters and not self.deleted_count:
+            return None
+        result = (1 << len(self.documents)) - 1
+        if self.deleted_count:
+            result &= ~int(self._deleted)
+        filters = filters or {}
+        for field in INDEXED_FIELDS:
+            values = filters.get(field)
+            if values:
+                mask = 0
+                for value in values:
+                    bitmap = self._field_bitmaps[field].get(value.lower())
+                    if bitmap:
+                        mask |= int(bitmap)
+                result &= mask
+        after = filters.get("uploaded_after")
+        before = filters.get("uploaded_before")
+        if after is not None or before is not None:
+            low = bisect.bisect_left(self.uploaded_at, after) if after is not None else 0
+            high = bisect.bisect_right(self.uploaded_at, before) if before is not None else len(self.uploaded_at)
+            result &= ((1 << max(high, low)) - 1) ^ ((1 << low) - 1)
+        return result
+
+    def keyword_candidates(self, terms, fanout: int, allowed: Optional[set] = None) -> List[int]:
+        """Stage one of two-stage retrieval: the `fanout` documents whose keywords best cover `terms`.
+
+        Each matching keyword adds its inverse document frequency, so rare terms count
+        for more. Returns live doc IDs (restricted to `allowed` if given) in ID order.
+        """
+        scores = {}
+        total = max(len(self.documents), 1)
+        for term in set(terms):
+            postings = self._keyword_postings.get(term)
+            if not postings:
+                continue
+            weight = math.log(1 + total / len(postings))
+            for doc_id in postings:
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+        if allowed is not None:
+            eligible = ((doc_id, score) for doc_id, score in scores.items() if doc_id in allowed)
+        elif self.deleted_count:
+            eligible = ((doc_id, score) for doc_id, score in scores.items() if doc_id not in self._deleted)
+        else:
+            eligible = scores.items()
+        best = heapq.nlargest(fanout, eligible, key=lambda item: (item[1], -item[0]))
+        return sorted(doc_id for doc_id, _ in best)
+
+    def filter_ids(self, filters: Optional[dict]) -> Optional[List[int]]:
+        """Live doc IDs matching `filters` in ID order, or None when every document matches"""
+        bitmap = self.filter_bitmap(filters)
+        return None if bitmap is None else list(iter_bits(bitmap))
+
+    def iter_sorted(self, sort: str = "uploaded_at", descending: bool = False, after: list = None,
+                    filters: Optional[dict] = None) -> Iterator[dict]:
+        """Documents in `sort` order, resuming after the sort key `after`, restricted by `filters`.
+
+        Upload order is doc ID order, so it needs no index; size order walks the (size, ID) index.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unsupported sort: {sort}")
+        bitmap = self.filter_bitmap(filters)
+        if sort == "uploaded_at":
+            # Filtered listings walk the (already ID-sorted) matching IDs instead of every document
+            ids = list(iter_bits(bitmap)) if bitmap is not None else range(len(self.documents))
+            if after is None:
+                start = len(ids) - 1 if descending else 0
+            else:
+                start = bisect.bisect_left(ids, after[0]) - 1 if descending else bisect.bisect_right(ids, after[0])
+            positions = range(start, -1, -1) if descending else range(start, len(ids))
+            for position in positions:
+                doc = self.documents[ids[position]]
+                if doc is not None:
+                    yield doc
+        else:
+            allowed = set(iter_bits(bitmap)) if bitmap is not None else None
+            index = self._by_size
+            if after is None:
+                start = len(index) - 1 if descending else 0
+            else:
+                key = tuple(after)
+                start = bisect.bisect_left(index, key) - 1 if descending else bisect.bisect_right(index, key)
+            positions = range(start, -1, -1) if descending else range(start, len(index))
+            for position in positions:
+                doc_id = index[position][1]
+                if allowed is None or doc_id in allowed:
+                    doc = self.documents[doc_id]
+                    if doc is not None:
+                        yield doc
+
+    @staticmethod
+    def sort_key(doc: dict, sort: str) -> list:
+        return [doc["doc_id"]] if sort == "uploaded_at" else [doc.get("size", 0), doc["doc_id"]]
+
+    def page(self, limit: int, sort: str = "uploaded_at", descending: bool = False, cursor: str = None,
+             filters: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+        """One page of documents and the cursor for the next one (None on the last page)"""
+        if limit <= 0:
+            return [], None
+        after = None
+        if cursor:
+            sort, descending, after = decode_cursor(cursor)
+        docs = []
+        for doc in self.iter_sorted(sort, descending, after, filters):
+            if len(docs) == limit:
+                return docs, encode_cursor(sort, descending, self.sort_key(docs[-1], sort))
+            docs.append(doc)
+        return docs, None
+
+    def snapshot_sections(self) -> Dict[str, bytes]:
+        """Serialize the corpus and its indexes as named binary sections (see services.snapshot).
+
+        Text, upload times, bitmaps and the size index are stored raw so loading is
+        mostly slicing; per-document metadata is one JSON array.
+        """
+        content = bytearray()
+        entries = []
+        for doc in self.documents:
+            if doc is None:
+                entries.append(None)
+                continue
+            encoded = doc["content"].encode("utf-8")
+            entry = {key: value for key, value in doc.items() if key != "content"}
+            entry["content_span"] = [len(content), len(encoded)]
+            entries.append(entry)
+            content += encoded
+
+        bitmap_data = bytearray()
+        bitmap_index = {}
+        for field, bitmaps in self._field_bitmaps.items():
+            bitmap_index[field] = {}
+            for value, bitmap in bitmaps.items():
+                bitmap_index[field][value] = [len(bitmap_data), len(bitmap.data), bitmap.first_byte]
+                bitmap_data += bitmap.data
+
+        state = {
+            "version": self.version,
+            "deleted_count": self.deleted_count,
+            "tombstones": self.tombstones,
+            "deleted_first_byte": self._deleted.first_byte,
+            "total_size": self.total_size,
+            "type_counts": dict(self.type_counts),
+            "tag_counts": dict(self.tag_counts),
+            "field_bitmaps": bitmap_index,
+        }
+        return {
+            "state": json.dumps(state).encode(),
+            "documents": json.dumps(entries, separators=(",", ":")).encode(),
+            "content": bytes(content),
+            "uploaded_at": array.array("d", self.uploaded_at).tobytes(),
+            "by_size": array.array("q", [number for pair in self._by_size for number in pair]).tobytes(),
+            "deleted": bytes(self._deleted.data),
+            "field_bitmaps": bytes(bitmap_data),
+            "vocabulary": "\n".join(self.vocabulary.words).encode("utf-8"),
+        }
+
+    @classmethod
+    def from_snapshot_sections(cls, sections: Dict[str, memoryview]) -> "Corpus":
+        corpus = cls()
+        state = json.loads(bytes(sections["state"]))
+        content = sections["content"]
+        for entry in json.loads(bytes(sections["documents"])):
+            if entry is not None:
+                start, length = entry.pop("content_span")
+                entry["content"] = str(content[start:start + length], "utf-8")
+                # JSON turns the chunk location tuples into lists
+                for chunk in entry.get("chunks") or ():
+                    for key in ("slide", "page", "paragraph"):
+                        if key in chunk:
+                            chunk[key] = tuple(chunk[key])
+            corpus.documents.append(entry)
+
+        # Numeric sections are viewed in place as typed arrays rather than parsed
+        corpus.uploaded_at = sections["uploaded_at"].cast("d").tolist()
+        by_size = sections["by_size"].cast("q").tolist()
+        corpus._by_size = list(zip(by_size[0::2], by_size[1::2]))
+        corpus._deleted = Bitmap(state["deleted_first_byte"], sections["deleted"])
+        bitmap_data = sections["field_bitmaps"]
+        for field, bitmaps in state["field_bitmaps"].items():
+            corpus._field_bitmaps[field] = {value: Bitmap(first_byte, bitmap_data[start:start + length])
+                                            for value, (start, length, first_byte) in bitmaps.items()}
+        corpus.version = state["version"]
+        corpus.deleted_count = state["deleted_count"]
+        corpus.tombstones = state["tombstones"]
+        corpus.total_size = state["total_size"]
+        corpus.type_counts = Counter(state["type_counts"])
+        corpus.tag_counts = Counter(state["tag_counts"])
+        # Keyword postings are derived from the documents' own keyword lists
+        for doc in corpus.documents:
+            for keyword in (doc or {}).get("keywords") or ():
+                corpus._keyword_postings.setdefault(keyword, []).append(doc["doc_id"])
+            # So are the email lookups, for the messages still live
+            if doc is not None and doc["doc_id"] not in corpus._deleted:
+                corpus._index_message(doc)
+        vocabulary = sections.get("vocabulary")
+        if vocabulary is not None:
+            words = str(vocabulary, "utf-8")
+            corpus.vocabulary.add(words.split("\n") if words else ())
+        else:
+            # Snapshots written before the vocabulary was kept: rebuild it from the text
+            for doc in corpus.documents:
+                if doc is not None:
+                    corpus.vocabulary.add(vocabulary_words(doc["content"]))
+        return corpus
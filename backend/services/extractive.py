@@ -0,0 +1,75 @@
+"""Extractive answers: the retrieved sentences that answer a lookup question on their own.
+
+Questions like "what is the VPN server address" are answered by one sentence of one
+document. `extract_answer` scores every sentence of the retrieved documents by the
+share of the question's terms it contains; when the best sentence covers at least
+`min_confidence` of them, the top sentences are returned with citations and the LLM
+call is skipped. Anything less certain (or an explanation question) returns None and
+goes to the LLM as before.
+"""
+import re
+from typing import List, Optional
+
+from services.chunking import describe_location, sentence_spans
+
+# Sentences longer than this are paragraphs without punctuation, not quotable answers
+MAX_SENTENCE_CHARS = 600
+# Questions asking for reasoning or a summary need the LLM even when a sentence matches
+_EXPLANATION = re.compile(r"^\s*(why|explain|describe|summari[sz]e|compare|what are the differences?)\b", re.I)
+
+
+def _location(doc: dict, offset: int) -> str:
+    for chunk in doc.get("chunks") or ():
+        if chunk["start"] <= offset < chunk["end"]:
+            return describe_location(chunk)
+    return ""
+
+
+def extract_answer(question: str, question_words: List[str], docs: List[dict], min_confidence: float,
+                   min_terms: int = 2, max_sentences: int = 2) -> Optional[dict]:
+    """The best-matching sentences with citations, or None if the match is not confident enough.
+
+    Confidence is the fraction of the question's distinct terms found in the best
+    sentence; up to `max_sentences` sentences at or above `min_confidence` are quoted,
+    best first.
+    """
+    terms = list(dict.fromkeys(question_words))
+    if len(terms) < min_terms or not docs or _EXPLANATION.match(question):
+        return None
+
+    scored = []
+    for rank, doc in enumerate(docs):
+        content = doc["content"]
+        content_lower = content.lower()
+        for start, end in sentence_spans(content):
+            if end - start > MAX_SENTENCE_CHARS:
+                continue
+            sentence = content_lower[start:end]
+            matched = sum(1 for term in terms if term in sentence)
+            if matched:
+                # Ties go to the higher-ranked document, then the shorter (denser) sentence
+                scored.append((-matched, rank, end - start, start, end))
+    if not scored:
+        return None
+    scored.sort()
+    confidence = -scored[0][0] / len(terms)
+    if confidence < min_confidence:
+        return None
+
+    citations = []
+    for negative_matched, rank, _, start, end in scored[:max_sentences]:
+        if -negative_matched / len(terms) < min_confidence:
+            break
+        doc = docs[rank]
+        citations.append({
+            "doc_id": doc["doc_id"],
+            "filename": doc["filename"],
+            "location": _location(doc, start),
+            "start": start,
+            "end": end,
+            "text": " ".join(doc["content"][start:end].split()),
+        })
+    answer = " ".join(f"{citation['text']} [{number}]" for number, citation in enumerate(citations, start=1))
+    notes = [f"[{number}] {citation['filename']}" + (f", {citation['location']}" if citation["location"] else "")
+             for number, citation in enumerate(citations, start=1)]
+    return {"answer": f"{answer}\n\n" + "\n".join(notes), "confidence": round(confidence, 3), "citations": citations}
@@ -0,0 +1,274 @@
+"""Text extraction for legacy binary Word (.doc) and PowerPoint (.ppt) files.
+
+Both formats are OLE compound files (MS-CFB). The reader below follows sector
+chains on demand, so text is streamed out of the relevant streams without
+rebuilding them in memory: Word text comes from the piece table in the
+0Table/1Table stream (MS-DOC), PowerPoint text from the TextCharsAtom and
+TextBytesAtom records of the "PowerPoint Document" stream (MS-PPT). Every offset
+and chain is checked against the file, so truncated or corrupt input raises
+CompoundFileError.
+"""
+import re
+import struct
+from typing import Dict, Iterator, List, Optional
+
+OLE_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+# Sector ids above this are markers (free, end of chain, FAT/DIFAT sector)
+MAX_REGULAR_SECTOR = 0xFFFFFFFA
+
+STREAM_OBJECT = 2
+
+
+class CompoundFileError(ValueError):
+    pass
+
+
+class StreamReader:
+    """File-like view over a sector chain; reads only the sectors it touches"""
+
+    def __init__(self, data: memoryview, sectors: List[int], sector_size: int, size: int, offset_of):
+        self._data = data
+        self._sectors = sectors
+        self._sector_size = sector_size
+        self._offset_of = offset_of
+        self.size = size
+        self.position = 0
+
+    def seek(self, position: int):
+        self.position = max(0, min(position, self.size))
+
+    def skip(self, count: int):
+        self.seek(self.position + count)
+
+    def read(self, count: int = -1) -> bytes:
+        if count < 0 or self.position + count > self.size:
+            count = self.size - self.position
+        parts = []
+        while count > 0:
+            sector_index, within = divmod(self.position, self._sector_size)
+            if sector_index >= len(self._sectors):
+                raise CompoundFileError("Stream is shorter than its directory entry")
+            start = self._offset_of(self._sectors[sector_index]) + within
+            length = min(count, self._sector_size - within)
+            parts.append(bytes(self._data[start:start + length]))
+            self.position += length
+            count -= length
+        return b"".join(parts)
+
+
+class CompoundFile:
+    """Minimal MS-CFB reader: directory lookup and streaming access to named streams"""
+
+    def __init__(self, content: bytes):
+        self.data = memoryview(content)
+        if bytes(self.data[:8]) != OLE_SIGNATURE:
+            raise CompoundFileError("Not an OLE compound file")
+        if len(content) < 512:
+            raise CompoundFileError("Truncated compound file")
+        (sector_shift, mini_sector_shift) = struct.unpack_from("<HH", content, 0x1E)
+        if sector_shift not in (9, 12) or mini_sector_shift != 6:
+            raise CompoundFileError("Unsupported sector size")
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_sector_shift
+        (fat_sectors, first_directory_sector, _, self.mini_stream_cutoff, first_minifat_sector,
+         minifat_sectors, first_difat_sector, difat_sectors) = struct.unpack_from("<IIIIIIII", content, 0x2C)
+
+        self.fat = self._read_fat(content, fat_sectors, first_difat_sector, difat_sectors)
+        self.entries = self._read_directory(first_directory_sector)
+        if not self.entries:
+            raise CompoundFileError("Missing root directory entry")
+        root = self.entries[0]
+        self.mini_stream_sectors = self._chain(root["start"])
+        self.minifat = []
+        if minifat_sectors and first_minifat_sector <= MAX_REGULAR_SECTOR:
+            for sector in self._chain(first_minifat_sector):
+                offset = self._sector_offset(sector)
+                self.minifat.extend(struct.unpack_from(f"<{self.sector_size // 4}I", content, offset))
+
+    def _sector_offset(self, sector: int) -> int:
+        offset = (sector + 1) * self.sector_size
+        if offset + self.sector_size > len(self.data):
+            raise CompoundFileError("Truncated compound file")
+        return offset
+
+    def _read_fat(self, content: bytes, fat_sectors: int, first_difat_sector: int, difat_sectors: int) -> List[int]:
+        fat_sector_ids = [s for s in struct.unpack_from("<109I", content, 0x4C) if s <= MAX_REGULAR_SECTOR]
+        sector = first_difat_sector
+        per_sector = self.sector_size // 4
+        # A cyclic DIFAT chain cannot list more sectors than the file has
+        for _ in range(min(difat_sectors, len(content) // self.sector_size)):
+            if sector > MAX_REGULAR_SECTOR:
+                break
+            ids = struct.unpack_from(f"<{per_sector}I", content, self._sector_offset(sector))
+            fat_sector_ids.extend(s for s in ids[:-1] if s <= MAX_REGULAR_SECTOR)
+            sector = ids[-1]
+        fat = []
+        for sector in fat_sector_ids[:fat_sectors]:
+            offset = self._sector_offset(sector)
+            fat.extend(struct.unpack_from(f"<{per_sector}I", content, offset))
+        return fat
+
+    def _chain(self, start: int, table: List[int] = None) -> List[int]:
+        table = self.fat if table is None else table
+        chain = []
+        sector = start
+        while sector <= MAX_REGULAR_SECTOR:
+            if sector >= len(table) or len(chain) > len(table):
+                raise CompoundFileError("Corrupt sector chain")
+            chain.append(sector)
+            sector = table[sector]
+        return chain
+
+    def _read_directory(self, first_sector: int) -> List[dict]:
+        entries = []
+        for sector in self._chain(first_sector):
+            offset = self._sector_offset(sector)
+            for entry_offset in range(offset, offset + self.sector_size, 128):
+                raw = self.data[entry_offset:entry_offset + 128]
+                name_length = struct.unpack_from("<H", raw, 0x40)[0]
+                entries.append({
+                    "name": bytes(raw[:max(0, name_length - 2)]).decode("utf-16-le", "ignore"),
+                    "type": raw[0x42],
+                    "start": struct.unpack_from("<I", raw, 0x74)[0],
+                    # Version 3 files only use the low 32 bits of the size
+                    "size": struct.unpack_from("<Q", raw, 0x78)[0] & (0xFFFFFFFF if self.sector_size == 512 else -1),
+                })
+        return entries
+
+    def open(self, name: str) -> StreamReader:
+        for entry in self.entries:
+            if entry["type"] == STREAM_OBJECT and entry["name"] == name:
+                break
+        else:
+            raise CompoundFileError(f"Stream not found: {name}")
+        if entry["size"] < self.mini_stream_cutoff:
+            # Small streams live in the mini stream, itself stored in the root entry's chain
+            mini_sectors = self._chain(entry["start"], self.minifat)
+            per_sector = self.sector_size // self.mini_sector_size
+
+            def mini_offset(mini_sector: int) -> int:
+                big_index, within = divmod(mini_sector, per_sector)
+                if big_index >= len(self.mini_stream_sectors):
+                    raise CompoundFileError("Mini sector outside the mini stream")
+                return self._sector_offset(self.mini_stream_sectors[big_index]) + within * self.mini_sector_size
+
+            return StreamReader(self.data, mini_sectors, self.mini_sector_size, entry["size"], mini_offset)
+        return StreamReader(self.data, self._chain(entry["start"]), self.sector_size, entry["size"], self._sector_offset)
+
+
+def is_compound_file(content: bytes) -> bool:
+    return content[:8] == OLE_SIGNATURE
+
+
+# Word control characters: paragraph/cell/row marks become line breaks or tabs, field
+# instructions (between 0x13 and 0x14) are dropped and only field results are kept
+_WORD_TRANSLATION = {0x0D: "\n", 0x0B: "\n", 0x0C: "\n", 0x07: "\t", 0x0E: "\n", 0x1E: "-", 0x1F: "", 0xA0: " "}
+_FIELD_INSTRUCTION = re.compile(r"\x13[^\x13\x14\x15]*\x14|\x13[^\x13\x14\x15]*\x15")
+
+
+def _word_pieces(clx: bytes) -> Iterator[tuple]:
+    """(cp_start, cp_end, file_offset, compressed) for each piece in a Clx structure"""
+    position = 0
+    while position + 3 <= len(clx) and clx[position] == 0x01:
+        # Prc: property modifiers, not needed for text
+        position += 3 + struct.unpack_from("<H", clx, position + 1)[0]
+    if position + 5 > len(clx) or clx[position] != 0x02:
+        raise CompoundFileError("Piece table not found")
+    length = struct.unpack_from("<I", clx, position + 1)[0]
+    plc = clx[position + 5:position + 5 + length]
+    if len(plc) < length:
+        raise CompoundFileError("Truncated piece table")
+    count = (len(plc) - 4) // 12
+    cps = struct.unpack_from(f"<{count + 1}I", plc, 0)
+    for i in range(count):
+        fc = struct.unpack_from("<I", plc, 4 * (count + 1) + 8 * i + 2)[0]
+        compressed = bool(fc & 0x40000000)
+        fc &= 0x3FFFFFFF
+        yield cps[i], cps[i + 1], fc // 2 if compressed else fc, compressed
+
+
+def iter_doc_text(content: bytes) -> Iterator[str]:
+    """Yield the text of a Word 97-2003 document piece by piece"""
+    cfb = CompoundFile(content)
+    word = cfb.open("WordDocument")
+    fib = word.read(1024)
+    if len(fib) < 0x22 or struct.unpack_from("<H", fib, 0)[0] != 0xA5EC:
+        raise CompoundFileError("Not a Word 97-2003 document")
+    flags = struct.unpack_from("<H", fib, 0x0A)[0]
+    if flags & 0x0100:
+        raise CompoundFileError("Encrypted Word document")
+    table = cfb.open("1Table" if flags & 0x0200 else "0Table")
+
+    # FibBase (32 bytes), then the variable-length fibRgW, fibRgLw and fibRgFcLcb arrays
+    csw = struct.unpack_from("<H", fib, 32)[0]
+    rg_lw = 34 + csw * 2
+    if rg_lw + 2 > len(fib):
+        raise CompoundFileError("Truncated Word file information block")
+    cslw = struct.unpack_from("<H", fib, rg_lw)[0]
+    rg_fc_lcb = rg_lw + 2 + cslw * 4 + 2
+    if rg_fc_lcb + 34 * 8 > len(fib):
+        raise CompoundFileError("Truncated Word file information block")
+    fc_clx, lcb_clx = struct.unpack_from("<II", fib, rg_fc_lcb + 33 * 8)
+    table.seek(fc_clx)
+    clx = table.read(lcb_clx)
+
+    for cp_start, cp_end, offset, compressed in _word_pieces(clx):
+        characters = cp_end - cp_start
+        word.seek(offset)
+        if compressed:
+            text = word.read(characters).decode("cp1252", "replace")
+        else:
+            text = word.read(characters * 2).decode("utf-16-le", "replace")
+        yield text
+
+
+def extract_text_from_doc(content: bytes) -> str:
+    text = "".join(iter_doc_text(content))
+    text = _FIELD_INSTRUCTION.sub("", text)
+    text = text.translate(_WORD_TRANSLATION)
+    return "".join(ch for ch in text if ch >= " " or ch in "\n\t")
+
+
+# PowerPoint record types carrying slide, notes and outline text
+_PPT_TEXT_CHARS_ATOM = 0x0FA0
+_PPT_TEXT_BYTES_ATOM = 0x0FA8
+# Slide masters only hold template prompts ("Click to edit Master title style")
+_PPT_MAIN_MASTER_CONTAINER = 0x03F8
+
+
+def iter_ppt_text(content: bytes) -> Iterator[str]:
+    """Yield each text atom of a PowerPoint 97-2003 presentation in stream order"""
+    cfb = CompoundFile(content)
+    stream = cfb.open("PowerPoint Document")
+    while stream.position + 8 <= stream.size:
+        version_instance, record_type, length = struct.unpack("<HHI", stream.read(8))
+        if record_type == _PPT_MAIN_MASTER_CONTAINER:
+            stream.skip(length)
+            continue
+        if version_instance & 0x000F == 0x000F:
+            # Container: its children follow immediately, so keep walking
+            continue
+        if record_type == _PPT_TEXT_CHARS_ATOM:
+            text = stream.read(length).decode("utf-16-le", "replace")
+        elif record_type == _PPT_TEXT_BYTES_ATOM:
+            text = stream.read(length).decode("cp1252", "replace")
+        else:
+            stream.skip(length)
+            continue
+        text = text.replace("\r", "\n").replace("\x0b", "\n").strip()
+        if text and text != "*":
+            yield text
+
+
+def extract_text_from_ppt(content: bytes) -> str:
+    return "".join(text + "\n" for text in iter_ppt_text(content))
+
+
+def compound_file_streams(content: bytes) -> Optional[Dict[str, int]]:
+    """Stream names and sizes of an OLE file, or None if it is not one"""
+    try:
+        cfb = CompoundFile(content)
+    except (CompoundFileError, struct.error):
+        return None
+    return {entry["name"]: entry["size"] for entry in cfb.entries if entry["type"] == STREAM_OBJECT}
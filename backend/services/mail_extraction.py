@@ -0,0 +1,225 @@
+"""Streaming extraction for .eml messages and .mbox archives.
+
+`iter_raw_messages` reads an archive line by line from a file object, so only one
+message is held at a time however large the export is. Each message is parsed into
+headers plus a plain-text body with quoted history (">" lines, "On ... wrote:"
+attributions, Outlook "Original Message" blocks) and signatures removed, so a long
+thread is indexed once rather than once per reply. `MailThreader` assigns every
+message to a thread from its References / In-Reply-To headers, falling back to the
+subject for clients that drop them.
+"""
+import email
+import hashlib
+import html
+import itertools
+import re
+from email.errors import HeaderParseError
+from email.header import decode_header, make_header
+from email.policy import compat32
+from email.utils import getaddresses, parsedate_to_datetime
+from typing import BinaryIO, Callable, Iterator, List, Optional
+
+from services.chunking import text_sections
+
+# Header names that mark the start of an RFC 822 message
+_MESSAGE_HEADERS = (b"message-id", b"from", b"to", b"subject", b"date", b"received", b"return-path",
+                    b"mime-version", b"delivered-to", b"reply-to", b"x-mailer")
+_HEADER_LINE = re.compile(rb"^([A-Za-z][A-Za-z0-9-]*):[ \t]")
+_MBOX_SEPARATOR = re.compile(rb"^From \S+ ")
+_MBOXRD_ESCAPE = re.compile(rb"^>+From ")
+
+_REPLY_PREFIX = re.compile(r"^\s*((re|fwd?|aw|wg|sv)(\[\d+\])?\s*:\s*)+", re.I)
+_MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+# Where forwarded or replied-to history starts in clients that do not quote with ">"
+_HISTORY_START = re.compile(r"^(-{2,}\s*(Original|Forwarded) Message\s*-{2,}|_{20,}|From:\s.+\n(Sent|Date):\s)", re.I | re.M)
+_ATTRIBUTION = re.compile(r"^(On\s[^\n]+(\n[^\n]*)?wrote:|.+\s(a écrit|schrieb)\s?:)\s*$", re.M)
+_HTML_BREAK = re.compile(r"<\s*(br|/p|/div|/tr|/li|/h\d)[^>]*>", re.I)
+_HTML_DROP = re.compile(r"<(script|style|head)[^>]*>.*?</\1\s*>", re.I | re.S)
+_HTML_TAG = re.compile(r"<[^>]+>")
+
+
+def detect_mail_type(head: bytes, filename: str = "") -> Optional[str]:
+    """'mbox' for an mbox archive, 'eml' for a single RFC 822 message, from the leading bytes and extension"""
+    extension = filename.lower().rsplit(".", 1)[-1] if "." in filename else ""
+    lines = head.lstrip(b"\r\n").splitlines()
+    if extension == "mbox" or (lines and _MBOX_SEPARATOR.match(lines[0]) and len(lines) > 1 and _HEADER_LINE.match(lines[1])):
+        return "mbox"
+    if extension == "eml":
+        return "eml"
+    # Headers up to the first blank line; at least two well-known ones make it a message
+    known = 0
+    for line in lines:
+        if not line.strip():
+            break
+        match = _HEADER_LINE.match(line)
+        if match:
+            known += match.group(1).lower() in _MESSAGE_HEADERS
+        elif not line[:1].isspace():
+            return None
+    return "eml" if known >= 2 else None
+
+
+def iter_raw_messages(stream: BinaryIO, mail_type: str) -> Iterator[bytes]:
+    """Raw messages of an archive, read incrementally; an .eml file is a single message"""
+    if mail_type != "mbox":
+        yield stream.read()
+        return
+    lines = []
+    previous_blank = True
+    for line in stream:
+        # A separator is a "From " line at the start of the file or after a blank line
+        if previous_blank and _MBOX_SEPARATOR.match(line):
+            if lines:
+                yield b"".join(lines)
+                lines = []
+            previous_blank = False
+            continue
+        if _MBOXRD_ESCAPE.match(line):
+            line = line[1:]
+        lines.append(line)
+        previous_blank = not line.strip()
+    if lines:
+        yield b"".join(lines)
+
+
+def _header(message, name: str) -> str:
+    value = message.get(name)
+    if value is None:
+        return ""
+    try:
+        return str(make_header(decode_header(str(value)))).strip()
+    except (UnicodeError, LookupError, HeaderParseError):
+        return str(value).strip()
+
+
+def _part_text(part) -> str:
+    payload = part.get_payload(decode=True) or b""
+    charset = part.get_content_charset() or "utf-8"
+    try:
+        return payload.decode(charset, errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
+
+
+def html_to_text(markup: str) -> str:
+    markup = _HTML_DROP.sub("", markup)
+    markup = _HTML_BREAK.sub("\n", markup)
+    return html.unescape(_HTML_TAG.sub("", markup))
+
+
+def message_body(message) -> str:
+    """The message's plain-text body, from its HTML part if it has no text part; attachments are skipped"""
+    plain = []
+    markup = []
+    for part in message.walk():
+        if part.is_multipart() or part.get_content_disposition() == "attachment":
+            continue
+        content_type = part.get_content_type()
+        if content_type == "text/plain":
+            plain.append(_part_text(part))
+        elif content_type == "text/html":
+            markup.append(_part_text(part))
+    if plain:
+        return "\n\n".join(plain)
+    return "\n\n".join(html_to_text(text) for text in markup)
+
+
+def strip_quoted(body: str) -> str:
+    """The new text of a message: quoted replies, forwarded history and the signature are removed"""
+    body = body.replace("\r\n", "\n")
+    history = _HISTORY_START.search(body)
+    if history:
+        body = body[:history.start()]
+    signature = re.search(r"^-- ?$", body, re.M)
+    if signature:
+        body = body[:signature.start()]
+    body = _ATTRIBUTION.sub("", body)
+    lines = [line for line in body.split("\n") if not line.lstrip().startswith(">")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def normalize_subject(subject: str) -> str:
+    return _REPLY_PREFIX.sub("", subject).strip().lower()
+
+
+def parse_message(raw: bytes, strip_quotes: bool = True) -> Optional[dict]:
+    """Headers and body of one raw message, or None if it cannot be parsed"""
+    try:
+        message = email.message_from_bytes(raw, policy=compat32)
+        body = message_body(message)
+    except Exception:
+        return None
+    subject = _header(message, "Subject")
+    sender = _header(message, "From")
+    date = _header(message, "Date")
+    try:
+        sent_at = parsedate_to_datetime(date).timestamp() if date else None
+    except (TypeError, ValueError, IndexError):
+        sent_at = None
+    stripped = strip_quoted(body) if strip_quotes else body.strip()
+    message_id = next(iter(_MESSAGE_ID.findall(_header(message, "Message-ID"))), None)
+    if message_id is None:
+        # Without a Message-ID the same message uploaded twice still hashes the same
+        digest = hashlib.sha1("\0".join((sender, date, subject, body)).encode("utf-8", "replace")).hexdigest()
+        message_id = f"<{digest}@generated>"
+    return {
+        "message_id": message_id,
+        "in_reply_to": next(iter(_MESSAGE_ID.findall(_header(message, "In-Reply-To"))), None),
+        "references": _MESSAGE_ID.findall(_header(message, "References")),
+        "subject": subject,
+        "from": sender,
+        "to": [address for _, address in getaddresses([_header(message, "To"), _header(message, "Cc")]) if address],
+        "date": date,
+        "sent_at": sent_at,
+        "body": stripped,
+        "quoted_characters": len(body) - len(stripped),
+    }
+
+
+def parse_messages(raw_messages: Iterator[bytes], limit: int, strip_quotes: bool = True) -> List[Optional[dict]]:
+    """Parse up to `limit` more messages from the iterator (run in a worker thread, a batch at a time)"""
+    return [parse_message(raw, strip_quotes) for raw in itertools.islice(raw_messages, limit)]
+
+
+def mail_sections(message: dict) -> List[dict]:
+    """A header section (subject, sender, recipients, date) followed by the body's paragraphs"""
+    header = [f"Subject: {message['subject']}", f"From: {message['from']}"]
+    if message["to"]:
+        header.append(f"To: {', '.join(message['to'])}")
+    if message["date"]:
+        header.append(f"Date: {message['date']}")
+    return [{"kind": "header", "text": "\n".join(header)}, *text_sections(message["body"])]
+
+
+class MailThreader:
+    """Assigns messages to threads, identified by the Message-ID of the thread's first message.
+
+    `known_thread` and `subject_thread` look up messages indexed before this threader
+    was created (by Message-ID and by normalized subject), so it needs no seeding.
+    """
+
+    def __init__(self, known_thread: Callable[[str], Optional[str]] = None,
+                 subject_thread: Callable[[str], Optional[str]] = None):
+        self.threads = {}
+        self._subjects = {}
+        self._known_thread = known_thread or (lambda message_id: None)
+        self._subject_thread = subject_thread or (lambda subject: None)
+
+    def add_known(self, message_id: str, thread_id: str, subject: str = ""):
+        """Register an already indexed message, so new replies join its thread"""
+        self.threads[message_id] = thread_id
+        if subject:
+            self._subjects.setdefault(normalize_subject(subject), thread_id)
+
+    def thread_of(self, message: dict) -> str:
+        references = [*message["references"], *([message["in_reply_to"]] if message["in_reply_to"] else [])]
+        thread_id = next(filter(None, (self.threads.get(ref) or self._known_thread(ref) for ref in references)), None)
+        if thread_id is None and references:
+            # The parent is not indexed (yet); its oldest reference is the root every reply shares
+            thread_id = references[0]
+        subject = normalize_subject(message["subject"])
+        if thread_id is None and subject and _REPLY_PREFIX.match(message["subject"]):
+            thread_id = self._subjects.get(subject) or self._subject_thread(subject)
+        thread_id = thread_id or message["message_id"]
+        self.add_known(message["message_id"], thread_id, message["subject"])
+        return thread_id
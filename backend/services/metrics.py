@@ -0,0 +1,240 @@
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Latency buckets in seconds, from sub-millisecond lexical lookups up to slow LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    "tkb_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    ["route", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    "tkb_requests_total",
+    "HTTP requests served",
+    ["route", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "tkb_requests_in_flight",
+    "HTTP requests currently being processed",
+)
+STAGE_LATENCY = Histogram(
+    "tkb_stage_duration_seconds",
+    "Time spent in each stage of a request (retrieval, prompt, extractive, llm, serialize, extract, index)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "tkb_llm_time_to_first_token_seconds",
+    "Time from sending a completion request until the first token arrives",
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "tkb_cache_requests_total",
+    "Cache lookups by cache name and outcome",
+    ["cache", "outcome"],
+)
+CORPUS_DOCUMENTS = Gauge(
+    "tkb_corpus_documents",
+    "Documents currently loaded",
+)
+CORPUS_CHARACTERS = Gauge(
+    "tkb_corpus_characters",
+    "Characters of extracted text currently loaded",
+)
+CORPUS_TOMBSTONES = Gauge(
+    "tkb_corpus_tombstones",
+    "Deleted documents whose content has not been reclaimed by compaction yet",
+)
+CORPUS_COMPACTIONS = Counter(
+    "tkb_corpus_compactions_total",
+    "Background compaction runs over deleted documents",
+)
+MAIL_MESSAGES = Counter(
+    "tkb_mail_messages_total",
+    "Messages read from .eml/.mbox uploads, by outcome (indexed, duplicate, empty, malformed)",
+    ["outcome"],
+)
+
+TENANTS_RESIDENT = Gauge(
+    "tkb_tenants_resident",
+    "Tenants whose corpus is currently loaded in memory",
+)
+TENANT_RESIDENT_BYTES = Gauge(
+    "tkb_tenant_resident_bytes",
+    "Characters of extracted text held by resident tenants, against the resident budget",
+)
+TENANT_EVICTIONS = Counter(
+    "tkb_tenant_evictions_total",
+    "Tenant corpora written to disk and dropped from memory, by reason",
+    ["reason"],
+)
+TENANT_LOADS = Counter(
+    "tkb_tenant_loads_total",
+    "Evicted tenant corpora mapped back in on demand",
+)
+
+LLM_QUEUE_WAIT = Histogram(
+    "tkb_llm_queue_wait_seconds",
+    "Time completions spend queued behind the client-side rate limiter",
+    buckets=LATENCY_BUCKETS,
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "tkb_llm_queue_depth",
+    "Completions waiting for rate limiter capacity",
+)
+LLM_RATE_SCALE = Gauge(
+    "tkb_llm_rate_scale",
+    "Fraction of the configured TPM/RPM quota the limiter currently allows (drops after 429s)",
+)
+LLM_RETRIES = Counter(
+    "tkb_llm_retries_total",
+    "Provider calls retried, by reason",
+    ["reason"],
+)
+LLM_SHED = Counter(
+    "tkb_llm_shed_total",
+    "Completions rejected with 503 because the queue exceeded its latency SLO",
+)
+
+BATCH_SIZE = Histogram(
+    "tkb_batch_size",
+    "Items processed per micro-batch",
+    ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+BATCH_WAIT = Histogram(
+    "tkb_batch_wait_seconds",
+    "Time an item waits for its micro-batch to be dispatched",
+    ["batcher"],
+    buckets=LATENCY_BUCKETS,
+)
+BATCH_WINDOW = Gauge(
+    "tkb_batch_window_seconds",
+    "Configured collection window of each micro-batcher",
+    ["batcher"],
+)
+BATCH_MAX_SIZE = Gauge(
+    "tkb_batch_max_size",
+    "Configured maximum batch size of each micro-batcher",
+    ["batcher"],
+)
+
+CONTEXT_COMPRESSION_RATIO = Histogram(
+    "tkb_context_compression_ratio",
+    "Prompt context tokens kept by compression, as a fraction of the retrieved context",
+    buckets=(0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0),
+)
+CONTEXT_TOKENS = Counter(
+    "tkb_context_tokens_total",
+    "Estimated context tokens, retrieved and sent in prompts after compression",
+    ["stage"],
+)
+
+FUZZY_TERMS = Counter(
+    "tkb_fuzzy_terms_total",
+    "Question terms missing from the corpus vocabulary, by whether near spellings were found",
+    ["outcome"],
+)
+
+CHAT_ANSWERS = Counter(
+    "tkb_chat_answers_total",
+    "Chat answers by how they were produced: extractive (fast path, no LLM call) or llm",
+    ["mode"],
+)
+CHAT_DISCONNECTS = Counter(
+    "tkb_chat_disconnects_total",
+    "Chat requests whose client went away before the answer started; their work was cancelled",
+)
+EXTRACTIVE_FRACTION = Gauge(
+    "tkb_chat_extractive_fraction",
+    "Fraction of chat answers since start served by the extractive fast path",
+)
+
+QUERY_LOG_ENTRIES = Counter(
+    "tkb_query_log_entries_total",
+    "Query log entries, by outcome (written, or dropped when the writer fell behind or failed)",
+    ["outcome"],
+)
+WARMUP_QUESTIONS = Gauge(
+    "tkb_warmup_questions",
+    "Frequent questions from the query log retrieved into the cache at startup",
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "tkb_event_loop_lag_seconds",
+    "How late the lag monitor's heartbeat ran, i.e. time the event loop was busy elsewhere",
+    buckets=LATENCY_BUCKETS,
+)
+EVENT_LOOP_STALLS = Counter(
+    "tkb_event_loop_stalls_total",
+    "Times the event loop was blocked past the lag monitor's threshold",
+)
+
+# Per-request stage timings, set up by the HTTP middleware and filled in by span()
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def request_scope():
+    """Collect the stage timings recorded while handling one request"""
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def record_stage(stage: str, seconds: float):
+    """Record time spent in a stage, globally and for the current request"""
+    STAGE_LATENCY.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block as one stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_context(compression: Optional[dict]):
+    """Record the context compression of a prompt once its completion has been issued"""
+    if compression is None:
+        return
+    CONTEXT_COMPRESSION_RATIO.observe(compression["ratio"])
+    CONTEXT_TOKENS.labels("retrieved").inc(compression["original_tokens"])
+    CONTEXT_TOKENS.labels("sent").inc(compression["compressed_tokens"])
+
+
+_answer_counts = {"extractive": 0, "llm": 0}
+
+
+def record_answer(mode: str):
+    CHAT_ANSWERS.labels(mode).inc()
+    _answer_counts[mode] += 1
+    EXTRACTIVE_FRACTION.set(_answer_counts["extractive"] / sum(_answer_counts.values()))
+
+
+def server_timing_header(timings: dict) -> str:
+    """Format stage timings as a Server-Timing header value (milliseconds)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
+
+
+def render_metrics():
+    """Return the Prometheus exposition body and its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
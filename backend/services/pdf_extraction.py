@@ -0,0 +1,267 @@
+"""Page-level PDF text extraction with pluggable backends.
+
+Backends, fastest first: pypdfium2 and PyMuPDF when installed, PyPDF2 always.
+Large documents are split into page ranges extracted in parallel worker
+processes, pages whose content was seen before are served from a cache keyed by
+a content hash, and a page that fails to extract is skipped on its own instead
+of failing the whole file. Pages are hashed by the workers that extract them, so
+the calling process only counts the pages.
+"""
+import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import FrozenSet, List, Optional, Tuple
+
+import PyPDF2
+from PyPDF2.generic import ArrayObject
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+
+def _extract_pypdfium2(data: bytes, pages: List[int]) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    results = []
+    pdf = pypdfium2.PdfDocument(data)
+    try:
+        for index in pages:
+            try:
+                textpage = pdf[index].get_textpage()
+                results.append((index, textpage.get_text_range(), None))
+                textpage.close()
+            except Exception as e:
+                results.append((index, None, str(e)))
+    finally:
+        pdf.close()
+    return results
+
+
+def _extract_pymupdf(data: bytes, pages: List[int]) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    results = []
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        for index in pages:
+            try:
+                results.append((index, pdf[index].get_text(), None))
+            except Exception as e:
+                results.append((index, None, str(e)))
+    return results
+
+
+def _extract_pypdf2(data: bytes, pages: List[int]) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    results = []
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    for index in pages:
+        try:
+            results.append((index, reader.pages[index].extract_text(), None))
+        except Exception as e:
+            results.append((index, None, str(e)))
+    return results
+
+
+BACKENDS = {
+    "pypdfium2": _extract_pypdfium2,
+    "pymupdf": _extract_pymupdf,
+    "pypdf2": _extract_pypdf2,
+}
+
+
+def available_backends() -> List[str]:
+    available = []
+    if pypdfium2 is not None:
+        available.append("pypdfium2")
+    if fitz is not None:
+        available.append("pymupdf")
+    available.append("pypdf2")
+    return available
+
+
+def resolve_backend(name: str = None) -> str:
+    """The configured backend if it is installed, otherwise the fastest one that is"""
+    name = (name or config.PDF_EXTRACTION_BACKEND).lower()
+    available = available_backends()
+    if name in available:
+        return name
+    if name != "auto":
+        logger.warning(f"PDF backend {name} is not installed, using {available[0]}")
+    return available[0]
+
+
+def page_count(backend: str, data: bytes) -> int:
+    """Number of pages, read with the extraction backend so the fast ones never need a PyPDF2 parse"""
+    try:
+        if backend == "pypdfium2":
+            pdf = pypdfium2.PdfDocument(data)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+        if backend == "pymupdf":
+            with fitz.open(stream=data, filetype="pdf") as pdf:
+                return len(pdf)
+    except Exception as e:
+        logger.warning(f"PDF backend {backend} failed ({e}), falling back to PyPDF2")
+    return len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+
+
+def _extract_range(backend: str, data: bytes, pages: List[int]) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    try:
+        return BACKENDS[backend](data, pages)
+    except Exception as e:
+        if backend == "pypdf2":
+            return [(index, None, str(e)) for index in pages]
+        # The document could not even be opened by the fast backend; PyPDF2 is more forgiving
+        logger.warning(f"PDF backend {backend} failed ({e}), falling back to PyPDF2")
+        return _extract_pypdf2(data, pages)
+
+
+def page_fingerprints(data: bytes, pages: List[int]) -> List[Optional[str]]:
+    """Hash each page's content streams together with the fonts they are decoded with.
+
+    The streams are hashed as stored rather than parsed into operators, which is
+    most of the cost of PyPDF2's `get_contents`.
+    """
+    try:
+        reader = PyPDF2.PdfReader(io.BytesIO(data))
+    except Exception:
+        return [None] * len(pages)
+    fingerprints = []
+    for index in pages:
+        try:
+            page = reader.pages[index]
+            digest = hashlib.sha1()
+            contents = page.get("/Contents")
+            contents = contents.get_object() if contents is not None else []
+            for stream in contents if isinstance(contents, ArrayObject) else [contents]:
+                digest.update(stream.get_object().get_data())
+            fonts = page.get("/Resources", {}).get_object().get("/Font", {})
+            for name in sorted(fonts.get_object() if fonts else {}):
+                font = fonts[name].get_object()
+                digest.update(f"{name}:{font.get('/BaseFont')}:{font.get('/Encoding')}".encode())
+                to_unicode = font.get("/ToUnicode")
+                if to_unicode is not None:
+                    digest.update(to_unicode.get_object().get_data())
+            fingerprints.append(digest.hexdigest())
+        except Exception:
+            fingerprints.append(None)
+    return fingerprints
+
+
+def extract_page_range(backend: str, data: bytes, pages: List[int], cached: FrozenSet[str] = frozenset()):
+    """Worker entry point: fingerprint the given pages and extract those whose fingerprint is not in `cached`.
+
+    One (index, fingerprint, text, error) per page; text and error are both None
+    for a page left to the cache.
+    """
+    fingerprints = page_fingerprints(data, pages)
+    wanted = [index for index, fingerprint in zip(pages, fingerprints) if fingerprint is None or fingerprint not in cached]
+    extracted = {index: (text, error) for index, text, error in _extract_range(backend, data, wanted)} if wanted else {}
+    return [(index, fingerprint) + extracted.get(index, (None, None)) for index, fingerprint in zip(pages, fingerprints)]
+
+
+class PageCache:
+    """LRU cache of extracted page text keyed by page fingerprint, shared by concurrent uploads"""
+
+    def __init__(self, max_pages: int):
+        self.max_pages = max_pages
+        self._pages: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fingerprints(self) -> FrozenSet[str]:
+        with self._lock:
+            return frozenset(self._pages)
+
+    def get(self, fingerprint: Optional[str]) -> Optional[str]:
+        with self._lock:
+            if fingerprint is None or fingerprint not in self._pages:
+                return None
+            self._pages.move_to_end(fingerprint)
+            return self._pages[fingerprint]
+
+    def put(self, fingerprint: Optional[str], text: str):
+        if fingerprint is None or self.max_pages <= 0:
+            return
+        with self._lock:
+            self._pages[fingerprint] = text
+            self._pages.move_to_end(fingerprint)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+
+class PDFExtractor:
+    def __init__(self, backend: str = None, workers: int = None, parallel_min_pages: int = None,
+                 cache_pages: int = None):
+        self.backend = resolve_backend(backend)
+        self.workers = config.PDF_EXTRACTION_WORKERS if workers is None else workers
+        self.parallel_min_pages = config.PDF_PARALLEL_MIN_PAGES if parallel_min_pages is None else parallel_min_pages
+        self.cache = PageCache(config.PDF_PAGE_CACHE_SIZE if cache_pages is None else cache_pages)
+        self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _extract(self, data: bytes, pages: List[int], cached: FrozenSet[str]):
+        if self.workers <= 1 or len(pages) < self.parallel_min_pages:
+            return extract_page_range(self.backend, data, pages, cached)
+        # Contiguous ranges keep each worker's page access sequential
+        size = -(-len(pages) // self.workers)
+        ranges = [pages[i:i + size] for i in range(0, len(pages), size)]
+        futures = [self._executor().submit(extract_page_range, self.backend, data, chunk, cached) for chunk in ranges]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def extract_pages(self, data: bytes) -> List[str]:
+        """Text of every page, '' for pages that could not be extracted.
+
+        Blocks until every page is extracted; call it from a worker thread, not the event loop.
+        """
+        texts = [""] * page_count(self.backend, data)
+        pending, cached = list(range(len(texts))), self.cache.fingerprints()
+        failed = 0
+        while pending:
+            evicted = []
+            for index, fingerprint, text, error in self._extract(data, pending, cached):
+                if error is not None:
+                    failed += 1
+                    logger.warning(f"Could not extract PDF page {index + 1}: {error}")
+                    continue
+                if text is None:
+                    text = self.cache.get(fingerprint)
+                    if text is None:
+                        # Evicted by a concurrent upload since the workers checked the cache
+                        evicted.append(index)
+                        continue
+                    metrics.record_cache("pdf_page", True)
+                else:
+                    metrics.record_cache("pdf_page", False)
+                    self.cache.put(fingerprint, text)
+                texts[index] = text
+            pending, cached = evicted, frozenset()
+        if failed:
+            logger.error(f"Failed to extract {failed} of {len(texts)} PDF pages")
+        return texts
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+pdf_extractor = PDFExtractor()
@@ -0,0 +1,126 @@
+"""Append-only query log, written in the background, and the readers built on it.
+
+Each answered question becomes one JSON line: time, tenant, question, filters,
+latency, the doc IDs retrieved and how it was served (computed, coalesced onto an
+identical in-flight question, or a retrieval cache hit). `record` only appends to an
+in-memory buffer; a background task writes the buffer every `flush_interval` seconds
+(or as soon as `max_batch` entries are waiting) with one write call, off the event loop.
+If the writer falls behind by more than `max_pending` entries, new entries are
+dropped and counted rather than queued without bound. A write that would take the
+file past `max_bytes` first rotates it to `PATH.1`, replacing the previous backup;
+readers see the backup and the live file as one log.
+
+The log feeds the startup warm-up (`top_questions`) and the benchmark harness
+(`iter_entries`, `python -m benchmarks.run --query-log PATH`).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from typing import Iterator, List, Optional, Tuple
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryLog:
+    def __init__(self, path: str, flush_interval: float = 1.0, max_batch: int = 512, max_pending: int = 100000,
+                 max_bytes: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._pending: List[dict] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task = None
+
+    def record(self, entry: dict):
+        if len(self._pending) >= self.max_pending:
+            metrics.QUERY_LOG_ENTRIES.labels("dropped").inc()
+            return
+        self._pending.append({"ts": round(time.time(), 3), **entry})
+        if self._wakeup is not None and len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def _append(self, lines: str):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = lines.encode("utf-8")
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+            os.replace(self.path, rotated_path(self.path))
+        with open(self.path, "ab") as f:
+            f.write(data)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        lines = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in batch)
+        try:
+            await asyncio.to_thread(self._append, lines)
+            metrics.QUERY_LOG_ENTRIES.labels("written").inc(len(batch))
+        except OSError as e:
+            metrics.QUERY_LOG_ENTRIES.labels("dropped").inc(len(batch))
+            logger.error(f"Error writing query log {self.path}: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+def rotated_path(path: str) -> str:
+    return path + ".1"
+
+
+def iter_entries(path: str, tail_bytes: int = 0) -> Iterator[dict]:
+    """Entries of a query log and its rotated backup, oldest first; with `tail_bytes`, only those in the last that many bytes"""
+    files = [(name, os.path.getsize(name)) for name in (rotated_path(path), path) if os.path.exists(name)]
+    # Bytes to skip, counted from the start of the backup
+    skip = max(0, sum(size for _, size in files) - tail_bytes) if tail_bytes else 0
+    for name, size in files:
+        if skip >= size:
+            skip -= size
+            continue
+        with open(name, "rb") as f:
+            if skip:
+                f.seek(skip)
+                f.readline()  # skip the partial first line
+                skip = 0
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def top_questions(path: str, limit: int, tail_bytes: int = 0) -> List[Tuple[str, str, dict, int]]:
+    """The most frequent (tenant, question, filters) in the log with their counts, most frequent first"""
+    counts = Counter()
+    examples = {}
+    for entry in iter_entries(path, tail_bytes):
+        key = (entry.get("tenant", ""), entry.get("normalized") or entry["question"], json.dumps(entry.get("filters") or {}, sort_keys=True))
+        counts[key] += 1
+        examples.setdefault(key, entry)
+    return [(key[0], examples[key]["question"], examples[key].get("filters") or {}, count)
+            for key, count in counts.most_common(limit)]
@@ -0,0 +1,215 @@
+"""Tenant-scoped corpora with per-tenant quotas and a shared resident-memory budget.
+
+Every tenant has its own Corpus (with its indexes) and chat sessions. Tenants stay in
+memory while they are used; once resident tenants hold more than `resident_bytes` of
+text, or a tenant has been idle for `idle_seconds`, the least recently used ones are
+written to a snapshot file and dropped. The next request for an evicted tenant reads
+that file back (services.snapshot maps it and decodes its sections into a new
+Corpus), so idle tenants cost disk space only and their data survives restarts.
+Snapshot writes and reads run in worker threads; a tenant requested again while its
+snapshot is still being written is handed back from memory once the write is done.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import config
+from services import metrics, snapshot
+from services.corpus import Corpus
+from services.sessions import SessionStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+
+# Tenant names become file names, so they are kept to a safe alphabet
+_TENANT_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, tenant: str, used: int, quota: int):
+        super().__init__(f"Tenant {tenant} would exceed its quota of {quota} characters ({used} in use)")
+        self.used = used
+        self.quota = quota
+
+
+def valid_tenant_name(name: str) -> bool:
+    return bool(_TENANT_NAME.match(name))
+
+
+def vector_namespace(tenant: str) -> str:
+    """Vector index namespace of a tenant's chunks; the default tenant keeps the unnamed one"""
+    return "" if tenant == DEFAULT_TENANT else tenant
+
+
+def summary_namespace(namespace: str = "") -> str:
+    """Namespace of the document summaries that go with the chunks in `namespace`"""
+    return f"{namespace}-{config.DOCUMENT_SUMMARY_NAMESPACE}" if namespace else config.DOCUMENT_SUMMARY_NAMESPACE
+
+
+def parse_api_keys(value: str) -> Dict[str, str]:
+    """API key -> tenant map from a comma-separated list of key=tenant pairs"""
+    keys = {}
+    for pair in value.split(","):
+        key, _, tenant = pair.strip().partition("=")
+        if key and tenant:
+            keys[key.strip()] = tenant.strip()
+    return keys
+
+
+class Tenant:
+    """One tenant's resident state"""
+
+    def __init__(self, name: str, corpus: Corpus, sessions: SessionStore):
+        self.name = name
+        self.corpus = corpus
+        self.sessions = sessions
+        # Background task reclaiming deleted documents, if one is running
+        self.compaction_task = None
+        # Requests currently using the tenant; it is never evicted from under them
+        self.active = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def resident_bytes(self) -> int:
+        return self.corpus.total_size
+
+    @property
+    def namespace(self) -> str:
+        return vector_namespace(self.name)
+
+
+class TenantRegistry:
+    """Resident tenants in LRU order, plus the snapshot files of evicted ones"""
+
+    def __init__(self, data_dir: str, resident_bytes: int, quota_bytes: int, idle_seconds: float,
+                 make_sessions: Callable[[], SessionStore]):
+        self.data_dir = data_dir
+        self.resident_budget = resident_bytes
+        self.quota_bytes = quota_bytes
+        self.idle_seconds = idle_seconds
+        self.make_sessions = make_sessions
+        self._tenants: "OrderedDict[str, Tenant]" = OrderedDict()
+        # Snapshot writes of evicted tenants still in progress; each task returns its tenant
+        self._writes: Dict[str, asyncio.Task] = {}
+
+    def snapshot_path(self, name: str) -> str:
+        return os.path.join(self.data_dir, f"{name}.tkbsnap")
+
+    async def get(self, name: str) -> Tenant:
+        """The tenant's resident state, loading its snapshot or starting it empty if needed"""
+        tenant = self._tenants.get(name)
+        if tenant is None:
+            writing = self._writes.get(name)
+            if writing is not None:
+                # Evicted moments ago: its corpus may not change until the file is written
+                tenant = await asyncio.shield(writing)
+            else:
+                path = self.snapshot_path(name)
+                if os.path.exists(path):
+                    corpus = await asyncio.to_thread(snapshot.load_corpus, path)
+                    metrics.TENANT_LOADS.inc()
+                else:
+                    corpus = Corpus()
+                tenant = Tenant(name, corpus, self.make_sessions())
+            # A concurrent request may have brought the tenant back while this one waited
+            tenant = self._tenants.setdefault(name, tenant)
+        tenant.last_used = time.monotonic()
+        self._tenants.move_to_end(name)
+        self.enforce(keep=name)
+        return tenant
+
+    async def install(self, name: str, corpus: Corpus) -> Tenant:
+        """Replace a tenant's corpus (snapshot restore); its version moves past the current one"""
+        tenant = await self.get(name)
+        corpus.version = max(corpus.version, tenant.corpus.version) + 1
+        tenant.corpus = corpus
+        return tenant
+
+    def resident(self) -> List[Tenant]:
+        return list(self._tenants.values())
+
+    def resident_bytes(self) -> int:
+        return sum(tenant.resident_bytes for tenant in self._tenants.values())
+
+    def check_quota(self, tenant: Tenant, additional: int):
+        """Raise QuotaExceeded if adding `additional` characters would put the tenant over its quota"""
+        if self.quota_bytes and tenant.resident_bytes + additional > self.quota_bytes:
+            raise QuotaExceeded(tenant.name, tenant.resident_bytes, self.quota_bytes)
+
+    def evict(self, name: str, reason: str = "manual") -> bool:
+        """Drop the tenant from memory, writing it to disk in a worker thread; busy tenants are left alone"""
+        tenant = self._tenants.get(name)
+        if tenant is None or tenant.active or tenant.compaction_task is not None:
+            return False
+        del self._tenants[name]
+        if tenant.corpus.documents or os.path.exists(self.snapshot_path(name)):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                # No event loop to block (scripts and tests): write it now
+                snapshot.save_corpus(tenant.corpus, self.snapshot_path(name), {"tenant": name})
+            else:
+                self._writes[name] = asyncio.ensure_future(self._write(tenant, self._writes.get(name)))
+        metrics.TENANT_EVICTIONS.labels(reason).inc()
+        return True
+
+    async def _write(self, tenant: Tenant, previous: Optional[asyncio.Task]) -> Tenant:
+        """Save an evicted tenant's snapshot after any earlier write of it; a failed write keeps it resident"""
+        if previous is not None:
+            await previous
+        try:
+            await asyncio.to_thread(snapshot.save_corpus, tenant.corpus, self.snapshot_path(tenant.name),
+                                    {"tenant": tenant.name})
+        except Exception as e:
+            logger.error(f"Error writing snapshot of evicted tenant {tenant.name}, keeping it in memory: {e}")
+            self._tenants.setdefault(tenant.name, tenant)
+        finally:
+            if self._writes.get(tenant.name) is asyncio.current_task():
+                del self._writes[tenant.name]
+        return tenant
+
+    async def flush(self):
+        """Wait for pending snapshot writes (call from the app's shutdown hook)"""
+        while self._writes:
+            await asyncio.gather(*self._writes.values())
+
+    def enforce(self, keep: Optional[str] = None) -> List[str]:
+        """Evict idle tenants, then the least recently used until the resident budget is met"""
+        evicted = []
+        now = time.monotonic()
+        for name, tenant in list(self._tenants.items()):
+            if name != keep and self.idle_seconds and now - tenant.last_used > self.idle_seconds:
+                if self.evict(name, "idle"):
+                    evicted.append(name)
+        if self.resident_budget:
+            for name in list(self._tenants):
+                if self.resident_bytes() <= self.resident_budget:
+                    break
+                if name != keep and self.evict(name, "memory"):
+                    evicted.append(name)
+        metrics.TENANTS_RESIDENT.set(len(self._tenants))
+        metrics.TENANT_RESIDENT_BYTES.set(self.resident_bytes())
+        return evicted
+
+    def stats(self) -> List[dict]:
+        """Resident and evicted tenants with their sizes"""
+        now = time.monotonic()
+        entries = [{
+            "tenant": tenant.name,
+            "resident": True,
+            "documents": len(tenant.corpus),
+            "characters": tenant.resident_bytes,
+            "idle_seconds": round(now - tenant.last_used, 1),
+        } for tenant in self._tenants.values()]
+        if os.path.isdir(self.data_dir):
+            for filename in sorted(os.listdir(self.data_dir)):
+                name, extension = os.path.splitext(filename)
+                if extension == ".tkbsnap" and name not in self._tenants:
+                    entries.append({"tenant": name, "resident": False,
+                                    "snapshot_bytes": os.path.getsize(os.path.join(self.data_dir, filename))})
+        return entries
@@ -0,0 +1,92 @@
+"""Character-trigram index over a vocabulary, for typo-tolerant term lookup.
+
+Each word is padded ("$word$") and posted under its trigrams. A misspelled term
+collects the words sharing its trigrams and keeps those of a compatible length that
+share enough of them to be within `max_edits` edits (an edit changes at most three
+of a word's trigrams, a transposition four, so a word within k edits of a term of
+length n shares at least n - 4k); only those are compared with a bounded edit
+distance. Words are added incrementally and never removed: a word whose documents
+were deleted simply matches nothing.
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List
+
+_WORD = re.compile(r"\w+")
+
+
+def trigrams(word: str) -> set:
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def vocabulary_words(text: str, min_length: int = 3, max_length: int = 40) -> set:
+    """The distinct lowercase words of a text worth indexing (no numbers, no very long tokens)"""
+    return {word for word in _WORD.findall(text.lower())
+            if min_length <= len(word) <= max_length and not word.isdigit()}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Edit distance counting an adjacent transposition as one edit; limit + 1 once it exceeds `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before_previous, previous_row = previous_row, row
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before_previous[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+    return row[-1]
+
+
+class TrigramIndex:
+    """Vocabulary words posted under their character trigrams"""
+
+    def __init__(self):
+        self.words: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = {}
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._ids
+
+    def add(self, words: Iterable[str]) -> int:
+        """Index the words not seen before; returns how many were new"""
+        added = 0
+        for word in words:
+            if word in self._ids:
+                continue
+            word_id = self._ids[word] = len(self.words)
+            self.words.append(word)
+            for gram in trigrams(word):
+                self._postings.setdefault(gram, []).append(word_id)
+            added += 1
+        return added
+
+    def near(self, term: str, max_edits: int, limit: int) -> List[str]:
+        """Up to `limit` indexed words within `max_edits` edits of `term`, closest first"""
+        shared = Counter()
+        for gram in trigrams(term):
+            postings = self._postings.get(gram)
+            if postings:
+                shared.update(postings)
+        needed = max(1, len(term) - 4 * max_edits)
+        found = []
+        for word_id, count in shared.items():
+            word = self.words[word_id]
+            if count < needed or abs(len(word) - len(term)) > max_edits or word == term:
+                continue
+            distance = edit_distance(term, word, max_edits)
+            if distance <= max_edits:
+                found.append((distance, -count, word))
+        found.sort()
+        return [word for _, _, word in found[:limit]]
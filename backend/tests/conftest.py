@@ -0,0 +1,101 @@
+"""Builders for small in-memory document fixtures shared by the extraction tests"""
+import struct
+
+from services.legacy_office import OLE_SIGNATURE
+
+SECTOR = 512
+MINI_SECTOR = 64
+MINI_CUTOFF = 4096
+END_OF_CHAIN = 0xFFFFFFFE
+FREE_SECTOR = 0xFFFFFFFF
+FAT_SECTOR = 0xFFFFFFFD
+
+
+def _directory_entry(name: str, entry_type: int, start: int, size: int) -> bytes:
+    encoded = (name + "\0").encode("utf-16-le") if name else b""
+    entry = bytearray(128)
+    entry[:len(encoded)] = encoded
+    struct.pack_into("<HBB", entry, 0x40, len(encoded), entry_type, 1)
+    struct.pack_into("<III", entry, 0x44, FREE_SECTOR, FREE_SECTOR, FREE_SECTOR)
+    struct.pack_into("<IQ", entry, 0x74, start, size)
+    return bytes(entry)
+
+
+def build_compound_file(streams: dict) -> bytes:
+    """A version 3 OLE compound file holding `streams` (name -> bytes).
+
+    Streams under 4096 bytes go to the mini stream, larger ones get their own
+    sector chain; everything has to fit in one FAT sector (127 sectors).
+    """
+    sectors, fat = [], []
+
+    def allocate(data: bytes) -> int:
+        count = -(-len(data) // SECTOR)
+        start = len(sectors)
+        for i in range(count):
+            sectors.append(data[i * SECTOR:(i + 1) * SECTOR].ljust(SECTOR, b"\0"))
+            fat.append(start + i + 1 if i < count - 1 else END_OF_CHAIN)
+        return start if count else END_OF_CHAIN
+
+    mini_stream, minifat, entries = b"", [], []
+    for name, data in streams.items():
+        if len(data) < MINI_CUTOFF:
+            count = -(-len(data) // MINI_SECTOR)
+            start = len(mini_stream) // MINI_SECTOR if count else END_OF_CHAIN
+            mini_stream += data.ljust(count * MINI_SECTOR, b"\0")
+            minifat.extend(start + i + 1 if i < count - 1 else END_OF_CHAIN for i in range(count))
+        else:
+            start = allocate(data)
+        entries.append(_directory_entry(name, 2, start, len(data)))
+
+    root_start = allocate(mini_stream)
+    minifat_start = allocate(struct.pack(f"<{len(minifat)}I", *minifat))
+    directory = [_directory_entry("Root Entry", 5, root_start, len(mini_stream))] + entries
+    directory += [_directory_entry("", 0, FREE_SECTOR, 0)] * (-len(directory) % 4)
+    directory_start = allocate(b"".join(directory))
+    fat_index = len(sectors)
+    fat.append(FAT_SECTOR)
+    assert len(fat) <= SECTOR // 4, "fixture too large for one FAT sector"
+    sectors.append(struct.pack(f"<{SECTOR // 4}I", *(fat + [FREE_SECTOR] * (SECTOR // 4 - len(fat)))))
+
+    header = bytearray(SECTOR)
+    header[:8] = OLE_SIGNATURE
+    struct.pack_into("<HHHHH", header, 0x18, 0x3E, 3, 0xFFFE, 9, 6)
+    struct.pack_into("<IIIIIIII", header, 0x2C, 1, directory_start, 0, MINI_CUTOFF,
+                     minifat_start, -(-len(minifat) * 4 // SECTOR), END_OF_CHAIN, 0)
+    struct.pack_into("<109I", header, 0x4C, fat_index, *[FREE_SECTOR] * 108)
+    return bytes(header) + b"".join(sectors)
+
+
+def build_word_document(pieces, prc: bytes = b"", text_offset: int = 1024) -> bytes:
+    """A .doc whose piece table lists `pieces`, (text, compressed) pairs stored one after another from `text_offset`"""
+    fib = bytearray(text_offset)
+    struct.pack_into("<H", fib, 0, 0xA5EC)
+    struct.pack_into("<H", fib, 0x0A, 0x0200)  # piece table in 1Table
+    struct.pack_into("<H", fib, 32, 14)
+    rg_lw = 34 + 14 * 2
+    struct.pack_into("<H", fib, rg_lw, 22)
+    rg_fc_lcb = rg_lw + 2 + 22 * 4 + 2
+
+    word, cps, fcs = bytes(fib), [0], []
+    for text, compressed in pieces:
+        encoded = text.encode("cp1252" if compressed else "utf-16-le")
+        fcs.append(len(word) * 2 | 0x40000000 if compressed else len(word))
+        word += encoded
+        cps.append(cps[-1] + len(text))
+    plc = struct.pack(f"<{len(cps)}I", *cps) + b"".join(struct.pack("<HIH", 0, fc, 0) for fc in fcs)
+    clx = b""
+    if prc:
+        clx += struct.pack("<BH", 1, len(prc)) + prc
+    clx += struct.pack("<BI", 2, len(plc)) + plc
+    word = bytearray(word)
+    struct.pack_into("<II", word, rg_fc_lcb + 33 * 8, 0, len(clx))
+    return build_compound_file({"WordDocument": bytes(word), "1Table": clx})
+
+
+def ppt_record(record_type: int, payload: bytes = b"", container: bool = False) -> bytes:
+    return struct.pack("<HHI", 0x000F if container else 0, record_type, len(payload)) + payload
+
+
+def build_powerpoint(records: bytes) -> bytes:
+    return build_compound_file({"PowerPoint Document": records, "Current User": b"\0" * 20})
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+from services.batching import MicroBatcher
+
+
+class Recorder:
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.batches = []
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [item * 10 for item in items]
+
+
+def test_full_batch_is_dispatched_without_waiting_for_the_window():
+    process = Recorder()
+    batcher = MicroBatcher(process, window=10.0, max_batch=3, name="test")
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(3))), timeout=1.0)
+
+    assert asyncio.run(run()) == [0, 10, 20]
+    assert process.batches == [[0, 1, 2]]
+
+
+def test_partial_batch_is_dispatched_after_the_window():
+    process = Recorder()
+    batcher = MicroBatcher(process, window=0.05, max_batch=10, name="test")
+
+    async def run():
+        started = time.perf_counter()
+        results = await asyncio.gather(batcher.submit(1), batcher.submit(2))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+    assert results == [10, 20]
+    assert process.batches == [[1, 2]]
+    assert elapsed >= 0.05
+
+
+def test_items_beyond_max_batch_start_the_next_batch():
+    process = Recorder()
+    batcher = MicroBatcher(process, window=0.02, max_batch=2, name="test")
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(run()) == [0, 10, 20, 30, 40]
+    assert process.batches == [[0, 1], [2, 3], [4]]
+
+
+def test_zero_window_processes_items_alone_and_accepts_sync_functions():
+    batches = []
+
+    def process(items):
+        batches.append(items)
+        return [item + 1 for item in items]
+
+    batcher = MicroBatcher(process, window=0.0, max_batch=10, name="test")
+
+    async def run():
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2))
+
+    assert asyncio.run(run()) == [2, 3]
+    assert batches == [[1], [2]]
+
+
+def test_exception_reaches_every_waiter():
+    batcher = MicroBatcher(Recorder(error=RuntimeError("index down")), window=0.01, max_batch=10, name="test")
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [str(result) for result in results] == ["index down"] * 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.parametrize("cancel_after", [0.0, 0.03])
+def test_cancelled_waiter_does_not_poison_the_batch(cancel_after):
+    # Cancelled while the batch is still collecting (0.0) or while it is being processed (0.03)
+    process = Recorder(delay=0.05)
+    batcher = MicroBatcher(process, window=0.02, max_batch=10, name="test")
+
+    async def run():
+        tasks = [asyncio.ensure_future(batcher.submit(i)) for i in range(3)]
+        await asyncio.sleep(cancel_after)
+        tasks[1].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # The batcher keeps working afterwards
+        return results, await batcher.submit(7)
+
+    results, later = asyncio.run(run())
+    assert results[0] == 0 and results[2] == 20
+    assert isinstance(results[1], asyncio.CancelledError)
+    assert later == 70
+    assert process.batches[0] == [0, 1, 2]
@@ -0,0 +1,123 @@
+import random
+import struct
+
+import pytest
+
+from conftest import build_compound_file, build_powerpoint, build_word_document, ppt_record
+from services.legacy_office import (CompoundFile, CompoundFileError, compound_file_streams,
+                                    extract_text_from_doc, extract_text_from_ppt)
+
+TEXT_CHARS, TEXT_BYTES, MAIN_MASTER, DOCUMENT, SLIDE = 0x0FA0, 0x0FA8, 0x03F8, 0x03E8, 0x03EE
+
+
+def test_small_and_large_streams_are_read_back():
+    small = bytes(range(256)) * 3
+    large = bytes(random.Random(0).randrange(256) for _ in range(9000))
+    cfb = CompoundFile(build_compound_file({"small": small, "large": large, "empty": b""}))
+    assert cfb.open("small").read() == small
+    assert cfb.open("empty").read() == b""
+    stream = cfb.open("large")
+    # Reads that straddle sector boundaries
+    stream.seek(500)
+    assert stream.read(600) == large[500:1100]
+    stream.skip(4000)
+    assert stream.read() == large[5100:]
+    assert stream.read(10) == b""
+
+
+def test_stream_names_and_sizes():
+    content = build_compound_file({"WordDocument": b"x" * 5000, "1Table": b"y" * 10})
+    assert compound_file_streams(content) == {"WordDocument": 5000, "1Table": 10}
+    assert compound_file_streams(b"not an OLE file") is None
+    with pytest.raises(CompoundFileError, match="Stream not found"):
+        CompoundFile(content).open("PowerPoint Document")
+
+
+def test_doc_pieces_are_decoded_and_controls_translated():
+    content = build_word_document([
+        ("Reset the VPN token.\r", True),
+        ("Café → \x13 HYPERLINK \"http://x\" \x14portal\x15 login\x07cell\r", False),
+    ], prc=b"\x00" * 7)
+    assert extract_text_from_doc(content) == "Reset the VPN token.\nCafé → portal login\tcell\n"
+
+
+def test_doc_text_in_a_regular_sector_chain():
+    content = build_word_document([("Far into the stream.", True)], text_offset=6000)
+    assert extract_text_from_doc(content) == "Far into the stream."
+
+
+def test_ppt_text_atoms_skip_masters_and_placeholders():
+    slide = ppt_record(SLIDE, ppt_record(TEXT_CHARS, "Quarterly review\rÜbersicht".encode("utf-16-le"))
+                       + ppt_record(0x0FA1, b"\x00" * 6)
+                       + ppt_record(TEXT_BYTES, b"Revenue grew\x0bby 4%")
+                       + ppt_record(TEXT_BYTES, b"*"), container=True)
+    master = ppt_record(MAIN_MASTER, ppt_record(TEXT_BYTES, b"Click to edit Master title style"), container=True)
+    content = build_powerpoint(ppt_record(DOCUMENT, master + slide, container=True))
+    assert extract_text_from_ppt(content) == "Quarterly review\nÜbersicht\nRevenue grew\nby 4%\n"
+
+
+def test_not_a_word_document():
+    with pytest.raises(CompoundFileError, match="Not a Word"):
+        extract_text_from_doc(build_compound_file({"WordDocument": b"\0" * 100, "1Table": b""}))
+
+
+@pytest.mark.parametrize("content", [
+    b"",
+    b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",
+    b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\0" * 600,
+])
+def test_truncated_headers_are_rejected(content):
+    with pytest.raises(CompoundFileError):
+        CompoundFile(content)
+
+
+def test_sector_size_is_validated():
+    content = bytearray(build_compound_file({"a": b"x"}))
+    struct.pack_into("<H", content, 0x1E, 40)
+    with pytest.raises(CompoundFileError, match="sector size"):
+        CompoundFile(bytes(content))
+
+
+def test_cyclic_sector_chain_is_rejected():
+    content = bytearray(build_compound_file({"big": b"z" * 5000}))
+    fat_offset = 512 * (1 + struct.unpack_from("<I", content, 0x4C)[0])
+    # The stream starts at sector 0: point its second sector back at the first
+    struct.pack_into("<I", content, fat_offset + 4, 0)
+    with pytest.raises(CompoundFileError, match="Corrupt sector chain"):
+        CompoundFile(bytes(content)).open("big").read()
+
+
+def test_cyclic_difat_chain_is_bounded():
+    content = bytearray(build_compound_file({"a": b"x"}))
+    # Sector 0 claims to be a DIFAT sector whose next DIFAT sector is itself
+    struct.pack_into("<II", content, 0x44, 0, 0xFFFFFFF0)
+    struct.pack_into("<I", content, 2 * 512 - 4, 0)
+    assert CompoundFile(bytes(content)).open("a").read() == b"x"
+
+
+def test_truncated_files_raise_the_module_error():
+    content = build_word_document([("Truncated somewhere.", True)], text_offset=6000)
+    for length in range(0, len(content), 97):
+        try:
+            extract_text_from_doc(content[:length])
+        except CompoundFileError:
+            pass
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_corrupted_files_raise_the_module_error(seed):
+    rng = random.Random(seed)
+    if seed % 2:
+        content, extract = build_word_document([("Some text.\r", True), ("More text.", False)]), extract_text_from_doc
+    else:
+        content = build_powerpoint(ppt_record(DOCUMENT, ppt_record(TEXT_BYTES, b"Slide text"), container=True))
+        extract = extract_text_from_ppt
+    corrupted = bytearray(content)
+    for _ in range(rng.randint(1, 8)):
+        # Mostly hit the header, FAT and directory, where damage is structural
+        position = rng.choice([rng.randrange(512), rng.randrange(len(corrupted))])
+        corrupted[position] = rng.randrange(256)
+    try:
+        extract(bytes(corrupted))
+    except CompoundFileError:
+        pass
@@ -0,0 +1,100 @@
+import io
+
+import docx
+from pptx import Presentation
+from pptx.util import Inches
+
+from services.chunking import chunk_sections, describe_location, page_sections, text_sections
+from services.office_extraction import docx_sections, pptx_sections
+
+
+def make_docx() -> bytes:
+    document = docx.Document()
+    document.add_heading("Remote access", level=1)
+    document.add_paragraph("Install the VPN client.")
+    document.add_paragraph("")
+    table = document.add_table(rows=2, cols=3)
+    for row, values in zip(table.rows, [("Port", "Protocol", ""), ("443", "TCP", "TCP")]):
+        for cell, value in zip(row.cells, values):
+            cell.text = value
+    document.add_heading("Printers", level=1)
+    document.add_paragraph("Printers live on floor two.")
+    document.sections[0].header.paragraphs[0].text = "Internal use only"
+    document.sections[0].footer.paragraphs[0].text = "IT handbook"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_pptx() -> bytes:
+    presentation = Presentation()
+    title_slide = presentation.slides.add_slide(presentation.slide_layouts[0])
+    title_slide.shapes.title.text = "Onboarding"
+    title_slide.notes_slide.notes_text_frame.text = "Welcome everyone"
+
+    slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+    group = slide.shapes.add_group_shape()
+    group.shapes.add_textbox(Inches(1), Inches(1), Inches(2), Inches(1)).text_frame.text = "Laptop pickup"
+    table = slide.shapes.add_table(2, 2, Inches(1), Inches(3), Inches(4), Inches(1)).table
+    for (row, column), value in zip([(0, 0), (0, 1), (1, 0), (1, 1)], ["Day", "Task", "1", "Accounts"]):
+        table.cell(row, column).text = value
+    buffer = io.BytesIO()
+    presentation.save(buffer)
+    return buffer.getvalue()
+
+
+def test_docx_sections_keep_order_headings_tables_and_headers():
+    sections = docx_sections(make_docx())
+    assert [(s["kind"], s["text"], s["paragraph"], s["heading"]) for s in sections] == [
+        ("paragraph", "Remote access", 0, "Remote access"),
+        ("paragraph", "Install the VPN client.", 1, "Remote access"),
+        # Merged-looking repeats in a row are reported once; the empty cell is dropped
+        ("table", "Port | Protocol\n443 | TCP", 3, "Remote access"),
+        ("paragraph", "Printers", 3, "Printers"),
+        ("paragraph", "Printers live on floor two.", 4, "Printers"),
+        ("header", "Internal use only", 0, None),
+        ("footer", "IT handbook", 0, None),
+    ]
+
+
+def test_pptx_sections_walk_groups_tables_and_notes():
+    sections = pptx_sections(make_pptx())
+    assert [(s["kind"], s["text"], s["slide"]) for s in sections] == [
+        ("slide", "Onboarding", 1),
+        ("notes", "Welcome everyone", 1),
+        ("slide", "Laptop pickup", 2),
+        ("table", "Day | Task\n1 | Accounts", 2),
+    ]
+
+
+def test_chunks_never_straddle_slides():
+    text, chunks = chunk_sections(pptx_sections(make_pptx()), chunk_size=1000)
+    assert [(chunk["slide"], chunk["kinds"]) for chunk in chunks] == [((1, 1), ["slide", "notes"]),
+                                                                       ((2, 2), ["slide", "table"])]
+    assert text[chunks[1]["start"]:chunks[1]["end"]] == "Laptop pickup\nDay | Task\n1 | Accounts\n"
+    assert [describe_location(chunk) for chunk in chunks] == ["slide 1", "slide 2"]
+
+
+def test_paragraphs_pack_into_chunks_up_to_the_size():
+    sections = text_sections("\n\n".join(f"Paragraph {i} " + "x" * 30 for i in range(6)))
+    text, chunks = chunk_sections(sections, chunk_size=100)
+    assert [chunk["paragraph"] for chunk in chunks] == [(0, 1), (2, 3), (4, 5)]
+    assert all(chunk["end"] - chunk["start"] <= 100 for chunk in chunks)
+    assert chunks[0]["end"] == chunks[1]["start"]
+    assert describe_location(chunks[1]) == "paragraphs 2-3"
+
+
+def test_long_sections_split_at_sentences_and_hard_wrap():
+    sentence = "Reset the token now. "
+    sections = [{"kind": "page", "text": sentence * 10 + "y" * 250, "page": 1}]
+    text, chunks = chunk_sections(sections, chunk_size=100)
+    pieces = [text[chunk["start"]:chunk["end"]] for chunk in chunks]
+    assert all(len(piece) <= 101 for piece in pieces)
+    assert pieces[0].startswith("Reset the token now. Reset") and pieces[0].endswith("now.\n")
+    assert "".join(pieces).replace("\n", " ").split() == (sentence * 10 + "y" * 250).split()[:-1] + ["y" * 100, "y" * 100, "y" * 50]
+    assert {chunk["page"] for chunk in chunks} == {(1, 1)}
+
+
+def test_pages_start_new_chunks():
+    _, chunks = chunk_sections(page_sections(["first page", "  ", "third page"]), chunk_size=1000)
+    assert [chunk["page"] for chunk in chunks] == [(1, 1), (3, 3)]
@@ -0,0 +1,50 @@
+import pytest
+
+from benchmarks.corpus import make_pdf
+from services import pdf_extraction
+from services.pdf_extraction import PDFExtractor, available_backends, page_count
+
+PAGES = ["Restart the VPN client first.", "The printer lives on floor two.", "Restart the VPN client first."]
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_every_page_is_extracted_in_order(backend):
+    data = make_pdf(PAGES)
+    assert page_count(backend, data) == 3
+    extractor = PDFExtractor(backend=backend, workers=1, cache_pages=0)
+    texts = extractor.extract_pages(data)
+    assert [("VPN" in text, "printer" in text) for text in texts] == [(True, False), (False, True), (True, False)]
+
+
+def test_cached_pages_are_not_extracted_again(monkeypatch):
+    extracted = []
+    real = pdf_extraction.BACKENDS["pypdf2"]
+
+    def counting(data, pages):
+        extracted.extend(pages)
+        return real(data, pages)
+
+    monkeypatch.setitem(pdf_extraction.BACKENDS, "pypdf2", counting)
+    extractor = PDFExtractor(backend="pypdf2", workers=1, cache_pages=100)
+    first = extractor.extract_pages(make_pdf(PAGES))
+    assert extracted == [0, 1, 2]
+    extracted.clear()
+    # Same pages in another file: served from the cache
+    assert extractor.extract_pages(make_pdf(PAGES[::-1])) == first[::-1]
+    assert extracted == []
+
+
+def test_pages_evicted_during_extraction_are_extracted(monkeypatch):
+    extractor = PDFExtractor(backend="pypdf2", workers=1, cache_pages=100)
+    data = make_pdf(PAGES)
+    expected = extractor.extract_pages(data)
+    # The cache is emptied by a concurrent upload after the workers checked it
+    snapshot = extractor.cache.fingerprints()
+    extractor.cache = pdf_extraction.PageCache(100)
+    monkeypatch.setattr(extractor.cache, "fingerprints", lambda: snapshot)
+    assert extractor.extract_pages(data) == expected
+
+
+def test_unreadable_file_raises():
+    with pytest.raises(Exception):
+        PDFExtractor(backend="pypdf2", workers=1).extract_pages(b"%PDF-1.4 not really")
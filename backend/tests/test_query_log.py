@@ -0,0 +1,152 @@
+import asyncio
+import json
+
+import httpx
+
+from services.cache import LRUCache
+from services.query_log import QueryLog, iter_entries, rotated_path, top_questions
+from services.sessions import SessionStore
+from services.tenants import TenantRegistry
+
+
+def write_log(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+
+def test_entries_are_buffered_until_flushed(tmp_path):
+    path = str(tmp_path / "logs" / "queries.jsonl")
+    log = QueryLog(path)
+
+    async def run():
+        log.record({"question": "vpn port"})
+        log.record({"question": "printer floor"})
+        before = list(iter_entries(path))
+        await log.flush()
+        return before
+
+    assert asyncio.run(run()) == []
+    entries = list(iter_entries(path))
+    assert [entry["question"] for entry in entries] == ["vpn port", "printer floor"]
+    assert all("ts" in entry for entry in entries)
+
+
+def test_background_writer_flushes_full_batches_and_on_close(tmp_path):
+    path = str(tmp_path / "queries.jsonl")
+    log = QueryLog(path, flush_interval=60.0, max_batch=2)
+
+    async def run():
+        log.start()
+        log.record({"question": "a"})
+        log.record({"question": "b"})
+        # A full batch wakes the writer long before the flush interval
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if list(iter_entries(path)):
+                break
+        written = [entry["question"] for entry in iter_entries(path)]
+        log.record({"question": "c"})
+        await log.close()
+        return written
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert [entry["question"] for entry in iter_entries(path)] == ["a", "b", "c"]
+
+
+def test_writer_that_falls_behind_drops_new_entries(tmp_path):
+    path = str(tmp_path / "queries.jsonl")
+    log = QueryLog(path, max_pending=2)
+    for question in "abc":
+        log.record({"question": question})
+    asyncio.run(log.flush())
+    assert [entry["question"] for entry in iter_entries(path)] == ["a", "b"]
+
+
+def test_log_rotates_past_max_bytes_and_is_read_as_one(tmp_path):
+    path = str(tmp_path / "queries.jsonl")
+    log = QueryLog(path, max_bytes=200)
+
+    async def run():
+        for n in range(12):
+            log.record({"question": f"question {n}"})
+            await log.flush()
+
+    asyncio.run(run())
+    assert (tmp_path / "queries.jsonl").stat().st_size <= 200
+    assert (tmp_path / "queries.jsonl.1").stat().st_size <= 200
+    questions = [entry["question"] for entry in iter_entries(path)]
+    # Only one backup is kept: the oldest entries are gone, the rest stay in order
+    assert questions == [f"question {n}" for n in range(12 - len(questions), 12)]
+    assert len(questions) > len(list(iter_entries(rotated_path(path)))) > 0
+
+
+def test_tail_spans_the_backup_and_skips_partial_lines(tmp_path):
+    path = str(tmp_path / "queries.jsonl")
+    write_log(rotated_path(path), [{"question": "old"}, {"question": "older tail"}])
+    write_log(path, [{"question": "new"}])
+    live = len(json.dumps({"question": "new"})) + 1
+    last_backup_line = len(json.dumps({"question": "older tail"})) + 1
+    assert [e["question"] for e in iter_entries(path, tail_bytes=live + last_backup_line + 3)] == ["older tail", "new"]
+    assert [e["question"] for e in iter_entries(path, tail_bytes=live + 3)] == ["new"]
+    assert [e["question"] for e in iter_entries(path)] == ["old", "older tail", "new"]
+
+
+def test_top_questions_ranks_by_frequency_per_tenant_and_filters(tmp_path):
+    path = str(tmp_path / "queries.jsonl")
+    write_log(path, [
+        {"tenant": "a", "question": "VPN port?", "normalized": "vpn port"},
+        {"tenant": "a", "question": "Printer floor", "normalized": "printer floor"},
+        {"tenant": "a", "question": "vpn  port", "normalized": "vpn port"},
+        {"tenant": "b", "question": "VPN port?", "normalized": "vpn port"},
+        {"tenant": "a", "question": "Printer floor", "normalized": "printer floor", "filters": {"file_type": ["pdf"]}},
+        {"tenant": "a", "question": "printer floor", "normalized": "printer floor"},
+        {"tenant": "a", "question": "vpn port", "normalized": "vpn port"},
+    ])
+    assert top_questions(path, 3) == [
+        ("a", "VPN port?", {}, 3),
+        ("a", "Printer floor", {}, 2),
+        ("b", "VPN port?", {}, 1),
+    ]
+    assert top_questions(path, 10)[-1] == ("a", "Printer floor", {"file_type": ["pdf"]}, 1)
+    assert top_questions(str(tmp_path / "missing.jsonl"), 5) == []
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    cache.put("a", 10)
+    assert len(cache) == 2 and cache.get("a") == 10
+    disabled = LRUCache(0)
+    disabled.put("a", 1)
+    assert len(disabled) == 0 and disabled.get("a", "default") == "default"
+
+
+def test_health_is_unavailable_until_the_warm_up_has_run(tmp_path, monkeypatch):
+    import main
+    registry = TenantRegistry(str(tmp_path), 0, 0, 0, make_sessions=lambda: SessionStore(10, 60, 1000))
+    path = str(tmp_path / "queries.jsonl")
+    write_log(path, [{"tenant": main.DEFAULT_TENANT, "question": "Which port does the vpn use?"}] * 2
+              + [{"tenant": "../escape", "question": "vpn"}])
+    monkeypatch.setattr(main, "tenants", registry)
+    monkeypatch.setattr(main, "retrieval_cache", LRUCache(10))
+    monkeypatch.setattr(main, "warmup", {"ready": False, "questions": 0, "seconds": None})
+    monkeypatch.setattr(main.config, "QUERY_LOG_PATH", path)
+
+    async def run():
+        async with httpx.AsyncClient(app=main.app, base_url="http://test") as client:
+            await client.post("/upload", files={"file": ("vpn.txt", b"The vpn uses port 443.", "text/plain")})
+            warming = await client.get("/health")
+            await main.warm_up()
+            ready = await client.get("/health")
+            tenant = await registry.get(main.DEFAULT_TENANT)
+            cached = main.retrieval_cache.get(main.retrieval_cache_key(tenant, "Which port does the vpn use?", {}))
+            return warming, ready, cached
+
+    warming, ready, cached = asyncio.run(run())
+    assert warming.status_code == 503 and warming.json()["status"] == "warming"
+    assert ready.status_code == 200 and ready.json()["warmup"]["questions"] == 1
+    assert cached == [0]
@@ -0,0 +1,60 @@
+import asyncio
+
+from services.singleflight import SingleFlight, run_until_disconnected
+
+
+class FakeRequest:
+    """A request whose body was read; its client disconnects after `disconnect_after` seconds"""
+
+    def __init__(self, disconnect_after: float):
+        self.disconnect_after = disconnect_after
+
+    async def receive(self) -> dict:
+        await asyncio.sleep(self.disconnect_after)
+        return {"type": "http.disconnect"}
+
+
+def test_result_is_returned_while_connected():
+    async def run():
+        return await run_until_disconnected(FakeRequest(10), asyncio.sleep(0.01, result="answer"))
+
+    assert asyncio.run(run()) == "answer"
+
+
+def test_disconnect_cancels_the_work():
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        result = await run_until_disconnected(FakeRequest(0.01), work())
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) is None
+    assert cancelled == [True]
+
+
+def test_disconnect_leaves_shared_flight_running_for_others():
+    flight = SingleFlight()
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "shared answer"
+
+    async def run():
+        gone = run_until_disconnected(FakeRequest(0.01), flight.do("key", answer))
+        stays = flight.do("key", answer)
+        return await asyncio.gather(gone, stays)
+
+    gone, (result, _) = asyncio.run(run())
+    assert gone is None
+    assert result == "shared answer"
+    assert calls == [1]
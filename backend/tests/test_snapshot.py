@@ -0,0 +1,74 @@
+import pytest
+
+from services import snapshot
+from services.corpus import Corpus
+from services.snapshot import Snapshot, SnapshotError, load_corpus, save_corpus, write_snapshot
+
+
+def test_sections_are_aligned_and_round_trip(tmp_path):
+    path = str(tmp_path / "s.tkbsnap")
+    sections = {"a": b"x" * 3, "empty": b"", "b": bytes(range(200))}
+    table = write_snapshot(path, sections, {"owner": "test"})
+    for name, (offset, length, _) in table["sections"].items():
+        assert offset % 64 == 0
+        assert length == len(sections[name])
+    with Snapshot(path) as loaded:
+        loaded.verify()
+        assert loaded.metadata == {"owner": "test"}
+        assert {name: bytes(view) for name, view in loaded.sections.items()} == sections
+
+
+def test_corrupted_section_fails_verification(tmp_path):
+    path = str(tmp_path / "s.tkbsnap")
+    table = write_snapshot(path, {"data": b"hello world"})
+    offset = table["sections"]["data"][0]
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(b"J")
+    with Snapshot(path) as loaded:
+        with pytest.raises(SnapshotError, match="Checksum mismatch"):
+            loaded.verify()
+
+
+@pytest.mark.parametrize("contents, message", [
+    (b"", "Empty"),
+    (b"TKBSNAP", "Truncated"),
+    (b"NOTASNAP" + bytes(24), "Not a snapshot"),
+])
+def test_malformed_files_are_rejected(tmp_path, contents, message):
+    path = tmp_path / "bad.tkbsnap"
+    path.write_bytes(contents)
+    with pytest.raises(SnapshotError, match=message):
+        Snapshot(str(path))
+
+
+def test_newer_format_is_rejected(tmp_path, monkeypatch):
+    path = str(tmp_path / "s.tkbsnap")
+    monkeypatch.setattr(snapshot, "FORMAT_VERSION", snapshot.FORMAT_VERSION + 1)
+    write_snapshot(path, {"data": b"x"})
+    monkeypatch.undo()
+    with pytest.raises(SnapshotError, match="newer"):
+        Snapshot(path)
+
+
+def test_corpus_survives_a_snapshot(tmp_path):
+    corpus = Corpus()
+    for i in range(5):
+        corpus.add({"filename": f"f{i}.md", "file_type": "md", "tags": ["net"] if i < 2 else [],
+                    "size": 10 * i, "content": f"configure the router number {i}", "keywords": ["router"],
+                    "chunks": [{"start": 0, "end": 5, "paragraph": (1, 2)}]})
+    corpus.delete([1])
+    path = str(tmp_path / "corpus.tkbsnap")
+    assert save_corpus(corpus, path)["documents"] == 4
+
+    restored = load_corpus(path, verify=True)
+    assert len(restored) == 4
+    assert restored.get(1) is None
+    assert restored.get(3)["content"] == "configure the router number 3"
+    assert restored.get(3)["chunks"][0]["paragraph"] == (1, 2)
+    assert restored.filter_ids({"tags": ["net"]}) == [0]
+    assert restored.keyword_candidates(["router"], fanout=10) == [0, 2, 3, 4]
+    assert restored.stats() == corpus.stats()
+    assert "router" in restored.vocabulary
+    assert [doc["doc_id"] for doc in restored.iter_sorted("size", descending=True)] == [4, 3, 2, 0]
+    assert restored.add({"filename": "new", "content": ""}) == 5
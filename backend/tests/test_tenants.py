@@ -0,0 +1,152 @@
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from services.corpus import Corpus
+from services.sessions import SessionStore
+from services.tenants import (DEFAULT_TENANT, QuotaExceeded, TenantRegistry, parse_api_keys, summary_namespace,
+                              vector_namespace)
+
+
+def registry(tmp_path, **limits):
+    options = {"resident_bytes": 0, "quota_bytes": 0, "idle_seconds": 0, **limits}
+    return TenantRegistry(str(tmp_path), make_sessions=lambda: SessionStore(10, 60, 1000), **options)
+
+
+def add_text(tenant, text):
+    tenant.corpus.add({"filename": "a.txt", "content": text, "size": len(text)})
+
+
+def test_parse_api_keys_and_namespaces():
+    assert parse_api_keys(" k1=acme, bad ,k2=beta,=x") == {"k1": "acme", "k2": "beta"}
+    assert vector_namespace(DEFAULT_TENANT) == ""
+    assert vector_namespace("acme") == "acme"
+    assert summary_namespace("acme").startswith("acme-")
+    assert summary_namespace("") != summary_namespace("acme")
+
+
+def test_eviction_writes_in_the_background_and_reloads(tmp_path):
+    tenants = registry(tmp_path)
+
+    async def run():
+        acme = await tenants.get("acme")
+        add_text(acme, "router configuration")
+        assert tenants.evict("acme")
+        assert "acme" in tenants._writes
+        await tenants.flush()
+        assert os.path.exists(tenants.snapshot_path("acme"))
+        reloaded = await tenants.get("acme")
+        return acme, reloaded
+
+    acme, reloaded = asyncio.run(run())
+    assert reloaded is not acme
+    assert reloaded.corpus.get(0)["content"] == "router configuration"
+
+
+def test_tenant_requested_during_its_write_comes_back_from_memory(tmp_path):
+    tenants = registry(tmp_path)
+
+    async def run():
+        acme = await tenants.get("acme")
+        add_text(acme, "first")
+        tenants.evict("acme")
+        again = await tenants.get("acme")
+        await tenants.flush()
+        return acme, again
+
+    acme, again = asyncio.run(run())
+    assert again is acme
+    assert [tenant.name for tenant in tenants.resident()] == ["acme"]
+
+
+def test_resident_budget_evicts_least_recently_used(tmp_path):
+    tenants = registry(tmp_path, resident_bytes=10)
+
+    async def run():
+        first = await tenants.get("first")
+        add_text(first, "x" * 8)
+        second = await tenants.get("second")
+        add_text(second, "y" * 8)
+        evicted = tenants.enforce(keep="second")
+        await tenants.flush()
+        return evicted
+
+    assert asyncio.run(run()) == ["first"]
+    assert [tenant.name for tenant in tenants.resident()] == ["second"]
+    assert any(entry["tenant"] == "first" and not entry["resident"] for entry in tenants.stats())
+
+
+def test_busy_tenants_are_not_evicted_and_quota_is_enforced(tmp_path):
+    tenants = registry(tmp_path, quota_bytes=10)
+
+    async def run():
+        return await tenants.get("acme")
+
+    acme = asyncio.run(run())
+    acme.active = 1
+    assert not tenants.evict("acme")
+    add_text(acme, "x" * 8)
+    with pytest.raises(QuotaExceeded):
+        tenants.check_quota(acme, 5)
+    tenants.check_quota(acme, 2)
+
+
+def test_install_moves_the_version_forward(tmp_path):
+    tenants = registry(tmp_path)
+
+    async def run():
+        acme = await tenants.get("acme")
+        add_text(acme, "old")
+        return await tenants.install("acme", Corpus())
+
+    tenant = asyncio.run(run())
+    assert tenant.corpus.version >= 2 and len(tenant.corpus) == 0
+
+
+@pytest.fixture
+def app_tenants(tmp_path, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "tenants", registry(tmp_path))
+    monkeypatch.setattr(main, "TENANT_API_KEYS", {"secret": "acme"})
+    monkeypatch.setattr(main, "KEYED_TENANTS", {"acme"})
+    monkeypatch.setattr(main.config, "TENANT_HEADER_ENABLED", True)
+    return main
+
+
+def resolve(main, **headers):
+    async def run():
+        dependency = main.current_tenant(**{"x_api_key": None, "x_tenant_id": None, **headers})
+        tenant = await dependency.__anext__()
+        await dependency.aclose()
+        return tenant.name
+
+    return asyncio.run(run())
+
+
+def test_keyed_tenant_is_not_reachable_through_the_header(app_tenants):
+    assert resolve(app_tenants, x_api_key="secret") == "acme"
+    # API keys are configured, so the header is ignored even when enabled
+    assert resolve(app_tenants, x_tenant_id="beta") == DEFAULT_TENANT
+    with pytest.raises(HTTPException) as raised:
+        resolve(app_tenants, x_api_key="wrong")
+    assert raised.value.status_code == 401
+
+
+def test_default_tenant_bound_to_a_key_requires_it(app_tenants, monkeypatch):
+    monkeypatch.setattr(app_tenants, "KEYED_TENANTS", {"acme", DEFAULT_TENANT})
+    with pytest.raises(HTTPException) as raised:
+        resolve(app_tenants, x_tenant_id="acme")
+    assert raised.value.status_code == 401
+
+
+def test_header_selects_tenants_without_api_keys(app_tenants, monkeypatch):
+    monkeypatch.setattr(app_tenants, "TENANT_API_KEYS", {})
+    monkeypatch.setattr(app_tenants, "KEYED_TENANTS", set())
+    assert resolve(app_tenants, x_tenant_id="beta") == "beta"
+    with pytest.raises(HTTPException) as raised:
+        resolve(app_tenants, x_tenant_id="../etc")
+    assert raised.value.status_code == 400
+    monkeypatch.setattr(app_tenants.config, "TENANT_HEADER_ENABLED", False)
+    assert resolve(app_tenants, x_tenant_id="beta") == DEFAULT_TENANT
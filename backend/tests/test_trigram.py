@@ -0,0 +1,75 @@
+import pytest
+
+from services.corpus import Corpus
+from services.snapshot import load_corpus, save_corpus
+from services.trigram import TrigramIndex, edit_distance, trigrams, vocabulary_words
+
+
+def index(*words):
+    vocabulary = TrigramIndex()
+    vocabulary.add(words)
+    return vocabulary
+
+
+def test_trigrams_are_padded():
+    assert trigrams("vpn") == {"$vp", "vpn", "pn$"}
+    assert trigrams("a") == {"$a$"}
+
+
+def test_vocabulary_skips_numbers_and_short_or_long_tokens():
+    assert vocabulary_words("The VPN 2024 gateway is at 10.0.0.1 " + "x" * 50) == {"the", "vpn", "gateway"}
+
+
+@pytest.mark.parametrize("a, b, distance", [
+    ("network", "network", 0),
+    ("netwrok", "network", 1),   # transposition
+    ("netwok", "network", 1),    # deletion
+    ("networks", "network", 1),  # insertion
+    ("nctwork", "network", 1),   # substitution
+    ("ntwrok", "network", 2),
+])
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b, 2) == distance
+
+
+def test_edit_distance_stops_past_the_limit():
+    assert edit_distance("configuration", "network", 2) == 3
+    assert edit_distance("abcdef", "badcfe", 2) == 3
+
+
+def test_near_finds_misspellings_closest_first():
+    vocabulary = index("network", "networks", "netball", "firewall", "gateway")
+    assert vocabulary.near("netwrok", 1, 3) == ["network"]
+    assert vocabulary.near("netwroks", 2, 3) == ["networks", "network"]
+    assert vocabulary.near("firewal", 1, 3) == ["firewall"]
+    assert vocabulary.near("network", 1, 3) == ["networks"]
+    assert vocabulary.near("printer", 2, 3) == []
+    assert vocabulary.near("netwrok", 2, 1) == ["network"]
+
+
+def test_add_counts_new_words_only():
+    vocabulary = index("router")
+    assert vocabulary.add(["router", "switch", "switch"]) == 1
+    assert len(vocabulary) == 2 and "switch" in vocabulary
+
+
+def test_corpus_vocabulary_survives_snapshots(tmp_path):
+    corpus = Corpus()
+    corpus.add({"filename": "a.txt", "content": "Restart the firewall appliance"})
+    path = str(tmp_path / "c.tkbsnap")
+    save_corpus(corpus, path)
+    assert load_corpus(path).vocabulary.near("firewal", 1, 3) == ["firewall"]
+    corpus.clear()
+    assert len(corpus.vocabulary) == 0
+
+
+def test_misspelled_question_terms_rank_fuzzy_matches_lower():
+    import main
+    vocabulary = index("firewall", "restart", "printer")
+    expansions = main.expand_terms(["restart", "firewal"], vocabulary)
+    assert expansions == {"firewal": ["firewall"]}
+    matches = {"restart": {0: 1, 1: 1}, "firewall": {1: 1}, "firewal": {2: 1}}
+    # Document 2 has the exact typo; document 1 the corrected spelling, which scores FUZZY_WEIGHT
+    ranked = main.rank_documents(["restart", "firewal"], matches, threshold=2, expansions=expansions)
+    assert ranked == [1]
+    assert main.rank_documents(["restart", "firewal"], matches, expansions=expansions) == [1, 0, 2]
@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services import two_stage
+from services.tenants import summary_namespace
+from services.two_stage import asearch_chunks, candidate_filter, search_chunks
+
+
+def passes(metadata: dict, condition: dict) -> bool:
+    """Evaluate the subset of Pinecone's metadata filter language the retrieval code uses"""
+    for key, value in condition.items():
+        if key == "$and":
+            if not all(passes(metadata, part) for part in value):
+                return False
+        elif key == "$or":
+            if not any(passes(metadata, part) for part in value):
+                return False
+        else:
+            for operator, operand in value.items():
+                present = metadata.get(key)
+                values = present if isinstance(present, list) else [present]
+                if operator == "$exists" and (key in metadata) != operand:
+                    return False
+                if operator == "$in" and not set(values) & set(operand):
+                    return False
+                if operator == "$gte" and (present is None or present < operand):
+                    return False
+    return True
+
+
+class FakeIndex:
+    """In-memory stand-in for a Pinecone index: exact dot-product search with metadata filters"""
+
+    def __init__(self):
+        self.namespaces = {}
+        self.queries = []
+
+    def upsert(self, vector, metadata, namespace=""):
+        self.namespaces.setdefault(namespace, []).append((np.asarray(vector, dtype=float), metadata))
+
+    def query(self, vector, top_k, include_metadata, filter=None, namespace=""):
+        self.queries.append(namespace)
+        records = [(float(np.dot(vector, values)), metadata) for values, metadata in self.namespaces.get(namespace, [])
+                   if filter is None or passes(metadata, filter)]
+        records.sort(key=lambda record: -record[0])
+        return SimpleNamespace(matches=[SimpleNamespace(score=score, metadata=metadata)
+                                        for score, metadata in records[:top_k]])
+
+
+class AsyncFakeIndex(FakeIndex):
+    async def query(self, *args, **kwargs):
+        return FakeIndex.query(self, *args, **kwargs)
+
+
+def axis(i: int, dimensions: int = 8) -> np.ndarray:
+    vector = np.zeros(dimensions)
+    vector[i] = 1.0
+    return vector
+
+
+def mixed_index(index: FakeIndex, namespace: str = "t"):
+    # Uploaded before summaries existed: chunks only, no document_id
+    for n in range(3):
+        index.upsert(axis(0) + 0.01 * n, {"content": f"legacy vpn {n}", "file_type": "txt"}, namespace)
+    # Uploaded since: chunks plus a centroid in the summary namespace
+    for n in range(3):
+        index.upsert(axis(1) + 0.01 * n, {"content": f"new printer {n}", "document_id": "new", "file_type": "txt"},
+                     namespace)
+    index.upsert(axis(1), {"document_id": "new", "file_type": "txt"}, summary_namespace(namespace))
+    return index
+
+
+def test_candidate_filter_keeps_unsummarized_chunks():
+    shortlisted = candidate_filter({"file_type": ["pdf"]}, {"b", "a"})
+    assert passes({"file_type": "pdf", "document_id": "a"}, shortlisted)
+    assert passes({"file_type": "pdf"}, shortlisted)
+    assert not passes({"file_type": "pdf", "document_id": "c"}, shortlisted)
+    assert not passes({"file_type": "txt"}, shortlisted)
+    assert candidate_filter({"file_type": ["pdf"]}, set()) == {"file_type": {"$in": ["pdf"]}}
+    assert candidate_filter(None, None) is None
+
+
+def test_documents_indexed_before_summaries_are_still_retrieved(monkeypatch):
+    monkeypatch.setattr(two_stage.config, "RETRIEVAL_FANOUT", 5)
+    index = mixed_index(FakeIndex())
+    matches = search_chunks(index, axis(0), None, "t")
+    assert [match.metadata["content"] for match in matches] == ["legacy vpn 2", "legacy vpn 1", "legacy vpn 0"]
+    matches = search_chunks(index, axis(1), {"file_type": ["txt"]}, "t")
+    assert {match.metadata["content"] for match in matches} == {"new printer 0", "new printer 1", "new printer 2"}
+
+
+def test_short_shortlist_falls_back_to_flat_search(monkeypatch):
+    monkeypatch.setattr(two_stage.config, "RETRIEVAL_FANOUT", 5)
+    index = FakeIndex()
+    index.upsert(axis(2), {"content": "only chunk", "document_id": "a"}, "t")
+    index.upsert(axis(3), {"content": "other chunk", "document_id": "b"}, "t")
+    # Summary of "b" is missing (e.g. its upsert failed)
+    index.upsert(axis(2), {"document_id": "a"}, summary_namespace("t"))
+    matches = search_chunks(index, axis(2), None, "t")
+    assert [match.metadata["content"] for match in matches] == ["only chunk", "other chunk"]
+    assert index.queries == [summary_namespace("t"), "t", "t"]
+
+
+@pytest.mark.parametrize("fanout", [0, 5])
+def test_async_search_matches_the_blocking_one(monkeypatch, fanout):
+    monkeypatch.setattr(two_stage.config, "RETRIEVAL_FANOUT", fanout)
+    blocking, asynchronous = mixed_index(FakeIndex()), mixed_index(AsyncFakeIndex())
+    for vector in (axis(0), axis(1), axis(0) + axis(1)):
+        expected = [match.metadata for match in search_chunks(blocking, vector, None, "t")]
+        got = asyncio.run(asearch_chunks(asynchronous, vector, None, "t"))
+        assert [match.metadata for match in got] == expected
@@ -0,0 +1,389 @@
+"""Benchmark harness for retrieval, ingestion and /chat throughput.
+
+Runs entirely offline: documents and questions are synthetic, and the chat
+endpoint talks to the stub LLM in services/stub_llm.py on a local port.
+
+    python -m benchmarks.run --chunks 10000 --queries 500 --concurrency 32
+    python -m benchmarks.run --only retrieval --chunks 1000000 --output big.json
+    python -m benchmarks.run --only chat --query-log logs/queries.jsonl --base-url http://localhost:8000
+
+Results are written as JSON (one file per run) so they can be diffed across commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import httpx
+import uvicorn
+
+from benchmarks.corpus import SyntheticCorpus, make_fixtures, make_pdf
+from services.query_log import iter_entries
+
+SECTIONS = ("retrieval", "ingest", "pdf", "memory", "chat")
+
+
+def percentile(samples: list, p: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: list) -> dict:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(latencies),
+        "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p90_ms": 1000 * percentile(latencies, 90),
+        "p99_ms": 1000 * percentile(latencies, 99),
+        "max_ms": 1000 * max(latencies) if latencies else 0.0,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_llm(port: int) -> str:
+    """Run the stub LLM server on a background thread and return its base URL"""
+    server = uvicorn.Server(uvicorn.Config("services.stub_llm:app", host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def load_app():
+    """Import main.py pointed at the stub LLM"""
+    # config reads LLM_STUB_URL once, when it is first imported (the stub server imports it too),
+    # so the URL has to be in the environment before the stub starts
+    port = free_port()
+    os.environ["LLM_STUB_URL"] = f"http://127.0.0.1:{port}"
+    # Benchmark questions are synthetic; keep them out of the production query log
+    os.environ.setdefault("QUERY_LOG_PATH", "")
+    start_stub_llm(port)
+    import main
+    if main.openai.api_base != os.environ["LLM_STUB_URL"]:
+        raise SystemExit(f"main.py is not pointed at the stub LLM (api_base={main.openai.api_base!r})")
+    return main
+
+
+def bench_retrieval(main, corpus: SyntheticCorpus, docs: list, queries: int) -> dict:
+    questions = corpus.questions(queries)
+    latencies = []
+    hits = 0
+    for question in questions:
+        start = time.perf_counter()
+        results = main.find_relevant_documents(question, docs, threshold=1)
+        latencies.append(time.perf_counter() - start)
+        hits += bool(results)
+    return {"chunks": len(docs), "queries": len(questions), "hit_rate": hits / len(questions), **summarize(latencies)}
+
+
+def bench_retrieval_batched(main, corpus: SyntheticCorpus, docs: list, queries: int, batch_sizes) -> dict:
+    """Queries/sec when questions are retrieved in micro-batches of each size (one corpus pass per batch)"""
+    from services.corpus import Corpus
+    source = Corpus()
+    for doc in docs:
+        source.add(dict(doc))
+    questions = corpus.questions(queries)
+    results = {}
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for offset in range(0, len(questions), batch_size):
+            main.find_relevant_batch([(question, None) for question in questions[offset:offset + batch_size]], source)
+        results[str(batch_size)] = {"queries_per_sec": len(questions) / (time.perf_counter() - start)}
+    return results
+
+
+def bench_two_stage(main, corpus: SyntheticCorpus, docs: list, queries: int, fanouts) -> dict:
+    """Recall@3 and latency of keyword-shortlisted retrieval at each fan-out, against flat search"""
+    from services.corpus import Corpus
+    source = Corpus()
+    for doc in docs:
+        source.add({**doc, "keywords": main.document_keywords(doc["content"])})
+    questions = corpus.questions(queries)
+
+    def run(fanout):
+        latencies = []
+        found = []
+        for question in questions:
+            start = time.perf_counter()
+            docs_found = main.find_relevant_batch([(question, None)], source, fanout=fanout)[0]
+            latencies.append(time.perf_counter() - start)
+            found.append(docs_found)
+        return found, latencies
+
+    def score(question_words, doc):
+        content = doc["content"].lower()
+        return sum(1 for word in question_words if word in content)
+
+    # Shortlist even this small corpus; restored afterwards so later benchmarks see the configured threshold
+    min_documents = main.config.RETRIEVAL_TWO_STAGE_MIN_DOCUMENTS
+    main.config.RETRIEVAL_TWO_STAGE_MIN_DOCUMENTS = 0
+    try:
+        flat, flat_latencies = run(0)
+        results = {"flat": summarize(flat_latencies)}
+        for fanout in fanouts:
+            found, latencies = run(fanout)
+            # Flat search breaks score ties by position, so a result counts as recalled when it
+            # scores at least as well as the flat result of the same rank
+            recalled = 0
+            for question, expected, got in zip(questions, flat, found):
+                words = main.query_terms(question)
+                got_scores = sorted((score(words, doc) for doc in got), reverse=True)
+                recalled += sum(1 for rank, doc in enumerate(expected)
+                                if rank < len(got_scores) and got_scores[rank] >= score(words, doc))
+            expected_total = sum(len(expected) for expected in flat) or 1
+            results[str(fanout)] = {"recall_at_3": recalled / expected_total, **summarize(latencies)}
+        return results
+    finally:
+        main.config.RETRIEVAL_TWO_STAGE_MIN_DOCUMENTS = min_documents
+
+
+def bench_ingest(main, corpus: SyntheticCorpus, fixture_count: int, pages: int) -> dict:
+    fixtures = make_fixtures(corpus, fixture_count, pages=pages)
+    results = {}
+    for file_type, files in fixtures.items():
+        extract = main.SECTION_EXTRACTORS[file_type]
+        latencies = []
+        total_bytes = sum(len(content) for content in files)
+        extracted = 0
+        for content in files:
+            start = time.perf_counter()
+            extracted += sum(len(section["text"]) for section in extract(content))
+            latencies.append(time.perf_counter() - start)
+        elapsed = sum(latencies)
+        results[file_type] = {
+            "documents": len(files),
+            "pages_per_document": pages,
+            "docs_per_sec": len(files) / elapsed if elapsed else 0.0,
+            "mb_per_sec": total_bytes / elapsed / 1e6 if elapsed else 0.0,
+            "extracted_characters": extracted,
+            **summarize(latencies),
+        }
+    return results
+
+
+def legacy_extract_pdf(content: bytes) -> str:
+    """The original serial PyPDF2 extractor, kept as the baseline"""
+    import PyPDF2
+    import io
+    reader = PyPDF2.PdfReader(io.BytesIO(content))
+    return "".join(page.extract_text() + "\n" for page in reader.pages)
+
+
+def bench_pdf(corpus: SyntheticCorpus, files: int, pages: int, workers: int) -> dict:
+    """Compare the legacy extractor with each PDF backend, serial, parallel and cached"""
+    from services.pdf_extraction import PDFExtractor, available_backends
+    pdfs = [make_pdf([corpus.text(2500) for _ in range(pages)]) for _ in range(files)]
+
+    def timed(extract) -> dict:
+        """Extract every file; `extract` returns the text of each page"""
+        start = time.perf_counter()
+        characters = sum(len(text) for content in pdfs for text in extract(content))
+        elapsed = time.perf_counter() - start
+        return {"seconds": elapsed, "pages_per_sec": files * pages / elapsed if elapsed else 0.0,
+                "extracted_characters": characters}
+
+    results = {"files": files, "pages_per_file": pages, "legacy_pypdf2": timed(lambda content: [legacy_extract_pdf(content)])}
+    for backend in available_backends():
+        for worker_count in sorted({1, workers}):
+            extractor = PDFExtractor(backend=backend, workers=worker_count, parallel_min_pages=1, cache_pages=0)
+            extractor.extract_pages(pdfs[0])  # start the worker pool outside the timing
+            results[f"{backend}_workers{worker_count}"] = timed(extractor.extract_pages)
+            extractor.shutdown()
+        # Re-extraction of files whose pages are all cached (re-uploads)
+        extractor = PDFExtractor(backend=backend, workers=1, cache_pages=files * pages)
+        for content in pdfs:
+            extractor.extract_pages(content)
+        results[f"{backend}_cached"] = timed(extractor.extract_pages)
+        extractor.shutdown()
+    return results
+
+
+def bench_memory(corpus: SyntheticCorpus, chunks: int, chunk_size: int) -> dict:
+    tracemalloc.start()
+    docs = corpus.documents(chunks, chunk_size)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "chunks": len(docs),
+        "corpus_bytes_traced": current,
+        "corpus_peak_bytes_traced": peak,
+        "bytes_per_chunk": current / len(docs) if docs else 0.0,
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def logged_questions(path: str, requests: int) -> list:
+    """Questions from a query log in the order they were asked, repeated to fill `requests`"""
+    logged = [entry["question"] for entry in iter_entries(path) if entry.get("question")]
+    if not logged:
+        raise SystemExit(f"No questions in query log {path}")
+    return [logged[i % len(logged)] for i in range(requests)]
+
+
+async def bench_chat(main, corpus: SyntheticCorpus, requests: int, concurrency: int, base_url: str = None,
+                     questions: list = None) -> dict:
+    questions = questions or corpus.questions(requests)
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url, timeout=60)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=60)
+
+    latencies = []
+    errors = 0
+    # Answers produced without a completion (configuration errors, shedding, the extractive fast path)
+    # would measure the server, not the chat path, so they count as errors too
+    non_llm = 0
+    shed = 0
+    queue = asyncio.Queue()
+    for question in questions:
+        queue.put_nowait(question)
+
+    async def worker():
+        nonlocal errors, non_llm, shed
+        while True:
+            try:
+                question = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.post("/chat", data={"question": question})
+                body = response.json()
+                shed += response.status_code == 503
+                if response.status_code != 200 or body.get("source") == "Error" or body.get("answer", "").startswith("Error"):
+                    errors += 1
+                elif body.get("mode") != "llm":
+                    non_llm += 1
+                    errors += 1
+            except (httpx.HTTPError, ValueError):
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    async with client:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(questions),
+        "concurrency": concurrency,
+        "errors": errors,
+        "non_llm_answers": non_llm,
+        "shed": shed,
+        "requests_per_sec": len(questions) / elapsed if elapsed else 0.0,
+        **summarize(latencies),
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark retrieval, ingestion and chat throughput")
+    parser.add_argument("--chunks", type=int, default=1000, help="synthetic chunks in the corpus (1k-1M)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="characters per chunk")
+    parser.add_argument("--queries", type=int, default=200, help="retrieval queries to time")
+    parser.add_argument("--fanouts", type=int, nargs="+", default=[10, 50, 200], help="two-stage fan-outs to compare")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32], help="micro-batch sizes to compare")
+    parser.add_argument("--fixtures", type=int, default=10, help="generated files per format for ingestion")
+    parser.add_argument("--pages", type=int, default=5, help="pages/slides/sections per generated file")
+    parser.add_argument("--pdf-files", type=int, default=3, help="large PDFs for the extractor comparison")
+    parser.add_argument("--pdf-pages", type=int, default=200)
+    parser.add_argument("--pdf-workers", type=int, default=4)
+    parser.add_argument("--chat-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--chat-corpus", type=int, default=200, help="documents uploaded before the chat benchmark")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--query-log", help="replay the questions of a query log in the chat benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", action="append", choices=SECTIONS, help="run only these sections")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<rev>-<time>.json)")
+    args = parser.parse_args(argv)
+    sections = args.only or list(SECTIONS)
+
+    main = load_app()
+    import config
+    revision = git_revision()
+    results = {
+        "revision": revision,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "stub_llm": {
+            "latency_ms": config.STUB_LLM_LATENCY_MS,
+            "jitter_ms": config.STUB_LLM_LATENCY_JITTER_MS,
+            "distribution": config.STUB_LLM_LATENCY_DISTRIBUTION,
+        },
+    }
+
+    if "retrieval" in sections:
+        corpus = SyntheticCorpus(seed=args.seed)
+        docs = corpus.documents(args.chunks, args.chunk_size)
+        results["retrieval"] = bench_retrieval(main, corpus, docs, args.queries)
+        results["retrieval"]["batched"] = bench_retrieval_batched(main, corpus, docs, args.queries, args.batch_sizes)
+        results["retrieval"]["two_stage"] = bench_two_stage(main, corpus, docs, args.queries, args.fanouts)
+        del docs
+        print(f"retrieval: p50={results['retrieval']['p50_ms']:.2f} ms p99={results['retrieval']['p99_ms']:.2f} ms")
+        for batch_size, stats in results["retrieval"]["batched"].items():
+            print(f"retrieval batch={batch_size}: {stats['queries_per_sec']:.1f} queries/sec")
+        for fanout, stats in results["retrieval"]["two_stage"].items():
+            recall = f" recall@3={stats['recall_at_3']:.3f}" if "recall_at_3" in stats else ""
+            print(f"retrieval fanout={fanout}: p50={stats['p50_ms']:.2f} ms{recall}")
+
+    if "ingest" in sections:
+        results["ingest"] = bench_ingest(main, SyntheticCorpus(seed=args.seed), args.fixtures, args.pages)
+        for file_type, stats in results["ingest"].items():
+            print(f"ingest {file_type}: {stats['docs_per_sec']:.1f} docs/sec")
+
+    if "pdf" in sections:
+        results["pdf"] = bench_pdf(SyntheticCorpus(seed=args.seed), args.pdf_files, args.pdf_pages, args.pdf_workers)
+        for name, stats in results["pdf"].items():
+            if isinstance(stats, dict):
+                print(f"pdf {name}: {stats['pages_per_sec']:.1f} pages/sec")
+
+    if "memory" in sections:
+        results["memory"] = bench_memory(SyntheticCorpus(seed=args.seed), args.chunks, args.chunk_size)
+        print(f"memory: {results['memory']['bytes_per_chunk']:.0f} bytes/chunk")
+
+    if "chat" in sections:
+        corpus = SyntheticCorpus(seed=args.seed)
+        default_corpus = asyncio.run(main.tenants.get(main.DEFAULT_TENANT)).corpus
+        for doc in corpus.documents(args.chat_corpus, args.chunk_size):
+            default_corpus.add({**doc, "keywords": main.document_keywords(doc["content"])})
+        questions = logged_questions(args.query_log, args.chat_requests) if args.query_log else None
+        results["chat"] = asyncio.run(bench_chat(main, corpus, args.chat_requests, args.concurrency, args.base_url, questions))
+        print(f"chat: {results['chat']['requests_per_sec']:.1f} req/sec p99={results['chat']['p99_ms']:.1f} ms")
+
+    output = args.output or os.path.join("benchmarks", "results", f"{revision}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,109 @@
+"""Query-focused context compression: keep the sentences that matter, within a token budget.
+
+Retrieved passages are split into sentences and every sentence is scored at once
+with NumPy: each question term is located in the lowercased text with one regex
+scan, its hits are mapped to sentence indexes with `searchsorted`, and a sentence
+scores the inverse sentence frequency of each distinct term it contains (so a rare
+product name counts for more than "server"), divided by a mild length penalty. The
+best sentences are kept until the budget is spent, then their neighbours, and
+returned in reading order with "..." marking the gaps, so the prompt grows with
+the question rather than with the documents.
+"""
+import re
+from typing import List, Tuple
+
+import numpy as np
+
+from services.chunking import sentence_spans
+
+CHARS_PER_TOKEN = 4
+# Sentence length (characters) at which the length penalty starts to matter
+_LENGTH_SCALE = 200.0
+_GAP = " ... "
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def compress_passages(question_words: List[str], passages: List[str], token_budget: int) -> Tuple[List[str], dict]:
+    """The passages cut down to their most query-relevant sentences, and the compression stats.
+
+    Passages already within `token_budget` together are returned unchanged. When no
+    sentence contains a question term, each passage keeps its leading sentences.
+    """
+    original = sum(estimate_tokens(passage) for passage in passages)
+    stats = {"original_tokens": original, "compressed_tokens": original, "ratio": 1.0}
+    if not passages or token_budget <= 0 or original <= token_budget:
+        return passages, stats
+
+    text = "\n\n".join(passages)
+    boundaries = np.cumsum([len(passage) + 2 for passage in passages])
+    spans = sentence_spans(text)
+    if not spans:
+        return passages, stats
+    starts = np.fromiter((start for start, _ in spans), dtype=np.int64, count=len(spans))
+    lengths = np.fromiter((end - start for start, end in spans), dtype=np.int64, count=len(spans))
+
+    text_lower = text.lower()
+    scores = np.zeros(len(spans), dtype=np.float64)
+    for term in dict.fromkeys(question_words):
+        offsets = np.fromiter((match.start() for match in re.finditer(re.escape(term), text_lower)), dtype=np.int64)
+        if not len(offsets):
+            continue
+        containing = np.unique(np.searchsorted(starts, offsets, side="right") - 1)
+        scores[containing] += np.log1p(len(spans) / len(containing))
+    scores /= 1.0 + np.log1p(lengths / _LENGTH_SCALE)
+
+    passage_of = np.searchsorted(boundaries, starts, side="right")
+    offset_in_passage = starts - np.concatenate(([0], boundaries[:-1]))[passage_of]
+    matched = bool(scores.any())
+    if matched:
+        # Best first, earlier sentences first among equals
+        order = np.lexsort((offset_in_passage, -scores))
+    else:
+        # Nothing matches: every passage keeps its opening sentences
+        order = np.lexsort((passage_of, offset_in_passage))
+    budget = token_budget * CHARS_PER_TOKEN
+    selected = []
+    for index in order:
+        if matched and scores[index] == 0:
+            break
+        if lengths[index] + len(_GAP) > budget:
+            continue
+        selected.append(index)
+        budget -= lengths[index] + len(_GAP)
+    if matched:
+        # Spend what is left on the sentences around the kept ones, best first, so they read in context
+        chosen = set(selected)
+        for index in list(selected):
+            for neighbour in (index - 1, index + 1):
+                if (0 <= neighbour < len(spans) and neighbour not in chosen and passage_of[neighbour] == passage_of[index]
+                        and lengths[neighbour] + 1 <= budget):
+                    chosen.add(neighbour)
+                    selected.append(neighbour)
+                    budget -= lengths[neighbour] + 1
+    if not selected:
+        # Every relevant sentence is longer than the budget: keep the start of the best one
+        index = order[0]
+        spans[index] = (spans[index][0], spans[index][0] + token_budget * CHARS_PER_TOKEN)
+        selected = [index]
+
+    compressed = [[] for _ in passages]
+    previous = {}
+    for index in sorted(selected):
+        passage = int(passage_of[index])
+        start, end = spans[index]
+        if compressed[passage]:
+            compressed[passage].append(" " if previous[passage] == index - 1 else _GAP)
+        compressed[passage].append(text[start:end])
+        previous[passage] = index
+    result = ["".join(parts) for parts in compressed]
+    kept = sum(estimate_tokens(passage) for passage in result if passage)
+    stats.update({
+        "compressed_tokens": kept,
+        "ratio": round(kept / original, 4),
+        "sentences_kept": len(selected),
+        "sentences_total": len(spans),
+    })
+    return result, stats
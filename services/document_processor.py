@@ -1,19 +1,32 @@
 import os
-from typing import List
+from typing import Dict, List
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
 from pinecone import Pinecone
 from dotenv import load_dotenv
 import uuid
+import time
+import numpy as np
+import config
+from services.chunking import chunk_sections
+from services.corpus import metadata_filter, top_keywords
+from services.tenants import summary_namespace
+from services.vector_store import VectorStore
 
 load_dotenv()
 
 class DocumentProcessor:
     def __init__(self):
-        self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-        self.index = self.pc.Index(os.getenv("PINECONE_INDEX"))
         # Use sentence transformer that outputs 1024 dimensions
         self.embeddings = SentenceTransformer('all-MiniLM-L6-v2')
+        # Local stores by tenant namespace, opened on first use
+        self.local = config.VECTOR_STORE == "local"
+        self.vector_stores: Dict[str, VectorStore] = {}
+        if self.local:
+            self.index = None
+        else:
+            self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+            self.index = self.pc.Index(os.getenv("PINECONE_INDEX"))
         
         # Split documents into chunks
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -22,37 +35,165 @@ class DocumentProcessor:
             length_function=len,
         )
     
-    def process_document(self, content: str, filename: str) -> dict:
+    @staticmethod
+    def vector_store_path(namespace: str = "") -> str:
+        return os.path.join(config.VECTOR_STORE_PATH, "tenants", namespace) if namespace else config.VECTOR_STORE_PATH
+    
+    def vector_store(self, namespace: str = "") -> VectorStore:
+        """The namespace's local store: mapped from disk if saved, else empty and sized for the embedding model"""
+        store = self.vector_stores.get(namespace)
+        if store is None:
+            path = self.vector_store_path(namespace)
+            if os.path.exists(os.path.join(path, "store.json")):
+                store = VectorStore.load(path, mmap=True)
+            else:
+                store = VectorStore(self.embeddings.get_sentence_embedding_dimension(),
+                                    config.VECTOR_QUANTIZATION, config.VECTOR_RESCORE_FACTOR)
+            self.vector_stores[namespace] = store
+        return store
+    
+    def split(self, content: str, sections: List[dict] = None):
+        """Chunk texts and their location metadata; structured sections are chunked along slides/pages/paragraphs"""
+        if not sections:
+            return [(chunk, {}) for chunk in self.text_splitter.split_text(content)]
+        text, spans = chunk_sections(sections, config.CHUNK_SIZE)
+        chunks = []
+        for span in spans:
+            location = {key: span[key][0] for key in ("slide", "page", "paragraph") if key in span}
+            location["section_kinds"] = span["kinds"]
+            chunks.append((text[span["start"]:span["end"]], location))
+        return chunks
+    
+    def save_vectors(self, namespace: str = ""):
+        """Append the local store's new vectors to disk"""
+        if self.local and namespace in self.vector_stores:
+            self.vector_stores[namespace].save(self.vector_store_path(namespace))
+    
+    def process_documents(self, documents: List[dict], namespace: str = "") -> List[dict]:
+        """`process_document` for each of a batch of documents (its keyword arguments), saving the local store once"""
+        try:
+            return [self.process_document(**document, namespace=namespace, save=False) for document in documents]
+        finally:
+            self.save_vectors(namespace)
+    
+    def process_document(self, content: str, filename: str, sections: List[dict] = None,
+                         file_type: str = None, tags: List[str] = None, namespace: str = "", save: bool = True,
+                         document_id: str = None) -> dict:
+        """Chunk, embed and index a document; `namespace` keeps each tenant's vectors apart.
+        
+        `document_id` ties the vectors to the caller's record of the upload (a new ID by default).
+        With `save=False` new local vectors stay in memory until `save_vectors` (see process_documents).
+        """
         try:
             # Split into chunks
-            chunks = self.text_splitter.split_text(content)
+            chunks = self.split(content, sections)
             
             # Generate embeddings and upload to Pinecone
+            uploaded_at = time.time()
+            # Files are not unique by name (same name, or a re-upload after an edit), so each upload gets its own ID
+            document_id = document_id or str(uuid.uuid4())
+            document_metadata = {
+                "document_id": document_id,
+                "filename": filename,
+                "file_type": file_type or filename.lower().rsplit(".", 1)[-1],
+                "tags": [tag.lower() for tag in tags or []],
+                "uploaded_at": uploaded_at,
+            }
             vectors = []
-            for i, chunk in enumerate(chunks):
+            embeddings = []
+            for i, (chunk, location) in enumerate(chunks):
                 chunk_id = f"{filename}_{i}_{str(uuid.uuid4())[:8]}"
-                embedding = self.embeddings.encode(chunk).tolist()
+                embedding = self.embeddings.encode(chunk)
+                embeddings.append(embedding)
                 
                 vectors.append({
                     "id": chunk_id,
-                    "values": embedding,
+                    "values": embedding.tolist(),
                     "metadata": {
                         "content": chunk,
-                        "filename": filename,
-                        "chunk_index": i
+                        **document_metadata,
+                        "chunk_index": i,
+                        **location
                     }
                 })
             
+            if self.local:
+                # Local store: chunk vectors only; the two-stage summaries live in Pinecone
+                if embeddings:
+                    self.vector_store(namespace).add(np.stack(embeddings), [v["id"] for v in vectors],
+                                                     [v["metadata"] for v in vectors])
+                    if save:
+                        self.save_vectors(namespace)
+                return {
+                    "status": "success",
+                    "chunks_processed": len(chunks),
+                    "filename": filename,
+                    "document_id": document_id
+                }
+            
             # Upload to Pinecone
-            self.index.upsert(vectors)
+            self.index.upsert(vectors, namespace=namespace)
+            
+            # Document summary for the coarse retrieval stage: normalized centroid of the chunk vectors plus top keywords
+            if embeddings:
+                centroid = np.mean(embeddings, axis=0)
+                centroid /= np.linalg.norm(centroid) or 1.0
+                self.index.upsert([{
+                    "id": f"{document_id}_summary",
+                    "values": centroid.tolist(),
+                    "metadata": {
+                        **document_metadata,
+                        "chunks": len(chunks),
+                        "keywords": top_keywords(content, config.KEYWORDS_PER_DOCUMENT)
+                    }
+                }], namespace=summary_namespace(namespace))
             
             return {
                 "status": "success",
                 "chunks_processed": len(chunks),
-                "filename": filename
+                "filename": filename,
+                "document_id": document_id
             }
             
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
+    def delete_document(self, filename: str = None, filters: dict = None, namespace: str = "",
+                        document_id: str = None) -> dict:
+        """Delete the vectors of one upload (`document_id`), of every file with a name, or matching /chat-style filters.
+        
+        Pinecone tombstones deleted vectors and reclaims them itself, so this returns immediately.
+        """
+        try:
+            if filename:
+                filters = {**(filters or {}), "filename": [filename]}
+            if document_id:
+                filters = {**(filters or {}), "document_id": [document_id]}
+            vector_filter = metadata_filter(filters)
+            if not vector_filter:
+                return {"status": "error", "message": "Refusing to delete without a filename or filter"}
+            if self.local:
+                store = self.vector_store(namespace)
+                deleted = store.delete(np.flatnonzero(store.rows_matching(filters)).tolist())
+                self.save_vectors(namespace)
+                return {"status": "success", "filter": vector_filter, "vectors_deleted": deleted}
+            self.index.delete(filter=vector_filter, namespace=namespace)
+            self.index.delete(filter=vector_filter, namespace=summary_namespace(namespace))
+            return {"status": "success", "filter": vector_filter}
+            
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    def search(self, question: str, top_k: int = 3, filters: dict = None, namespace: str = "") -> List[dict]:
+        """Chunks most similar to the question, as {"id", "score", "metadata"} dicts from either store"""
+        embedding = self.embeddings.encode(question)
+        if self.local:
+            store = self.vector_store(namespace)
+            mask = store.rows_matching(filters) if filters else None
+            return [{key: hit[key] for key in ("id", "score", "metadata")}
+                    for hit in store.search(embedding, top_k, mask)]
+        results = self.index.query(vector=embedding.tolist(), top_k=top_k, include_metadata=True,
+                                   filter=metadata_filter(filters) or None, namespace=namespace)
+        return [{"id": match.id, "score": match.score, "metadata": match.metadata} for match in results.matches]
+
 doc_processor = DocumentProcessor()
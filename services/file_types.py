@@ -0,0 +1,51 @@
+import zipfile
+import io
+from typing import Optional
+
+from services.legacy_office import compound_file_streams, is_compound_file
+from services.mail_extraction import detect_mail_type
+
+
+def detect_file_type(content: bytes, filename: str = "") -> Optional[str]:
+    """Identify an upload by its leading bytes, using the extension only for plain text.
+
+    Returns one of txt, pdf, docx, pptx, doc, ppt, eml or mbox, or None if unsupported.
+    """
+    head = content[:1024]
+    if b"%PDF-" in head:
+        return "pdf"
+
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            names = set(zipfile.ZipFile(io.BytesIO(content)).namelist())
+        except zipfile.BadZipFile:
+            return None
+        if "word/document.xml" in names:
+            return "docx"
+        if "ppt/presentation.xml" in names:
+            return "pptx"
+        return None
+
+    if is_compound_file(head):
+        streams = compound_file_streams(content) or {}
+        if "WordDocument" in streams:
+            return "doc"
+        if "PowerPoint Document" in streams:
+            return "ppt"
+        return None
+
+    mail_type = detect_mail_type(head, filename)
+    if mail_type:
+        return mail_type
+
+    extension = filename.lower().rsplit(".", 1)[-1] if "." in filename else ""
+    if extension == "txt":
+        return "txt"
+    # Misnamed or extensionless text still goes down the text path
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character may be cut off at the end of the sample
+        if e.start < len(head) - 3:
+            return None
+    return "txt" if b"\x00" not in head else None
@@ -0,0 +1,101 @@
+"""Structured extraction for .docx and .pptx files.
+
+Each extractor walks the document once and emits sections in reading order:
+dicts with the section `kind`, its `text`, and where it came from (`paragraph`
+index for Word, `slide` number for PowerPoint), which the chunker uses directly.
+Word covers body paragraphs and tables in document order plus headers and
+footers; PowerPoint covers text frames, tables and grouped shapes on every
+slide, followed by that slide's speaker notes.
+"""
+import io
+from typing import Iterator, List
+
+import docx
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+
+def _table_text(rows) -> str:
+    lines = []
+    for row in rows:
+        cells = []
+        for cell in row:
+            text = cell.text.strip()
+            # Merged cells are reported once per grid column they span
+            if text and (not cells or cells[-1] != text):
+                cells.append(text)
+        if cells:
+            lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+
+def _docx_table_rows(table: Table):
+    for row in table.rows:
+        yield row.cells
+
+
+def _docx_block_sections(parent, document, kind_prefix: str = "") -> Iterator[dict]:
+    """Paragraphs and tables of a body, header or footer in document order"""
+    paragraph_index = 0
+    heading = None
+    for element in parent.iterchildren():
+        if element.tag == qn("w:p"):
+            paragraph = Paragraph(element, document)
+            text = paragraph.text.strip()
+            style = paragraph.style.name if paragraph.style is not None else ""
+            if text and style.startswith(("Heading", "Title")):
+                heading = text
+            if text:
+                yield {"kind": kind_prefix or "paragraph", "text": text, "paragraph": paragraph_index, "heading": heading}
+            paragraph_index += 1
+        elif element.tag == qn("w:tbl"):
+            text = _table_text(_docx_table_rows(Table(element, document)))
+            if text:
+                yield {"kind": kind_prefix or "table", "text": text, "paragraph": paragraph_index, "heading": heading}
+
+
+def docx_sections(file_content: bytes) -> List[dict]:
+    document = docx.Document(io.BytesIO(file_content))
+    sections = list(_docx_block_sections(document.element.body, document))
+
+    # Headers and footers are usually repeated across sections; keep each distinct one once
+    seen = set()
+    for section in document.sections:
+        for kind, part in (("header", section.header), ("footer", section.footer)):
+            if part.is_linked_to_previous:
+                continue
+            for block in _docx_block_sections(part._element, part, kind):
+                if block["text"] not in seen:
+                    seen.add(block["text"])
+                    sections.append(block)
+    return sections
+
+
+def _shape_sections(shapes, slide_number: int) -> Iterator[dict]:
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from _shape_sections(shape.shapes, slide_number)
+        elif getattr(shape, "has_table", False) and shape.has_table:
+            text = _table_text(row.cells for row in shape.table.rows)
+            if text:
+                yield {"kind": "table", "text": text, "slide": slide_number}
+        elif getattr(shape, "has_text_frame", False) and shape.has_text_frame:
+            text = shape.text_frame.text.strip()
+            if text:
+                yield {"kind": "slide", "text": text, "slide": slide_number}
+
+
+def pptx_sections(file_content: bytes) -> List[dict]:
+    presentation = Presentation(io.BytesIO(file_content))
+    sections = []
+    for slide_number, slide in enumerate(presentation.slides, start=1):
+        sections.extend(_shape_sections(slide.shapes, slide_number))
+        if slide.has_notes_slide:
+            notes = slide.notes_slide.notes_text_frame
+            text = notes.text.strip() if notes is not None else ""
+            if text:
+                sections.append({"kind": "notes", "text": text, "slide": slide_number})
+    return sections
@@ -0,0 +1,194 @@
+"""In-process diagnostics: a sampling profiler, an event-loop lag monitor and per-route allocation stats.
+
+All three are off until switched on (the admin endpoints in main.py, or
+LOOP_LAG_MONITOR for the lag monitor) and cost nothing while off.
+
+- SamplingProfiler samples every thread's stack from a background thread and returns
+  collapsed stacks ("frame;frame;frame count" lines), the input format of
+  flamegraph.pl, speedscope and inferno.
+- LoopLagMonitor ticks a heartbeat on the event loop; a watchdog thread that sees the
+  heartbeat stall past the threshold logs the loop thread's stack at that moment,
+  which names the blocking callback (a sync extractor, a sync client call, GC...).
+- AllocationTracker runs tracemalloc and attributes the traced-memory growth of each
+  request to its route. Concurrent requests overlap, so per-route figures are
+  indicative; the top allocation sites since start are exact.
+"""
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Deque, Dict, List, Optional
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Root-first, semicolon-separated frames of a stack"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def format_stack(frame, limit: int = 30) -> str:
+    labels = []
+    while frame is not None and len(labels) < limit:
+        labels.append(f"  {_frame_label(frame)}")
+        frame = frame.f_back
+    return "\n".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Statistical profiler over all threads (or one); one profile runs at a time"""
+
+    def __init__(self):
+        self.running = False
+
+    def _sample(self, duration: float, interval: float, thread_id: Optional[int], counts: collections.Counter):
+        own = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (thread_id is not None and ident != thread_id):
+                    continue
+                counts[f"{thread_names.get(ident, ident)};{collapse_stack(frame)}"] += 1
+            time.sleep(interval)
+
+    async def profile(self, seconds: float, interval: float = 0.005, thread_id: Optional[int] = None) -> str:
+        """Sample for `seconds` without blocking the event loop; returns collapsed stacks"""
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        self.running = True
+        counts = collections.Counter()
+        try:
+            await asyncio.to_thread(self._sample, seconds, interval, thread_id, counts)
+        finally:
+            self.running = False
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class LoopLagMonitor:
+    """Logs the event loop's stack whenever a callback blocks it for longer than `threshold`"""
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.02, history: int = 50):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: Deque[dict] = collections.deque(maxlen=history)
+        self._loop_thread: Optional[int] = None
+        self._last_beat = 0.0
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            metrics.EVENT_LOOP_LAG.observe(max(0.0, now - expected))
+            self._last_beat = now
+
+    def _watch(self, stopped: threading.Event):
+        reported = False
+        while not stopped.wait(self.interval):
+            blocked = time.perf_counter() - self._last_beat - self.interval
+            if blocked < self.threshold:
+                reported = False
+                continue
+            if reported:
+                # Same stall: keep its duration current
+                self.stalls[-1]["blocked_ms"] = round(blocked * 1000, 1)
+                continue
+            # Report each stall once, with the stack that is blocking the loop right now
+            reported = True
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = format_stack(frame) if frame is not None else ""
+            self.stalls.append({"at": time.time(), "blocked_ms": round(blocked * 1000, 1), "stack": stack})
+            metrics.EVENT_LOOP_STALLS.inc()
+            logger.warning(f"Event loop blocked for {blocked * 1000:.0f} ms (threshold {self.threshold * 1000:.0f} ms) in:\n{stack}")
+
+    def start(self):
+        """Start monitoring the running event loop"""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        # A fresh event per run, so a previous watchdog that has not noticed its stop yet still exits
+        self._stopped = threading.Event()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, args=(self._stopped,), name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stopped.set()
+
+
+class AllocationTracker:
+    """tracemalloc-based allocation stats, attributed per route"""
+
+    def __init__(self):
+        self.routes: Dict[str, dict] = {}
+        self._baseline = None
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10):
+        if not self.running:
+            tracemalloc.start(frames)
+        self.routes = {}
+        self._baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        tracemalloc.stop()
+        self._baseline = None
+
+    def begin(self) -> int:
+        return tracemalloc.get_traced_memory()[0]
+
+    def record(self, route: str, started_at: int):
+        growth = tracemalloc.get_traced_memory()[0] - started_at
+        stats = self.routes.setdefault(route, {"requests": 0, "net_bytes": 0, "max_bytes": 0})
+        stats["requests"] += 1
+        stats["net_bytes"] += growth
+        stats["max_bytes"] = max(stats["max_bytes"], growth)
+
+    def report(self, limit: int = 20) -> dict:
+        """Per-route growth plus the allocation sites that grew most since start"""
+        current, peak = tracemalloc.get_traced_memory() if self.running else (0, 0)
+        top: List[dict] = []
+        if self.running and self._baseline is not None:
+            for stat in tracemalloc.take_snapshot().compare_to(self._baseline, "lineno")[:limit]:
+                frame = stat.traceback[0]
+                top.append({"site": f"{frame.filename}:{frame.lineno}", "size_diff": stat.size_diff,
+                            "count_diff": stat.count_diff, "size": stat.size})
+        routes = {route: {**stats, "mean_bytes": stats["net_bytes"] // max(stats["requests"], 1)}
+                  for route, stats in sorted(self.routes.items(), key=lambda item: -item[1]["net_bytes"])}
+        return {"tracing": self.running, "traced_bytes": current, "peak_bytes": peak, "routes": routes, "top_sites": top}
+
+
+profiler = SamplingProfiler()
+loop_monitor = LoopLagMonitor(threshold=config.LOOP_LAG_THRESHOLD_MS / 1000.0)
+allocations = AllocationTracker()
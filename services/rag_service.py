@@ -1,47 +1,153 @@
 import os
+import asyncio
 from dotenv import load_dotenv
-from openai import OpenAI
+import httpx
+from openai import OpenAI, AsyncOpenAI
 from pinecone import Pinecone
 from langchain_openai import OpenAIEmbeddings
+import config
+from services.batching import MicroBatcher
+from services.two_stage import asearch_chunks, search_chunks
 
 load_dotenv()
 
+SYSTEM_PROMPT = "You are a helpful knowledge assistant that answers questions based on provided context."
+
+def build_prompt(question: str, matches) -> str:
+    context = ""
+    if matches:
+        context = "\n\n".join([match.metadata["content"] for match in matches])
+    
+    if context:
+        return f"Based on the following context, answer the question. If the answer is not in the context, say so.\n\nContext:\n{context}\n\nQuestion: {question}\n\nAnswer:"
+    return f"No relevant documents found. Please answer this general question: {question}"
+
 class RAGService:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = OpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL)
         self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
         self.index = self.pc.Index(os.getenv("PINECONE_INDEX"))
-        self.embeddings = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+        self.embeddings = OpenAIEmbeddings(openai_api_key=config.OPENAI_API_KEY, openai_api_base=config.OPENAI_BASE_URL)
+        # Async clients are created on first use, inside the event loop, and shared by every aquery
+        self._async_http = None
+        self._async_client = None
+        self._async_index = None
+        self._async_lock = asyncio.Lock()
+        # Concurrent aquery calls share one embedding request per window
+        self._retrieval_batcher = MicroBatcher(
+            self._aretrieve_batch,
+            window=config.RETRIEVAL_BATCH_WINDOW_MS / 1000.0,
+            max_batch=config.RETRIEVAL_BATCH_MAX,
+            name="rag_retrieval"
+        )
         
-    def query(self, question: str) -> str:
+    async def _async_clients(self):
+        async with self._async_lock:
+            if self._async_client is None:
+                # One connection pool per worker; concurrency is bounded by the pool sizes, not by threads
+                self._async_http = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=config.RAG_HTTP_POOL_SIZE,
+                                        max_keepalive_connections=config.RAG_HTTP_POOL_SIZE),
+                    timeout=httpx.Timeout(config.RAG_REQUEST_TIMEOUT_S)
+                )
+                self._async_client = AsyncOpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL,
+                                                 http_client=self._async_http, timeout=config.RAG_REQUEST_TIMEOUT_S)
+                host = os.getenv("PINECONE_HOST")
+                if not host:
+                    # describe_index is a blocking HTTP call
+                    description = await asyncio.to_thread(self.pc.describe_index, os.getenv("PINECONE_INDEX"))
+                    host = description.host
+                self._async_index = self.pc.IndexAsyncio(host=host, connection_pool_maxsize=config.RAG_VECTOR_POOL_SIZE)
+        return self._async_client, self._async_index
+    
+    def query(self, question: str, filters: dict = None, namespace: str = "") -> str:
+        """Answer from the vectors of one tenant `namespace` (see services.tenants.vector_namespace)"""
         try:
             question_embedding = self.embeddings.embed_query(question)
-            results = self.index.query(
-                vector=question_embedding,
-                top_k=3,
-                include_metadata=True
+            matches = search_chunks(self.index, question_embedding, filters, namespace)
+            
+            prompt = build_prompt(question, matches)
+            
+            response = self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=300
             )
+            return response.choices[0].message.content
             
-            context = ""
-            if results.matches:
-                context = "\n\n".join([match.metadata["content"] for match in results.matches])
+        except Exception as e:
+            return f"Error: {str(e)}"
+    
+    async def _aretrieve_batch(self, requests):
+        """Matches for a batch of (question, filters, namespace): one embedding call, vector queries in parallel"""
+        client, index = await self._async_clients()
+        embeddings = await client.embeddings.create(model=self.embeddings.model,
+                                                    input=[question for question, _, _ in requests])
+        vectors = [item.embedding for item in sorted(embeddings.data, key=lambda item: item.index)]
+        
+        return await asyncio.wait_for(
+            asyncio.gather(*[asearch_chunks(index, vector, filters, namespace)
+                             for vector, (_, filters, namespace) in zip(vectors, requests)]),
+            timeout=config.RAG_REQUEST_TIMEOUT_S
+        )
+    
+    async def aquery(self, question: str, filters: dict = None, namespace: str = "") -> str:
+        """Non-blocking `query`; cancelling the task (e.g. via run_until_disconnected) aborts the in-flight call"""
+        try:
+            client, _ = await self._async_clients()
+            matches = await self._retrieval_batcher.submit((question, filters, namespace))
             
-            if context:
-                prompt = f"Based on the following context, answer the question. If the answer is not in the context, say so.\n\nContext:\n{context}\n\nQuestion: {question}\n\nAnswer:"
-            else:
-                prompt = f"No relevant documents found. Please answer this general question: {question}"
+            prompt = build_prompt(question, matches)
             
-            response = self.client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
-                    {"role": "system", "content": "You are a helpful knowledge assistant that answers questions based on provided context."},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=300
             )
             return response.choices[0].message.content
             
+        except asyncio.TimeoutError:
+            return f"Error: vector query timed out after {config.RAG_REQUEST_TIMEOUT_S} s"
         except Exception as e:
             return f"Error: {str(e)}"
+    
+    async def astream(self, question: str, filters: dict = None, namespace: str = ""):
+        """`aquery` yielding the answer as it is generated"""
+        try:
+            client, _ = await self._async_clients()
+            matches = await self._retrieval_batcher.submit((question, filters, namespace))
+            
+            prompt = build_prompt(question, matches)
+            
+            response = await client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=300,
+                stream=True
+            )
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            
+        except asyncio.TimeoutError:
+            yield f"Error: vector query timed out after {config.RAG_REQUEST_TIMEOUT_S} s"
+        except Exception as e:
+            yield f"Error: {str(e)}"
+    
+    async def aclose(self):
+        """Release the async connection pools (call from the app's shutdown hook)"""
+        if self._async_client is not None:
+            await self._async_index.close()
+            await self._async_http.aclose()
+            self._async_http = self._async_client = self._async_index = None
 
 rag_service = RAGService()
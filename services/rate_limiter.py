@@ -0,0 +1,236 @@
+"""Client-side rate limiting for LLM provider calls.
+
+Completions wait in a priority queue until both the requests-per-minute and
+tokens-per-minute buckets have room (a limit of 0 means unlimited). 429s, transient
+5xx errors, timeouts and connection failures are retried with jittered exponential
+backoff, honoring Retry-After, and each 429 halves the rate the limiter allows
+(recovering gradually on success). When the estimated
+queue wait exceeds the SLO, new work is rejected immediately with Overloaded.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_RETRY = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 10
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _transient_errors() -> tuple:
+    """Timeouts and connection failures of either OpenAI client, which carry no HTTP status"""
+    errors = [asyncio.TimeoutError]
+    try:
+        import openai
+    except ImportError:
+        return tuple(errors)
+    for module in (getattr(openai, "error", None), openai):
+        for name in ("Timeout", "APIConnectionError", "ServiceUnavailableError", "APITimeoutError"):
+            error = getattr(module, name, None)
+            if isinstance(error, type) and issubclass(error, Exception) and error not in errors:
+                errors.append(error)
+    return tuple(errors)
+
+
+TRANSIENT_ERRORS = _transient_errors()
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing when the wait would exceed the latency SLO"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM queue is full, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """A rate of 0 means unlimited: the bucket never makes anyone wait"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.unlimited = rate_per_second <= 0
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken; requests larger than the bucket wait for a full bucket"""
+        if self.unlimited:
+            return 0.0
+        self.refill(now)
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate) if self.rate > 0 else float("inf")
+
+    def backlog_wait(self, amount: float) -> float:
+        """Seconds until `amount` beyond the current level has refilled (after `refill`)"""
+        if self.unlimited:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.level -= amount
+
+
+def status_of(exc: Exception) -> Optional[int]:
+    """HTTP status of a provider error from either the legacy or the v1 OpenAI client"""
+    status = getattr(exc, "http_status", None) or getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def retry_after_of(exc: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait, from Retry-After / retry-after-ms headers"""
+    headers = getattr(exc, "headers", None) or getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class RateLimiter:
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int, queue_slo: float,
+                 max_retries: int = 4, backoff_base: float = 0.5, backoff_max: float = 20.0):
+        # Providers enforce quotas over short windows, so only allow a 10 second burst
+        self.base_tpm = tokens_per_minute
+        self.base_rpm = requests_per_minute
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, max(1.0, tokens_per_minute / 6.0))
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 6.0))
+        self.queue_slo = queue_slo
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_scale = 1.0
+        self.paused_until = 0.0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._queued_tokens = 0
+        self._wakeup = None
+        self._dispatcher = None
+        metrics.LLM_RATE_SCALE.set(self.rate_scale)
+
+    def _set_scale(self, scale: float):
+        now = time.monotonic()
+        self.tokens.refill(now)
+        self.requests.refill(now)
+        self.rate_scale = max(0.1, min(1.0, scale))
+        self.tokens.rate = self.base_tpm / 60.0 * self.rate_scale
+        self.requests.rate = self.base_rpm / 60.0 * self.rate_scale
+        metrics.LLM_RATE_SCALE.set(self.rate_scale)
+
+    def _delay_for(self, tokens: int, now: float) -> float:
+        return max(self.paused_until - now, self.tokens.time_until(tokens, now), self.requests.time_until(1, now))
+
+    def estimated_wait(self, tokens: int) -> float:
+        """Seconds a new request would wait behind everything already queued"""
+        now = time.monotonic()
+        self.tokens.refill(now)
+        self.requests.refill(now)
+        token_wait = self.tokens.backlog_wait(self._queued_tokens + tokens)
+        request_wait = self.requests.backlog_wait(len(self._queue) + 1)
+        return max(0.0, self.paused_until - now, token_wait, request_wait)
+
+    def admit(self, tokens: int):
+        """Raise Overloaded if a request of this size would wait longer than the SLO"""
+        wait = self.estimated_wait(tokens)
+        if wait > self.queue_slo:
+            metrics.LLM_SHED.inc()
+            raise Overloaded(wait)
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE):
+        """Wait for capacity for one request of roughly `tokens` tokens"""
+        if priority != PRIORITY_RETRY:
+            self.admit(tokens)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), tokens, future))
+        self._queued_tokens += tokens
+        metrics.LLM_QUEUE_DEPTH.set(len(self._queue))
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+        start = time.perf_counter()
+        try:
+            await future
+        finally:
+            self._queued_tokens -= tokens
+            metrics.LLM_QUEUE_WAIT.observe(time.perf_counter() - start)
+
+    async def _dispatch(self):
+        """Grant queued requests in priority order as the buckets refill"""
+        while self._queue:
+            _, _, tokens, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            delay = self._delay_for(tokens, time.monotonic())
+            if delay > 0:
+                # Wake early if a higher-priority request arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._queue)
+            self.tokens.take(tokens)
+            self.requests.take(1)
+            future.set_result(None)
+        metrics.LLM_QUEUE_DEPTH.set(0)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """Charge the difference between the estimate and the provider-reported usage"""
+        self.tokens.take(actual_tokens - estimated_tokens)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter, but never sooner than the provider asked for
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def call(self, fn: Callable[[], Awaitable], tokens: int, priority: int = PRIORITY_INTERACTIVE):
+        """Run a provider call under the limiter, retrying throttled and transient failures"""
+        attempt = 0
+        while True:
+            await self.acquire(tokens, priority)
+            try:
+                result = await fn()
+            except Exception as e:
+                status = status_of(e)
+                retryable = status in RETRYABLE_STATUSES or isinstance(e, TRANSIENT_ERRORS)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                retry_after = retry_after_of(e)
+                if status == 429:
+                    self._set_scale(self.rate_scale / 2)
+                    if retry_after:
+                        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                delay = self._backoff(attempt, retry_after)
+                metrics.LLM_RETRIES.labels(str(status or type(e).__name__)).inc()
+                logger.warning(f"LLM call failed with {status or type(e).__name__}, retry {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                priority = PRIORITY_RETRY
+                continue
+            if self.rate_scale < 1.0:
+                self._set_scale(self.rate_scale + 0.05)
+            return result
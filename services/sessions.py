@@ -0,0 +1,111 @@
+import asyncio
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Set
+
+
+def first_sentence(text: str, max_chars: int = 200) -> str:
+    match = re.match(r"(.+?[.!?])(\s|$)", text.strip(), re.S)
+    sentence = match.group(1) if match else text.strip()
+    return sentence[:max_chars]
+
+
+class ChatSession:
+    """Server-side state for one conversation: bounded history plus cached retrieval"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.history: List[dict] = []
+        self.summary = ""
+        self.turns = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+        # Retrieval cache, valid for one corpus version and metadata filter: query term -> matching document positions
+        self.retrieval_scope: Optional[Hashable] = None
+        self.term_matches: Dict[str, Set[int]] = {}
+        self.last_documents: List[int] = []
+
+    def retrieval_cache(self, scope: Hashable) -> Dict[str, Set[int]]:
+        """Cached term matches, dropped when the corpus or filter (`scope`) has changed since they were computed"""
+        if self.retrieval_scope != scope:
+            self.retrieval_scope = scope
+            self.term_matches = {}
+            self.last_documents = []
+        return self.term_matches
+
+    def messages(self) -> List[dict]:
+        """Prior conversation as chat messages, summary first"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        for turn in self.history:
+            messages.append({"role": "user", "content": turn["question"]})
+            messages.append({"role": "assistant", "content": turn["answer"]})
+        return messages
+
+
+class SessionStore:
+    """LRU-bounded set of chat sessions that expire after a period of inactivity"""
+
+    def __init__(self, max_sessions: int, ttl_seconds: float, history_token_budget: int,
+                 count_tokens: Callable[[str], int] = lambda text: len(text) // 4):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.history_token_budget = history_token_budget
+        self.count_tokens = count_tokens
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def create(self, session_id: str = None) -> ChatSession:
+        session = ChatSession(session_id or uuid.uuid4().hex)
+        self._sessions[session.session_id] = session
+        self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.monotonic() - session.last_used > self.ttl_seconds:
+            del self._sessions[session_id]
+            return None
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def get_or_create(self, session_id: str) -> ChatSession:
+        return self.get(session_id) or self.create(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - oldest.last_used > self.ttl_seconds:
+                del self._sessions[oldest_id]
+            else:
+                break
+
+    def record_turn(self, session: ChatSession, question: str, answer: str):
+        """Append a turn, folding the oldest turns into the summary once over the token budget"""
+        session.history.append({"question": question, "answer": answer})
+        session.turns += 1
+        while len(session.history) > 1 and self._history_tokens(session) > self.history_token_budget:
+            oldest = session.history.pop(0)
+            folded = f"Q: {first_sentence(oldest['question'])} A: {first_sentence(oldest['answer'])}"
+            session.summary = f"{session.summary} {folded}".strip()
+        # The summary itself gets about a quarter of the budget (~4 characters per token)
+        max_summary_chars = self.history_token_budget
+        if len(session.summary) > max_summary_chars:
+            session.summary = "..." + session.summary[-max_summary_chars:]
+
+    def _history_tokens(self, session: ChatSession) -> int:
+        return self.count_tokens(session.summary) + sum(
+            self.count_tokens(turn["question"]) + self.count_tokens(turn["answer"]) for turn in session.history
+        )
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,131 @@
+import asyncio
+import re
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form used to decide whether two questions are the same"""
+    return re.sub(r"\s+", " ", question.lower()).strip(" .,!?")
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key.
+
+    The call runs as its own task, so a caller that disconnects does not cancel
+    it for the others still waiting on the result.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """Run `fn` unless a call for `key` is already running; returns (result, shared)"""
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class TokenBroadcast:
+    """Fan out one token stream to any number of subscribers.
+
+    Tokens are buffered for the lifetime of the stream, so a subscriber that
+    joins late replays what it missed before following the live tokens.
+    """
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for token in source:
+                self.tokens.append(token)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.tokens):
+                yield self.tokens[position]
+                position += 1
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+            if changed is self._changed:
+                await changed.wait()
+
+
+class StreamingSingleFlight:
+    """Single-flight for streamed answers: concurrent callers share one TokenBroadcast"""
+
+    def __init__(self):
+        self._streams: Dict[Hashable, TokenBroadcast] = {}
+
+    def join(self, key: Hashable, start: Callable[[], AsyncIterator[str]]) -> Tuple[TokenBroadcast, bool]:
+        """Return the running broadcast for `key`, starting one if needed; returns (broadcast, shared)"""
+        broadcast = self._streams.get(key)
+        if broadcast is not None and not broadcast.done:
+            return broadcast, True
+        broadcast = TokenBroadcast(start())
+        self._streams[key] = broadcast
+        broadcast.task.add_done_callback(lambda _: self._forget(key, broadcast))
+        return broadcast, False
+
+    def _forget(self, key: Hashable, broadcast: TokenBroadcast):
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+    def __len__(self):
+        return len(self._streams)
+
+
+async def wait_for_disconnect(request):
+    """Return once the client of a request whose body has been read goes away"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def run_until_disconnected(request, awaitable: Awaitable):
+    """Await `awaitable`, cancelling it if the HTTP client goes away first.
+
+    Starlette keeps running a handler after its client disconnects; this stops the
+    retrieval and completion work instead of finishing an answer nobody reads (shared
+    calls are shielded, so only this caller's wait is cancelled). The request body
+    must already have been read. Returns None when the client disconnected.
+    """
+    task = asyncio.ensure_future(awaitable)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        return None
+    finally:
+        for pending in (task, disconnect):
+            if not pending.done():
+                pending.cancel()
@@ -0,0 +1,171 @@
+"""Single-file snapshots of the in-memory corpus and its indexes.
+
+Layout (all integers little-endian):
+
+    magic "TKBSNAP\\0" | format version u32 | reserved u32 | table length u64 | reserved u64
+    table: JSON {"created_at", "metadata", "sections": {name: [offset, length, crc32]}}
+    sections, each starting on a 64-byte boundary
+
+Sections are raw byte ranges, so a reader maps the file and slices it: arrays can
+be viewed in place (array/numpy frombuffer) and nothing is parsed until it is used.
+Files are written to a temporary name and renamed, so a copied or concurrently
+read snapshot is never half-written. Readers reject newer major format versions.
+
+    python -m services.snapshot info snapshots/corpus.tkbsnap --verify
+    python -m services.snapshot create --url http://127.0.0.1:8000 --token $ADMIN_TOKEN
+    python -m services.snapshot restore --url http://127.0.0.1:8000 --token $ADMIN_TOKEN
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Dict, Optional
+
+from services.corpus import Corpus
+
+MAGIC = b"TKBSNAP\x00"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sIIQQ")
+_ALIGNMENT = 64
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def write_snapshot(path: str, sections: Dict[str, bytes], metadata: dict = None) -> dict:
+    """Write named sections to `path` atomically; returns the section table"""
+    table = {"created_at": time.time(), "format_version": FORMAT_VERSION, "metadata": metadata or {}, "sections": {}}
+    # Offsets depend on the table's own length, so lay it out with placeholder offsets first
+    for name, data in sections.items():
+        table["sections"][name] = [0, len(data), zlib.crc32(data)]
+    while True:
+        encoded = json.dumps(table).encode()
+        offset = _aligned(_HEADER.size + len(encoded))
+        layout = {}
+        for name, data in sections.items():
+            layout[name] = [offset, len(data), table["sections"][name][2]]
+            offset = _aligned(offset + len(data))
+        if layout == table["sections"]:
+            break
+        table["sections"] = layout
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp-{os.getpid()}"
+    with open(temporary, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(encoded), 0))
+        f.write(encoded)
+        for name, data in sections.items():
+            f.write(b"\0" * (table["sections"][name][0] - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return table
+
+
+class Snapshot:
+    """A memory-mapped snapshot file; `sections` are zero-copy views into the mapping"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            self._file.close()
+            raise SnapshotError(f"Empty snapshot file: {path}") from e
+        view = memoryview(self._map)
+        if len(view) < _HEADER.size:
+            raise SnapshotError(f"Truncated snapshot: {path}")
+        magic, version, _, table_length, _ = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise SnapshotError(f"Not a snapshot file: {path}")
+        if version > FORMAT_VERSION:
+            raise SnapshotError(f"Snapshot format {version} is newer than supported ({FORMAT_VERSION})")
+        self.table = json.loads(bytes(view[_HEADER.size:_HEADER.size + table_length]))
+        self.sections = {}
+        for name, (offset, length, _) in self.table["sections"].items():
+            if offset + length > len(view):
+                raise SnapshotError(f"Truncated snapshot section {name}: {path}")
+            self.sections[name] = view[offset:offset + length]
+
+    @property
+    def metadata(self) -> dict:
+        return self.table["metadata"]
+
+    def verify(self):
+        for name, (_, _, checksum) in self.table["sections"].items():
+            if zlib.crc32(self.sections[name]) != checksum:
+                raise SnapshotError(f"Checksum mismatch in section {name}: {self.path}")
+
+    def close(self):
+        self.sections = {}
+        try:
+            self._map.close()
+        except BufferError:
+            # Something still holds a zero-copy view; the mapping closes when it is released
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def save_corpus(corpus: Corpus, path: str, metadata: dict = None) -> dict:
+    sections = corpus.snapshot_sections()
+    table = write_snapshot(path, sections, {"documents": len(corpus), **(metadata or {})})
+    return {"path": path, "bytes": os.path.getsize(path), "documents": len(corpus), "created_at": table["created_at"]}
+
+
+def load_corpus(path: str, verify: bool = False) -> Corpus:
+    with Snapshot(path) as snapshot:
+        if verify:
+            snapshot.verify()
+        return Corpus.from_snapshot_sections(snapshot.sections)
+
+
+def _admin_request(url: str, token: Optional[str], action: str, name: Optional[str]) -> dict:
+    import httpx
+    response = httpx.post(f"{url.rstrip('/')}/admin/{action}", params={"name": name} if name else None,
+                          headers={"X-Admin-Token": token or ""}, timeout=600)
+    response.raise_for_status()
+    return response.json()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect snapshot files or snapshot/restore a running server")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="print a snapshot's header and sections")
+    info.add_argument("path")
+    info.add_argument("--verify", action="store_true", help="check section checksums")
+    for action in ("create", "restore"):
+        command = commands.add_parser(action, help=f"{action} a snapshot on a running server")
+        command.add_argument("--url", default="http://127.0.0.1:8000")
+        command.add_argument("--token", default=os.getenv("ADMIN_TOKEN"))
+        command.add_argument("--name", help="snapshot file name inside the server's snapshot directory")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        with Snapshot(args.path) as snapshot:
+            if args.verify:
+                snapshot.verify()
+            print(json.dumps({"format_version": snapshot.table["format_version"],
+                              "created_at": snapshot.table["created_at"],
+                              "metadata": snapshot.metadata,
+                              "sections": {name: length for name, (_, length, _) in snapshot.table["sections"].items()}},
+                             indent=2))
+    else:
+        action = "snapshot" if args.command == "create" else "restore"
+        print(json.dumps(_admin_request(args.url, args.token, action, args.name), indent=2))
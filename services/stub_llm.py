@@ -0,0 +1,183 @@
+"""Local stand-in for the Azure OpenAI / OpenAI chat completion and embedding APIs.
+
+Serves the routes used by the legacy `openai` module (Azure deployments), the
+`OpenAI`/`AzureOpenAI` clients and LangChain's `OpenAIEmbeddings`, so any app can
+be load-tested offline by setting LLM_STUB_URL:
+
+    python -m services.stub_llm --port 8001
+    LLM_STUB_URL=http://127.0.0.1:8001 uvicorn main:app
+
+Latency is sampled per request from the distribution configured in config.py,
+streamed completions are paced at STUB_LLM_TOKENS_PER_SECOND, and embeddings are
+deterministic hashed bag-of-words vectors, so similar texts get similar vectors.
+STUB_LLM_THROTTLE_RATE makes a fraction of completions fail with 429.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+import config
+
+app = FastAPI(title="Stub LLM")
+
+_rng = random.Random(config.STUB_LLM_SEED)
+_token_pattern = re.compile(r"\w+")
+
+
+def sample_latency() -> float:
+    """Seconds to wait before the first token, drawn from the configured distribution"""
+    mean = config.STUB_LLM_LATENCY_MS / 1000.0
+    jitter = config.STUB_LLM_LATENCY_JITTER_MS / 1000.0
+    distribution = config.STUB_LLM_LATENCY_DISTRIBUTION
+    if distribution == "fixed" or mean <= 0:
+        latency = mean
+    elif distribution == "uniform":
+        latency = _rng.uniform(mean - jitter, mean + jitter)
+    elif distribution == "normal":
+        latency = _rng.gauss(mean, jitter)
+    else:
+        # Lognormal with the configured mean and standard deviation: long right tail like real providers
+        sigma = math.sqrt(math.log(1 + (jitter / mean) ** 2))
+        latency = _rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    return max(0.0, latency)
+
+
+def deterministic_embedding(text: str, dimensions: int = None) -> list:
+    """Feature-hash the lowercase tokens of `text` into a signed unit vector"""
+    dimensions = dimensions or config.STUB_LLM_EMBEDDING_DIMENSIONS
+    values = [0.0] * dimensions
+    for token in _token_pattern.findall(text.lower()):
+        digest = hashlib.md5(token.encode()).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        values[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in values))
+    if not norm:
+        values[0] = norm = 1.0
+    return [v / norm for v in values]
+
+
+def _answer(messages: list) -> str:
+    prompt = messages[-1]["content"] if messages else ""
+    return f"Stub answer covering {len(prompt)} characters of prompt."
+
+
+def _usage(prompt: str, answer: str) -> dict:
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = len(answer) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _completion(model: str, messages: list) -> dict:
+    answer = _answer(messages)
+    prompt = "".join(m.get("content", "") for m in messages)
+    return {
+        "id": f"stub-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": _usage(prompt, answer),
+    }
+
+
+async def _stream_completion(model: str, messages: list):
+    """Server-sent events in the chat.completion.chunk format, one word per chunk"""
+    completion_id = f"stub-{int(time.time() * 1000)}"
+    created = int(time.time())
+    delay = 1.0 / config.STUB_LLM_TOKENS_PER_SECOND if config.STUB_LLM_TOKENS_PER_SECOND > 0 else 0.0
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        body = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        return f"data: {json.dumps(body)}\n\n"
+
+    await asyncio.sleep(sample_latency())
+    yield chunk({"role": "assistant", "content": ""})
+    words = _answer(messages).split(" ")
+    for i, word in enumerate(words):
+        yield chunk({"content": word if i == 0 else " " + word})
+        await asyncio.sleep(delay)
+    yield chunk({}, finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
+
+def _embeddings(model: str, inputs) -> dict:
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    data = []
+    for i, text in enumerate(inputs):
+        if not isinstance(text, str):
+            # LangChain may send pre-tokenized input; any stable string form will do
+            text = " ".join(str(token) for token in text)
+        data.append({"object": "embedding", "index": i, "embedding": deterministic_embedding(text)})
+    return {"object": "list", "model": model, "data": data, "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+
+def _throttled():
+    return JSONResponse(
+        {"error": {"code": "429", "message": "Rate limit exceeded (stub)"}},
+        status_code=429,
+        headers={"Retry-After": str(config.STUB_LLM_RETRY_AFTER_S)},
+    )
+
+
+async def _chat(model: str, request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    if config.STUB_LLM_THROTTLE_RATE and _rng.random() < config.STUB_LLM_THROTTLE_RATE:
+        return _throttled()
+    if body.get("stream"):
+        return StreamingResponse(_stream_completion(model, messages), media_type="text/event-stream")
+    await asyncio.sleep(sample_latency())
+    return _completion(model, messages)
+
+
+@app.post("/v1/chat/completions")
+async def openai_chat(request: Request):
+    body = await request.json()
+    return await _chat(body.get("model", "stub"), request)
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def azure_chat(deployment: str, request: Request):
+    return await _chat(deployment, request)
+
+
+@app.post("/v1/embeddings")
+async def openai_embeddings(request: Request):
+    body = await request.json()
+    return _embeddings(body.get("model", "stub"), body.get("input", []))
+
+
+@app.post("/openai/deployments/{deployment}/embeddings")
+async def azure_embeddings(deployment: str, request: Request):
+    body = await request.json()
+    return _embeddings(deployment, body.get("input", []))
+
+
+@app.get("/health")
+def health_check():
+    return {
+        "status": "healthy",
+        "latency_ms": config.STUB_LLM_LATENCY_MS,
+        "latency_distribution": config.STUB_LLM_LATENCY_DISTRIBUTION,
+        "tokens_per_second": config.STUB_LLM_TOKENS_PER_SECOND,
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Run the stub LLM and embedding server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
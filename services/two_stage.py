@@ -0,0 +1,57 @@
+"""Two-stage vector retrieval: nearest document summaries first, then only their chunks.
+
+Each indexed document has a centroid vector in the tenant's summary namespace
+(see DocumentProcessor.process_document). The coarse stage picks RETRIEVAL_FANOUT
+documents from those, and the chunk search is filtered to them by document_id.
+Chunks indexed before documents had summaries carry no document_id and are always
+searched; with no summaries at all, or a shortlist yielding fewer than TOP_K chunks,
+the chunk search is flat.
+"""
+from typing import Optional
+
+import config
+from services.corpus import metadata_filter
+from services.tenants import summary_namespace
+
+# Chunks put in the prompt
+TOP_K = 3
+
+
+def candidate_filter(filters: Optional[dict], document_ids) -> Optional[dict]:
+    """Chunk-query filter restricted to the documents picked by the coarse stage, plus unsummarized chunks"""
+    vector_filter = metadata_filter(filters)
+    if not document_ids:
+        return vector_filter
+    shortlist = {"$or": [{"document_id": {"$in": sorted(document_ids)}}, {"document_id": {"$exists": False}}]}
+    return {"$and": [vector_filter, shortlist]} if vector_filter else shortlist
+
+
+def search_chunks(index, vector, filters: dict = None, namespace: str = ""):
+    """The TOP_K chunk matches for a query vector from a blocking Pinecone index"""
+    document_ids = None
+    if config.RETRIEVAL_FANOUT > 0:
+        summaries = index.query(vector=vector, top_k=config.RETRIEVAL_FANOUT, include_metadata=True,
+                                filter=metadata_filter(filters), namespace=summary_namespace(namespace))
+        document_ids = {match.metadata["document_id"] for match in summaries.matches}
+    # Filters are applied by the index before the nearest-neighbour search
+    results = index.query(vector=vector, top_k=TOP_K, include_metadata=True,
+                          filter=candidate_filter(filters, document_ids), namespace=namespace)
+    if document_ids and len(results.matches) < TOP_K:
+        results = index.query(vector=vector, top_k=TOP_K, include_metadata=True,
+                              filter=metadata_filter(filters), namespace=namespace)
+    return results.matches
+
+
+async def asearch_chunks(index, vector, filters: dict = None, namespace: str = ""):
+    """`search_chunks` on an asyncio index"""
+    document_ids = None
+    if config.RETRIEVAL_FANOUT > 0:
+        summaries = await index.query(vector=vector, top_k=config.RETRIEVAL_FANOUT, include_metadata=True,
+                                      filter=metadata_filter(filters), namespace=summary_namespace(namespace))
+        document_ids = {match.metadata["document_id"] for match in summaries.matches}
+    results = await index.query(vector=vector, top_k=TOP_K, include_metadata=True,
+                                filter=candidate_filter(filters, document_ids), namespace=namespace)
+    if document_ids and len(results.matches) < TOP_K:
+        results = await index.query(vector=vector, top_k=TOP_K, include_metadata=True,
+                                    filter=metadata_filter(filters), namespace=namespace)
+    return results.matches
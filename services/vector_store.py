@@ -0,0 +1,380 @@
+"""Local vector index with int8 and binary quantization and float re-scoring.
+
+Vectors are L2-normalized on insert. Each query scans the quantized codes (int8
+with one float32 scale per row, 4x smaller than float32, or sign bits packed eight
+to a byte, 32x smaller) and reads the float32 originals only to re-score its top
+candidates. A saved store is a directory of raw row files plus a JSON-lines
+metadata file: rows already saved are memory-mapped read-only, so the float
+originals stay on disk and only the pages of re-scored rows are touched, and rows
+added since the last save are the only ones held in memory. `save` appends just
+those rows, so saving after every batch costs the size of the batch, not of the
+store.
+
+    python -m services.vector_store eval --vectors 20000 --dimensions 384 --k 10
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.corpus import matches_filters
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# Bits set in each byte value, for Hamming distances over packed sign bits (numpy < 2.0 has no bitwise_count)
+_POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+_popcount = getattr(np, "bitwise_count", _POPCOUNT_TABLE.__getitem__)
+
+# Rows scored per block, so the float32 temporaries of a scan stay a few MB
+_SCAN_BLOCK = 16384
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class _Column:
+    """One per-row array: saved rows mapped from a raw file, later rows in memory until `flush`"""
+
+    def __init__(self, dtype, row_shape: tuple = ()):
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.row_bytes = self.dtype.itemsize * int(np.prod(row_shape, dtype=np.int64))
+        self.saved = self._empty(0)
+        self.pending = self._empty(0)
+        self.pending_rows = 0
+
+    def _empty(self, rows: int) -> np.ndarray:
+        return np.empty((rows,) + self.row_shape, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.saved) + self.pending_rows
+
+    def append(self, rows: np.ndarray):
+        """Grow the in-memory tail geometrically so appends are amortized O(1); saved rows are never copied"""
+        needed = self.pending_rows + len(rows)
+        if needed > len(self.pending):
+            grown = self._empty(max(needed, 2 * len(self.pending), 1024))
+            grown[:self.pending_rows] = self.pending[:self.pending_rows]
+            self.pending = grown
+        self.pending[self.pending_rows:needed] = rows
+        self.pending_rows = needed
+
+    def segments(self):
+        """(first row, rows) of the saved part and of the in-memory tail"""
+        return [(0, self.saved), (len(self.saved), self.pending[:self.pending_rows])]
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """Rows by sorted index; saved rows are read from the mapping in file order"""
+        split = int(np.searchsorted(rows, len(self.saved)))
+        return np.concatenate([self.saved[rows[:split]], self.pending[rows[split:] - len(self.saved)]])
+
+    def clear(self):
+        self.load("", 0, mmap=False)
+
+    def load(self, filename: str, rows: int, mmap: bool):
+        if not rows or not self.row_bytes:
+            self.saved = self._empty(rows)
+        elif mmap:
+            self.saved = np.memmap(filename, dtype=self.dtype, mode="r", shape=(rows,) + self.row_shape)
+        else:
+            self.saved = np.fromfile(filename, dtype=self.dtype, count=rows * self.row_bytes // self.dtype.itemsize
+                                     ).reshape((rows,) + self.row_shape)
+        self.pending = self._empty(0)
+        self.pending_rows = 0
+
+    def flush(self, filename: str, mmap: bool, rewrite: bool = False):
+        """Write the in-memory rows after the saved ones (or every row to a new file) and map them all"""
+        rows = len(self)
+        if rewrite:
+            temporary = f"{filename}.tmp-{os.getpid()}"
+            with open(temporary, "wb") as f:
+                for _, segment in self.segments():
+                    f.write(np.ascontiguousarray(segment).tobytes())
+            os.replace(temporary, filename)
+        else:
+            with open(filename, "ab") as f:
+                # Drops rows an interrupted save appended after the last committed one
+                f.truncate(len(self.saved) * self.row_bytes)
+                f.write(self.pending[:self.pending_rows].tobytes())
+        self.load(filename, rows, mmap)
+
+
+class VectorStore:
+    """Append-only vector index; deletes are tombstones until `compact`"""
+
+    def __init__(self, dimensions: int, quantization: str = "int8", rescore_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}. Available: {', '.join(QUANTIZATIONS)}")
+        self.dimensions = dimensions
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self.count = 0
+        self.ids: List[str] = []
+        self.metadata: List[dict] = []
+        self._vectors = _Column(np.float32, (dimensions,))
+        if quantization == "int8":
+            self._codes = _Column(np.int8, (dimensions,))
+        elif quantization == "binary":
+            self._codes = _Column(np.uint8, ((dimensions + 7) // 8,))
+        else:
+            self._codes = _Column(np.uint8, (0,))
+        self._scales = _Column(np.float32)
+        self._live = np.empty(0, dtype=bool)
+        # Where the store was last saved or loaded from, and how much of its metadata file is committed
+        self._path = None
+        self._mmap = True
+        self._metadata_bytes = 0
+        self._metadata_rows = 0
+        self._rewrite = False
+
+    def __len__(self):
+        return int(self._live[:self.count].sum())
+
+    def _columns(self):
+        return (("vectors", self._vectors), ("codes", self._codes), ("scales", self._scales))
+
+    def _quantize(self, vectors: np.ndarray):
+        """Codes (and per-row scales) for normalized float vectors"""
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.round(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        if self.quantization == "binary":
+            return np.packbits(vectors > 0, axis=1), np.ones(len(vectors), dtype=np.float32)
+        return np.empty((len(vectors), 0), dtype=np.uint8), np.ones(len(vectors), dtype=np.float32)
+
+    def add(self, vectors, ids: List[str], metadata: List[dict] = None) -> range:
+        vectors = normalize(np.atleast_2d(vectors))
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected {self.dimensions}-dimensional vectors, got {vectors.shape[1]}")
+        rows = len(vectors)
+        start = self.count
+        codes, scales = self._quantize(vectors)
+        self._vectors.append(vectors)
+        self._codes.append(codes)
+        self._scales.append(scales)
+        if start + rows > len(self._live):
+            live = np.zeros(max(start + rows, 2 * len(self._live), 1024), dtype=bool)
+            live[:start] = self._live[:start]
+            self._live = live
+        self._live[start:start + rows] = True
+        self.ids.extend(ids)
+        self.metadata.extend(metadata or [{} for _ in range(rows)])
+        self.count += rows
+        return range(start, start + rows)
+
+    def delete(self, rows) -> int:
+        rows = [row for row in rows if 0 <= row < self.count and self._live[row]]
+        if rows:
+            self._live[rows] = False
+        return len(rows)
+
+    def rows_matching(self, filters: Optional[dict]) -> np.ndarray:
+        """Boolean mask of the live rows whose metadata passes /chat-style filters"""
+        mask = self._live[:self.count].copy()
+        if filters:
+            mask &= np.fromiter((matches_filters(meta, filters) for meta in self.metadata), dtype=bool, count=self.count)
+        return mask
+
+    def compact(self):
+        """Drop deleted rows; the live rows are read into memory and the next `save` rewrites every file"""
+        live = np.flatnonzero(self._live[:self.count])
+        for _, column in self._columns():
+            rows = column.take(live)
+            column.clear()
+            column.append(rows)
+        self._live = np.ones(len(live), dtype=bool)
+        self.ids = [self.ids[row] for row in live]
+        self.metadata = [self.metadata[row] for row in live]
+        self.count = len(live)
+        self._rewrite = True
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """First-pass similarity of every row to the (normalized) query from the quantized codes"""
+        scores = np.empty(self.count, dtype=np.float32)
+        if self.quantization == "binary":
+            query_bits = np.packbits(query > 0)
+        scanned = self._vectors if self.quantization == "none" else self._codes
+        # Every column is saved together, so their saved and in-memory parts line up
+        for (offset, rows), (_, scales) in zip(scanned.segments(), self._scales.segments()):
+            for start in range(0, len(rows), _SCAN_BLOCK):
+                end = min(start + _SCAN_BLOCK, len(rows))
+                if self.quantization == "int8":
+                    block = (rows[start:end].astype(np.float32) @ query) * scales[start:end]
+                elif self.quantization == "binary":
+                    block = self.dimensions - 2 * _popcount(rows[start:end] ^ query_bits).sum(axis=1, dtype=np.int32)
+                else:
+                    block = rows[start:end] @ query
+                scores[offset + start:offset + end] = block
+        return scores
+
+    def search(self, query, k: int = 10, mask: np.ndarray = None) -> List[dict]:
+        """Top `k` rows by cosine similarity: quantized scan, then exact re-scoring of k * rescore_factor candidates"""
+        if self.count == 0 or k <= 0:
+            return []
+        query = normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+        scores = self._approximate_scores(query)
+        allowed = self._live[:self.count] if mask is None else mask & self._live[:self.count]
+        scores[~allowed] = -np.inf
+        available = int(allowed.sum())
+        if not available:
+            return []
+
+        shortlist = min(available, k if self.quantization == "none" else k * self.rescore_factor)
+        # Sorted rows read the (possibly mapped) float originals in file order
+        candidates = np.sort(np.argpartition(-scores, shortlist - 1)[:shortlist])
+        exact = self._vectors.take(candidates) @ query
+        hits = []
+        for position in np.argsort(-exact)[:k]:
+            row = int(candidates[position])
+            hits.append({"id": self.ids[row], "score": float(exact[position]), "metadata": self.metadata[row], "row": row})
+        return hits
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes of the stored rows per array: codes are what every query scans; float originals
+        are split into those held in memory (not saved yet) and those mapped from disk"""
+        codes = len(self._codes) * self._codes.row_bytes
+        if self.quantization == "int8":
+            codes += len(self._scales) * self._scales.row_bytes
+        return {
+            "codes": codes,
+            "floats": self._vectors.pending_rows * self._vectors.row_bytes,
+            "floats_mapped": len(self._vectors.saved) * self._vectors.row_bytes if self._mmap else 0,
+        }
+
+    def save(self, path: str):
+        """Append the rows added since the last save to the store's files in `path`.
+
+        A store saved somewhere new, or compacted, writes every file afresh. store.json
+        records the committed row count and is replaced last, so an interrupted save
+        leaves the previous store readable and its partial rows are dropped by the next one.
+        """
+        os.makedirs(path, exist_ok=True)
+        rewrite = self._rewrite or self._path is None or os.path.abspath(path) != os.path.abspath(self._path)
+        for name, column in self._columns():
+            column.flush(os.path.join(path, f"{name}.bin"), self._mmap, rewrite)
+
+        metadata_path = os.path.join(path, "metadata.jsonl")
+        committed = 0 if rewrite else self._metadata_bytes
+        saved_rows = 0 if rewrite else self._metadata_rows
+        lines = b"".join(json.dumps({"id": row_id, "metadata": meta}).encode() + b"\n"
+                         for row_id, meta in zip(self.ids[saved_rows:], self.metadata[saved_rows:]))
+        with open(metadata_path, "wb" if rewrite else "ab") as f:
+            f.truncate(committed)
+            f.write(lines)
+        self._metadata_bytes = committed + len(lines)
+        self._metadata_rows = self.count
+
+        def replace(name: str, data: bytes):
+            temporary = os.path.join(path, f".{name}.tmp-{os.getpid()}")
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, os.path.join(path, name))
+
+        # One byte per row, so tombstones are simply rewritten
+        replace("live.bin", self._live[:self.count].tobytes())
+        replace("store.json", json.dumps({
+            "dimensions": self.dimensions, "quantization": self.quantization, "rescore_factor": self.rescore_factor,
+            "count": self.count, "metadata_bytes": self._metadata_bytes}).encode())
+        self._path = path
+        self._rewrite = False
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "VectorStore":
+        with open(os.path.join(path, "store.json")) as f:
+            state = json.load(f)
+        store = cls(state["dimensions"], state["quantization"], state["rescore_factor"])
+        count = state["count"]
+        for name, column in store._columns():
+            column.load(os.path.join(path, f"{name}.bin"), count, mmap)
+        store._live = np.fromfile(os.path.join(path, "live.bin"), dtype=bool, count=count)
+        with open(os.path.join(path, "metadata.jsonl"), "rb") as f:
+            for line in f.read(state["metadata_bytes"]).splitlines():
+                entry = json.loads(line)
+                store.ids.append(entry["id"])
+                store.metadata.append(entry["metadata"])
+        store.count = count
+        store._path = path
+        store._mmap = mmap
+        store._metadata_bytes = state["metadata_bytes"]
+        store._metadata_rows = count
+        return store
+
+
+def evaluate(vectors: np.ndarray, queries: np.ndarray, k: int, rescore_factor: int) -> dict:
+    """Recall@k of each quantization against exact float search, with latency and code size"""
+    exact = VectorStore(vectors.shape[1], "none")
+    exact.add(vectors, [str(row) for row in range(len(vectors))])
+    truth = [{hit["row"] for hit in exact.search(query, k)} for query in queries]
+    results = {}
+    for quantization in QUANTIZATIONS:
+        store = VectorStore(vectors.shape[1], quantization, rescore_factor)
+        store.add(vectors, [str(row) for row in range(len(vectors))])
+        latencies = []
+        recalled = 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            hits = store.search(query, k)
+            latencies.append(time.perf_counter() - start)
+            recalled += len(expected & {hit["row"] for hit in hits})
+        latencies.sort()
+        memory = store.memory_usage()
+        results[quantization] = {
+            "recall_at_k": recalled / max(sum(len(expected) for expected in truth), 1),
+            "p50_ms": 1000 * latencies[len(latencies) // 2],
+            "scan_bytes_per_vector": (memory["codes"] or memory["floats"]) / len(vectors),
+        }
+    return results
+
+
+def _synthetic_embeddings(count: int, dimensions: int, seed: int, family: int = 10) -> np.ndarray:
+    """Stub-API embeddings of synthetic text in families of near-duplicates, like overlapping chunks.
+
+    Independent random texts are all roughly equidistant, so their top-k beyond the
+    first hit is noise and no quantization could recall it; families give every
+    vector real neighbours.
+    """
+    from benchmarks.corpus import SyntheticCorpus
+    from services.stub_llm import deterministic_embedding
+    corpus = SyntheticCorpus(seed=seed)
+    rng = np.random.default_rng(seed)
+    bases = np.array([deterministic_embedding(corpus.text(1000), dimensions) for _ in range(-(-count // family))],
+                     dtype=np.float32)
+    # Feature hashing leaves most dimensions zero; a fixed random rotation makes them dense like a model's
+    rotation, _ = np.linalg.qr(rng.normal(size=(dimensions, dimensions)))
+    bases = bases @ rotation.astype(np.float32)
+    vectors = np.repeat(bases, family, axis=0)[:count]
+    return normalize(vectors + rng.normal(scale=0.5 / np.sqrt(dimensions), size=vectors.shape).astype(np.float32))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate quantized vector search recall against exact float search")
+    commands = parser.add_subparsers(dest="command", required=True)
+    evaluation = commands.add_parser("eval", help="recall@k, latency and code size for each quantization")
+    evaluation.add_argument("--vectors", type=int, default=20000)
+    evaluation.add_argument("--dimensions", type=int, default=384)
+    evaluation.add_argument("--queries", type=int, default=200)
+    evaluation.add_argument("--k", type=int, default=10)
+    evaluation.add_argument("--rescore-factor", type=int, default=4)
+    evaluation.add_argument("--store", help="evaluate the vectors of a saved store instead of synthetic ones")
+    evaluation.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.store:
+        saved = VectorStore.load(args.store)
+        data = saved._vectors.take(np.arange(saved.count))
+    else:
+        data = _synthetic_embeddings(args.vectors + args.queries, args.dimensions, args.seed)
+    rng = np.random.default_rng(args.seed)
+    picked = rng.choice(len(data), size=min(args.queries, len(data)), replace=False)
+    # Queries are perturbed copies of stored vectors, so every query has close neighbours
+    queries = normalize(data[picked] + rng.normal(scale=0.5 / np.sqrt(data.shape[1]), size=data[picked].shape).astype(np.float32))
+    print(json.dumps(evaluate(data, queries, args.k, args.rescore_factor), indent=2))
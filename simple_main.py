@@ -1,13 +1,12 @@
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from openai import OpenAI
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import config
+from services.compression import compress_passages
+from services.corpus import query_terms
 
 app = FastAPI(title="Simple Knowledge Bot")
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = OpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL)
 documents = []
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
@@ -33,7 +32,10 @@ async def upload_file(file: UploadFile = File(...)):
 @app.post("/chat")
 async def chat(question: str):
     try:
-        context = "\n\n".join([doc["content"] for doc in documents])
+        # Only the sentences relevant to the question go into the prompt, however many documents there are
+        question_words = query_terms(question)
+        passages, compression = compress_passages(question_words, [doc["content"] for doc in documents], config.CONTEXT_TOKEN_BUDGET)
+        context = "\n\n".join(passage for passage in passages if passage)
         
         if context:
             prompt = f"Based on these documents:\n{context}\n\nQuestion: {question}"
@@ -45,6 +47,6 @@ async def chat(question: str):
             messages=[{"role": "user", "content": prompt}],
             max_tokens=300
         )
-        return {"question": question, "answer": response.choices[0].message.content}
+        return {"question": question, "answer": response.choices[0].message.content, "context_compression": compression}
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,112 @@
+import asyncio
+
+import openai
+import pytest
+
+from services import metrics
+from services.cache import LRUCache
+from services.chunking import chunk_sections, text_sections
+from services.compression import CHARS_PER_TOKEN, compress_passages, estimate_tokens
+from services.corpus import query_terms
+from services.rate_limiter import Overloaded
+from services.sessions import SessionStore
+from services.tenants import TenantRegistry
+
+FILLER = "The office kitchen was repainted over the summer break. "
+
+
+def test_passages_within_budget_are_unchanged():
+    passages = ["Restart the router.", "Check the cable."]
+    result, stats = compress_passages(["router"], passages, token_budget=1000)
+    assert result == passages
+    assert stats["ratio"] == 1.0
+    assert stats["compressed_tokens"] == stats["original_tokens"]
+
+
+def test_relevant_sentences_are_kept_within_budget():
+    passages = [FILLER * 10 + "To reset the VPN token, open the portal. " + FILLER * 10]
+    result, stats = compress_passages(["vpn", "token"], passages, token_budget=20)
+    assert "To reset the VPN token, open the portal." in result[0]
+    assert estimate_tokens(result[0]) <= 20 + 1
+    assert stats["ratio"] < 0.2
+    assert stats["sentences_kept"] < stats["sentences_total"]
+
+
+def test_rare_terms_outweigh_common_ones():
+    passages = ["The server is up. " * 8 + "The server runs Kerberos for logins. " + "The server is down. " * 8]
+    result, _ = compress_passages(["server", "kerberos"], passages, token_budget=12)
+    assert result[0].startswith("The server runs Kerberos for logins.")
+
+
+def test_neighbours_fill_the_remaining_budget_in_reading_order():
+    passages = ["Alpha intro. The printer jams on A3 paper. Beta outro. " + FILLER * 20]
+    result, _ = compress_passages(["printer"], passages, token_budget=20)
+    assert result[0] == "Alpha intro. The printer jams on A3 paper. Beta outro."
+
+
+def test_gaps_are_marked_between_distant_sentences():
+    passages = ["The VPN needs a token. " + FILLER * 20 + "Tokens expire after a day."]
+    result, _ = compress_passages(["token"], passages, token_budget=18)
+    assert " ... " in result[0]
+    assert result[0].startswith("The VPN needs a token.")
+
+
+def test_without_a_match_every_passage_keeps_its_opening():
+    passages = ["First passage opens here. " + FILLER * 20, "Second passage opens here. " + FILLER * 20]
+    result, stats = compress_passages(["zebra"], passages, token_budget=20)
+    assert result[0].startswith("First passage opens here.")
+    assert result[1].startswith("Second passage opens here.")
+    assert stats["ratio"] < 1.0
+
+
+def test_overlong_sentence_is_truncated_to_the_budget():
+    passages = ["The firewall " + "rule " * 400 + "ends here."]
+    result, stats = compress_passages(["firewall"], passages, token_budget=10)
+    assert result[0] == passages[0][:10 * CHARS_PER_TOKEN]
+    assert stats["sentences_kept"] == 1
+
+
+def test_stop_words_do_not_select_sentences():
+    question_words = query_terms("What is the printer toner?")
+    assert question_words == ["printer", "toner"]
+    passages = ["What is the plan for the offsite? " * 10 + "Printer toner is in cabinet B."]
+    result, _ = compress_passages(question_words, passages, token_budget=10)
+    assert result[0] == "Printer toner is in cabinet B."
+
+
+class FakeLimiter:
+    def __init__(self, shed: bool):
+        self.shed = shed
+
+    async def call(self, request, tokens):
+        if self.shed:
+            raise Overloaded(1.0)
+        return openai.util.convert_to_openai_object(
+            {"choices": [{"message": {"content": "Use vpn2."}}], "usage": {"total_tokens": tokens}})
+
+    def reconcile(self, estimated, actual):
+        pass
+
+
+def test_context_metrics_only_count_prompts_that_were_sent(tmp_path, monkeypatch):
+    import main
+    registry = TenantRegistry(str(tmp_path), 0, 0, 0, make_sessions=lambda: SessionStore(10, 60, 1000))
+    monkeypatch.setattr(main, "tenants", registry)
+    monkeypatch.setattr(main, "retrieval_cache", LRUCache(10))
+    sent = lambda: metrics.CONTEXT_TOKENS.labels("sent")._value.get()
+    ratios = lambda: sum(bucket.get() for bucket in metrics.CONTEXT_COMPRESSION_RATIO._buckets)
+
+    async def ask(shed: bool):
+        monkeypatch.setattr(main, "llm_limiter", FakeLimiter(shed))
+        tenant = await registry.get("context")
+        if not len(tenant.corpus):
+            content, chunks = chunk_sections(text_sections("The vpn gateway moved. " + FILLER * 40), 1000)
+            tenant.corpus.add({"content": content, "chunks": chunks, "filename": "vpn.txt", "file_type": "txt"})
+        return await main.answer_question("Where is the vpn gateway?", tenant)
+
+    before = sent(), ratios()
+    with pytest.raises(Overloaded):
+        asyncio.run(ask(shed=True))
+    assert (sent(), ratios()) == before
+    assert asyncio.run(ask(shed=False))["mode"] == "llm"
+    assert sent() > before[0] and ratios() == before[1] + 1
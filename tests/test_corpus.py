@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from services.corpus import Bitmap, Corpus, iter_bits
+
+
+def make_corpus(count=6):
+    corpus = Corpus()
+    for i in range(count):
+        corpus.add({
+            "filename": f"doc{i}.txt",
+            "file_type": "pdf" if i % 2 else "txt",
+            "tags": ["vpn"] if i % 3 == 0 else [],
+            "size": 100 - i,
+            "uploaded_at": 1000.0 + i,
+            "content": f"document number {i}",
+            "keywords": ["vpn"] if i % 3 == 0 else ["printer"],
+        })
+    return corpus
+
+
+def test_bitmap_grows_downwards_and_discards():
+    bitmap = Bitmap()
+    bitmap.add(40)
+    assert bitmap.first_byte == 5 and len(bitmap.data) == 1
+    bitmap.add(3)
+    bitmap.add(17)
+    assert list(iter_bits(int(bitmap))) == [3, 17, 40]
+    assert 17 in bitmap and 18 not in bitmap
+    bitmap.discard(17)
+    bitmap.discard(1000)
+    assert list(iter_bits(int(bitmap))) == [3, 40]
+    bitmap.discard(3)
+    bitmap.discard(40)
+    assert not bitmap
+
+
+def test_filters_intersect_fields_and_date_range():
+    corpus = make_corpus()
+    assert corpus.filter_ids(None) is None
+    assert corpus.filter_ids({"file_type": ["PDF"]}) == [1, 3, 5]
+    assert corpus.filter_ids({"file_type": ["pdf"], "tags": ["vpn"]}) == [3]
+    assert corpus.filter_ids({"file_type": ["txt", "pdf"], "uploaded_after": 1002.0,
+                              "uploaded_before": 1004.0}) == [2, 3, 4]
+    assert corpus.filter_ids({"filename": ["missing.txt"]}) == []
+
+
+def test_upload_times_never_go_backwards():
+    corpus = Corpus()
+    corpus.add({"filename": "a", "uploaded_at": 50.0, "content": ""})
+    doc_id = corpus.add({"filename": "b", "uploaded_at": 10.0, "content": ""})
+    assert corpus.get(doc_id)["uploaded_at"] == 50.0
+
+
+def test_delete_masks_lookups_and_compact_reclaims():
+    corpus = make_corpus()
+    deleted = corpus.delete([0, 3, 3, 99])
+    assert [doc["doc_id"] for doc in deleted] == [0, 3]
+    assert len(corpus) == 4
+    assert corpus.get(3) is None
+    assert corpus.filter_ids(None) == [1, 2, 4, 5]
+    assert corpus.filter_ids({"tags": ["vpn"]}) == []
+    assert corpus.stats()["by_tag"] == {}
+    assert corpus.keyword_candidates(["vpn"], fanout=5) == []
+    assert corpus.needs_compaction(0.5)
+
+    assert corpus.purge(1) == 1
+    asyncio.run(corpus.compact(batch_size=1))
+    assert corpus.tombstones == []
+    assert corpus.documents[0] is None and corpus.documents[3] is None
+    assert "vpn" not in corpus.field_values("tags")
+    # IDs are never reused
+    assert corpus.add({"filename": "new", "content": ""}) == 6
+
+
+def test_pages_resume_from_cursor_in_both_orders():
+    corpus = make_corpus()
+    corpus.delete([2])
+    for sort, descending in (("uploaded_at", False), ("uploaded_at", True), ("size", False), ("size", True)):
+        expected = [doc["doc_id"] for doc in corpus.iter_sorted(sort, descending)]
+        seen, cursor = [], None
+        while True:
+            docs, cursor = corpus.page(2, sort, descending, cursor)
+            seen.extend(doc["doc_id"] for doc in docs)
+            if cursor is None:
+                break
+        assert seen == expected
+        assert 2 not in seen and len(seen) == 5
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        make_corpus().page(2, cursor="not-a-cursor")
+
+
+def test_keyword_candidates_prefer_rare_keywords():
+    corpus = make_corpus()
+    assert corpus.keyword_candidates(["vpn", "printer"], fanout=2) == [0, 3]
+    assert corpus.keyword_candidates(["vpn"], fanout=5, allowed={3, 4}) == [3]
@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import numpy as np
+
+from services.corpus import metadata_filter
+from services.sessions import SessionStore
+from services.tenants import TenantRegistry
+from services.vector_store import VectorStore, normalize
+
+
+def embed(text: str) -> np.ndarray:
+    vector = np.zeros(32)
+    for word in text.lower().split():
+        vector[hash(word) % 32] += 1
+    return normalize(vector[None, :])[0]
+
+
+class LocalIndex:
+    """DocumentProcessor's local-store behaviour with a bag-of-words embedding"""
+
+    def __init__(self):
+        self.stores = {}
+
+    def process_documents(self, documents, namespace=""):
+        store = self.stores.setdefault(namespace, VectorStore(32, "none"))
+        for document in documents:
+            metadata = {"document_id": document["document_id"], "filename": document["filename"],
+                        "content": document["content"]}
+            store.add(embed(document["content"])[None, :], [document["document_id"]], [metadata])
+        return [{"status": "success"} for _ in documents]
+
+    def delete_document(self, filename=None, filters=None, namespace="", document_id=None):
+        store = self.stores[namespace]
+        deleted = store.delete(np.flatnonzero(store.rows_matching(filters)).tolist())
+        return {"status": "success", "filter": metadata_filter(filters), "vectors_deleted": deleted}
+
+    def search(self, question, namespace=""):
+        return [hit["metadata"]["content"].strip() for hit in self.stores[namespace].search(embed(question), 10)]
+
+
+def test_document_id_filters_single_uploads():
+    assert metadata_filter({"document_id": ["a"], "filename": ["x.txt"]}) == {
+        "filename": {"$in": ["x.txt"]}, "document_id": {"$in": ["a"]}}
+    store = VectorStore(32, "none")
+    store.add(np.stack([embed("vpn setup old"), embed("vpn setup new")]), ["a_0", "b_0"],
+              [{"document_id": "a", "filename": "vpn.txt"}, {"document_id": "b", "filename": "vpn.txt"}])
+    store.delete(np.flatnonzero(store.rows_matching({"document_id": ["a"]})).tolist())
+    assert [hit["id"] for hit in store.search(embed("vpn setup old"), 5)] == ["b_0"]
+
+
+def test_deleted_documents_no_longer_come_back_from_the_vector_path(tmp_path, monkeypatch):
+    import main
+    index = LocalIndex()
+    registry = TenantRegistry(str(tmp_path), 0, 0, 0, make_sessions=lambda: SessionStore(10, 60, 1000))
+    monkeypatch.setattr(main, "tenants", registry)
+    monkeypatch.setattr(main, "vector_index", lambda: index)
+    monkeypatch.setattr(main.config, "CHAT_RETRIEVAL", "vector")
+
+    async def run():
+        async with httpx.AsyncClient(app=main.app, base_url="http://test") as client:
+            uploads = []
+            for text in ("Old guide: the vpn port is 1194.", "New guide: the vpn port is 443.", "Printers are on floor two."):
+                response = await client.post("/upload", files={"file": ("guide.txt", text.encode(), "text/plain")})
+                uploads.append(response.json()["doc_id"])
+            namespace = (await registry.get(main.DEFAULT_TENANT)).namespace
+            before = index.search("vpn port", namespace)
+            # Same filename as the upload that stays: only this upload's vectors go
+            assert (await client.delete(f"/documents/{uploads[0]}")).status_code == 200
+            after_one = index.search("vpn port", namespace)
+            await client.delete("/documents")
+            return before, after_one, len(index.stores[namespace])
+
+    before, after_one, remaining = asyncio.run(run())
+    assert "Old guide: the vpn port is 1194." in before
+    assert "Old guide: the vpn port is 1194." not in after_one
+    assert "New guide: the vpn port is 443." in after_one
+    assert remaining == 0
@@ -0,0 +1,76 @@
+import asyncio
+
+from services.cache import LRUCache
+from services.chunking import chunk_sections, sentence_spans, text_sections
+from services.extractive import extract_answer
+from services.mail_extraction import mail_sections
+from services.sessions import SessionStore
+from services.tenants import TenantRegistry
+
+
+def document(doc_id, filename, sections):
+    content, chunks = chunk_sections(sections, 1000)
+    return {"doc_id": doc_id, "filename": filename, "content": content, "chunks": chunks}
+
+
+def sentences(text):
+    return [text[start:end] for start, end in sentence_spans(text)]
+
+
+def test_sentences_break_at_headings_and_header_lines_but_not_soft_wraps():
+    text = "Network setup\nThe gateway\nis vpn2. It replaced vpn1!\n\nSubject: VPN\nFrom: Alice <a@x>\nBody, which\ncontinues here."
+    assert sentences(text) == ["Network setup", "The gateway\nis vpn2.", "It replaced vpn1!", "Subject: VPN",
+                               "From: Alice <a@x>", "Body, which\ncontinues here."]
+    assert sentence_spans("  padded.  ", 0) == [(2, 9)]
+    assert sentences("One. Two. Three.")[1:] == ["Two.", "Three."]
+
+
+def test_mail_headers_are_not_quoted_with_the_answer():
+    message = {"subject": "VPN change", "from": "Alice <a@x>", "to": ["b@x"], "date": "Mon, 1 Jan 2024",
+               "body": "The new VPN gateway is vpn2.example.com. Update your profile before Friday."}
+    doc = document(0, "VPN change", mail_sections(message))
+    result = extract_answer("What is the new VPN gateway?", ["new", "vpn", "gateway"], [doc], 0.8)
+    assert [citation["text"] for citation in result["citations"]] == ["The new VPN gateway is vpn2.example.com."]
+    assert result["confidence"] == 1.0
+    assert result["answer"].startswith("The new VPN gateway is vpn2.example.com. [1]")
+
+
+def test_best_sentences_across_documents_with_citations():
+    first = document(4, "handbook.txt", text_sections("Printers are on floor two.\n\nThe wifi password is hunter2."))
+    second = document(9, "it.txt", text_sections("The guest wifi password is guest123 and rotates monthly."))
+    result = extract_answer("wifi password", ["wifi", "password"], [first, second], 0.8, max_sentences=2)
+    assert [(citation["doc_id"], citation["location"]) for citation in result["citations"]] == [
+        (4, "paragraphs 0-1"), (9, "paragraph 0")]
+    assert "[2] it.txt, paragraph 0" in result["answer"]
+
+
+def test_uncertain_or_explanatory_questions_go_to_the_llm():
+    doc = document(0, "a.txt", text_sections("The VPN gateway is vpn2."))
+    assert extract_answer("vpn gateway owner", ["vpn", "gateway", "owner"], [doc], 0.8) is None
+    assert extract_answer("Why is the VPN gateway vpn2", ["vpn", "gateway"], [doc], 0.8) is None
+    assert extract_answer("gateway", ["gateway"], [doc], 0.8) is None
+    assert extract_answer("vpn gateway", ["vpn", "gateway"], [], 0.8) is None
+
+
+def test_paragraphs_without_punctuation_are_not_quoted():
+    doc = document(0, "dump.txt", text_sections("vpn gateway " * 100))
+    assert extract_answer("vpn gateway", ["vpn", "gateway"], [doc], 0.8) is None
+
+
+def test_extractive_answers_build_no_prompt(tmp_path, monkeypatch):
+    import main
+    registry = TenantRegistry(str(tmp_path), 0, 0, 0, make_sessions=lambda: SessionStore(10, 60, 1000))
+    monkeypatch.setattr(main, "tenants", registry)
+    monkeypatch.setattr(main, "retrieval_cache", LRUCache(10))
+    monkeypatch.setattr(main.config, "EXTRACTIVE_ANSWERS", True)
+    built = []
+    monkeypatch.setattr(main, "build_prompt", lambda *args: built.append(args))
+
+    async def run():
+        tenant = await registry.get("extractive")
+        tenant.corpus.add(document(None, "vpn.txt", text_sections("The new VPN gateway is vpn2.example.com.")))
+        return await main.answer_question("What is the new VPN gateway?", tenant)
+
+    result = asyncio.run(run())
+    assert result["mode"] == "extractive"
+    assert built == []
@@ -0,0 +1,43 @@
+import io
+import zipfile
+
+import pytest
+
+from benchmarks.corpus import make_pdf
+from conftest import build_compound_file, build_powerpoint, build_word_document, ppt_record
+from services.file_types import detect_file_type
+
+
+def zip_with(*names: str) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name in names:
+            archive.writestr(name, "<xml/>")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("content, filename, expected", [
+    (make_pdf(["hello"]), "scan.txt", "pdf"),
+    (zip_with("[Content_Types].xml", "word/document.xml"), "report.pdf", "docx"),
+    (zip_with("[Content_Types].xml", "ppt/presentation.xml"), "", "pptx"),
+    (zip_with("xl/workbook.xml"), "sheet.docx", None),
+    (b"PK\x03\x04 not really a zip", "a.docx", None),
+    (build_word_document([("text", True)]), "old.ppt", "doc"),
+    (build_powerpoint(ppt_record(0x03E8, container=True)), "old.doc", "ppt"),
+    (build_compound_file({"Workbook": b"\0" * 10}), "old.xls", None),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\0" * 20, "broken.doc", None),
+    (b"From alice@example.com Mon Jan  1 00:00:00 2024\nFrom: alice@example.com\n\nhi\n", "archive", "mbox"),
+    (b"From: alice@example.com\nSubject: VPN\n\nBody\n", "message", "eml"),
+    (b"\x00\x01binary", "notes.txt", "txt"),
+    (b"plain notes", "notes", "txt"),
+    ("café ".encode("utf-8") * 300, "", "txt"),
+    (b"\xff\xfe\x00\x00garbage", "blob.bin", None),
+])
+def test_detection_by_content(content, filename, expected):
+    assert detect_file_type(content, filename) == expected
+
+
+def test_multibyte_character_cut_at_the_sample_end_is_still_text():
+    content = b"x" * 1023 + "é".encode("utf-8") + b" more"
+    assert detect_file_type(content, "") == "txt"
+    assert detect_file_type(b"x" * 100 + b"\xe9" + b"y" * 100, "") is None
@@ -0,0 +1,133 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+from services.mail_extraction import (MailThreader, detect_mail_type, iter_raw_messages, mail_sections,
+                                      parse_message, strip_quoted)
+from services.sessions import SessionStore
+from services.tenants import TenantRegistry
+
+MBOX = b"""From alice@example.com Mon Jan  1 10:00:00 2024
+Message-ID: <root@example.com>
+From: Alice <alice@example.com>
+To: bob@example.com
+Subject: VPN change
+Date: Mon, 1 Jan 2024 10:00:00 +0000
+
+The new VPN gateway is vpn2.example.com.
+>From now on use the new profile.
+
+From bob@example.com Mon Jan  1 11:00:00 2024
+Message-ID: <reply@example.com>
+In-Reply-To: <root@example.com>
+From: Bob <bob@example.com>
+Subject: Re: VPN change
+
+Thanks, switching today.
+
+On Mon, 1 Jan 2024 Alice wrote:
+> The new VPN gateway is vpn2.example.com.
+
+From carol@example.com Mon Jan  1 12:00:00 2024
+From: Carol <carol@example.com>
+Subject: RE: vpn change
+Date: Mon, 1 Jan 2024 12:00:00 +0000
+
+Does this affect the office network?
+"""
+
+
+def test_detect_mail_type():
+    assert detect_mail_type(MBOX[:200]) == "mbox"
+    assert detect_mail_type(b"From: a@b\nSubject: hi\n\nbody") == "eml"
+    assert detect_mail_type(b"anything", "export.eml") == "eml"
+    assert detect_mail_type(b"Dear team,\nplease read") is None
+
+
+def test_mbox_is_split_on_separators_and_unescaped():
+    messages = list(iter_raw_messages(io.BytesIO(MBOX), "mbox"))
+    assert len(messages) == 3
+    assert b"\nFrom now on use the new profile." in messages[0]
+    assert not messages[1].startswith(b"From ")
+    assert list(iter_raw_messages(io.BytesIO(b"From: a\n\nx"), "eml")) == [b"From: a\n\nx"]
+
+
+def test_quoted_history_and_signatures_are_stripped():
+    body = "New text.\n\nOn Mon, Alice wrote:\n> old text\n> more\n-- \nBob\nPhone 123"
+    assert strip_quoted(body) == "New text."
+    outlook = "Reply here.\n\n-----Original Message-----\nFrom: x\nSent: y\nold"
+    assert strip_quoted(outlook) == "Reply here."
+
+
+def test_messages_without_message_id_hash_stably():
+    raw = list(iter_raw_messages(io.BytesIO(MBOX), "mbox"))[2]
+    first, second = parse_message(raw), parse_message(raw)
+    assert first["message_id"] == second["message_id"]
+    assert first["message_id"].endswith("@generated>")
+    assert parse_message(raw.replace(b"office", b"branch"))["message_id"] != first["message_id"]
+
+
+def test_threads_follow_references_then_subjects():
+    threader = MailThreader()
+    root, reply, subject_only = (parse_message(raw) for raw in iter_raw_messages(io.BytesIO(MBOX), "mbox"))
+    assert threader.thread_of(root) == "<root@example.com>"
+    assert threader.thread_of(reply) == "<root@example.com>"
+    assert threader.thread_of(subject_only) == "<root@example.com>"
+    orphan = {**reply, "message_id": "<late@example.com>", "in_reply_to": "<missing@example.com>",
+              "references": ["<first@example.com>", "<missing@example.com>"]}
+    assert MailThreader().thread_of(orphan) == "<first@example.com>"
+
+
+def test_header_section_comes_first():
+    sections = mail_sections(parse_message(list(iter_raw_messages(io.BytesIO(MBOX), "mbox"))[0]))
+    assert sections[0]["kind"] == "header"
+    assert sections[0]["text"].startswith("Subject: VPN change\nFrom: Alice")
+
+
+def test_reuploading_a_mailbox_skips_known_messages(tmp_path, monkeypatch):
+    import main
+    registry = TenantRegistry(str(tmp_path), 0, 0, 0, make_sessions=lambda: SessionStore(10, 60, 1000))
+    monkeypatch.setattr(main, "tenants", registry)
+
+    async def run():
+        tenant = await registry.get("mail")
+        upload = lambda: SimpleNamespace(file=io.BytesIO(MBOX), filename="team.mbox")
+        first = await main.ingest_mail(upload(), "mbox", tenant, "")
+        second = await main.ingest_mail(upload(), "mbox", tenant, "")
+        return tenant, first, second
+
+    tenant, first, second = asyncio.run(run())
+    assert (first["messages_indexed"], first["duplicates_skipped"], first["threads"]) == (3, 0, 1)
+    assert (second["messages_indexed"], second["duplicates_skipped"]) == (0, 3)
+    assert len(tenant.corpus) == 3
+    assert {doc["thread_id"] for doc in tenant.corpus.documents} == {"<root@example.com>"}
+
+
+def test_later_uploads_join_threads_through_the_corpus_index(tmp_path, monkeypatch):
+    import main
+    from services.corpus import Corpus
+    registry = TenantRegistry(str(tmp_path), 0, 0, 0, make_sessions=lambda: SessionStore(10, 60, 1000))
+    monkeypatch.setattr(main, "tenants", registry)
+    root, reply, subject_only = iter_raw_messages(io.BytesIO(MBOX), "mbox")
+
+    async def upload(tenant, raw):
+        return await main.ingest_mail(SimpleNamespace(file=io.BytesIO(raw), filename="m.eml"), "eml", tenant, "")
+
+    async def run():
+        tenant = await registry.get("mail")
+        for raw in (root, reply, subject_only):
+            await upload(tenant, raw)
+        corpus = tenant.corpus
+        # A deleted message is no longer a duplicate; the others still are
+        corpus.delete([corpus.filter_ids({"filename": ["re: vpn change"]})[0]])
+        return tenant, await upload(tenant, reply), await upload(tenant, root)
+
+    tenant, reuploaded, duplicate = asyncio.run(run())
+    corpus = tenant.corpus
+    assert {corpus.get(doc_id)["thread_id"] for doc_id in corpus.filter_ids({})} == {"<root@example.com>"}
+    assert (reuploaded["messages_indexed"], duplicate["duplicates_skipped"]) == (1, 1)
+
+    restored = Corpus.from_snapshot_sections({name: memoryview(data) for name, data in corpus.snapshot_sections().items()})
+    assert restored.message_thread("<reply@example.com>") == "<root@example.com>"
+    assert restored.subject_thread("vpn change") == "<root@example.com>"
+    assert restored.message_thread("<missing@example.com>") is None
@@ -0,0 +1,68 @@
+import asyncio
+
+import openai
+import pytest
+
+from services.rate_limiter import Overloaded, RateLimiter, TokenBucket
+
+
+def test_bucket_waits_for_refill():
+    bucket = TokenBucket(rate_per_second=10, capacity=10)
+    now = bucket.updated
+    assert bucket.time_until(5, now) == 0
+    bucket.take(10)
+    assert bucket.time_until(5, now) == pytest.approx(0.5)
+    # Requests larger than the bucket wait for a full bucket, not forever
+    assert bucket.time_until(50, now) == pytest.approx(1.0)
+
+
+def test_zero_limits_are_unlimited():
+    limiter = RateLimiter(tokens_per_minute=0, requests_per_minute=0, queue_slo=1.0)
+    assert limiter.estimated_wait(10 ** 6) == 0
+    limiter.admit(10 ** 6)
+
+    async def run():
+        return await limiter.call(lambda: asyncio.sleep(0, result="ok"), tokens=10 ** 6)
+
+    assert asyncio.run(run()) == "ok"
+
+
+def test_admit_sheds_past_slo():
+    limiter = RateLimiter(tokens_per_minute=600, requests_per_minute=600, queue_slo=1.0)
+    # 100 tokens fill the 10 second burst; 300 more need 30 s of refill
+    with pytest.raises(Overloaded) as raised:
+        limiter.admit(400)
+    assert raised.value.retry_after > 1.0
+
+
+@pytest.mark.parametrize("error", [
+    openai.error.Timeout("timed out"),
+    openai.error.APIConnectionError("connection reset"),
+    openai.error.ServiceUnavailableError("overloaded"),
+    asyncio.TimeoutError(),
+])
+def test_transient_errors_are_retried(error):
+    limiter = RateLimiter(tokens_per_minute=0, requests_per_minute=0, queue_slo=1.0, backoff_base=0.001)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise error
+        return "ok"
+
+    assert asyncio.run(limiter.call(flaky, tokens=1)) == "ok"
+    assert len(attempts) == 2
+
+
+def test_client_errors_are_not_retried():
+    limiter = RateLimiter(tokens_per_minute=0, requests_per_minute=0, queue_slo=1.0, backoff_base=0.001)
+    attempts = []
+
+    async def invalid():
+        attempts.append(1)
+        raise openai.error.InvalidRequestError("bad request", param=None, http_status=400)
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        asyncio.run(limiter.call(invalid, tokens=1))
+    assert len(attempts) == 1
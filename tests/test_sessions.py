@@ -0,0 +1,96 @@
+import pytest
+
+from services import sessions
+from services.corpus import Corpus
+from services.sessions import ChatSession, SessionStore, first_sentence
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_idle_sessions_expire(clock):
+    store = SessionStore(max_sessions=10, ttl_seconds=60, history_token_budget=100)
+    session = store.create("abc")
+    clock[0] += 59
+    assert store.get("abc") is session
+    # Each use restarts the idle timer
+    clock[0] += 59
+    assert store.get("abc") is session
+    clock[0] += 61
+    assert store.get("abc") is None
+    assert len(store) == 0
+    assert store.get_or_create("abc") is not session
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    store = SessionStore(max_sessions=2, ttl_seconds=60, history_token_budget=100)
+    store.create("a")
+    store.create("b")
+    store.get("a")
+    store.create("c")
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.delete("a") and not store.delete("a")
+
+
+def test_creating_a_session_drops_expired_ones(clock):
+    store = SessionStore(max_sessions=10, ttl_seconds=60, history_token_budget=100)
+    store.create("old")
+    clock[0] += 120
+    store.create("new")
+    assert len(store) == 1
+
+
+def test_retrieval_cache_resets_when_scope_changes():
+    session = ChatSession("s")
+    cache = session.retrieval_cache((1, None))
+    cache["vpn"] = {0, 2}
+    session.last_documents = [0]
+    assert session.retrieval_cache((1, None)) == {"vpn": {0, 2}}
+    assert session.retrieval_cache((2, None)) == {}
+    assert session.last_documents == []
+
+
+def test_follow_up_sees_documents_added_after_the_first_question():
+    import main
+    corpus = Corpus()
+    corpus.add({"filename": "a.txt", "content": "the vpn client needs a token", "keywords": []})
+    session = ChatSession("s")
+    assert [doc["filename"] for doc in main.find_session_documents(session, "vpn token", corpus)] == ["a.txt"]
+    corpus.add({"filename": "b.txt", "content": "vpn token rotation happens monthly", "keywords": []})
+    found = main.find_session_documents(session, "vpn token", corpus)
+    assert sorted(doc["filename"] for doc in found) == ["a.txt", "b.txt"]
+
+
+def test_history_is_folded_into_the_summary_over_budget():
+    store = SessionStore(max_sessions=10, ttl_seconds=60, history_token_budget=95)
+    session = store.create()
+    for i in range(6):
+        store.record_turn(session, f"Question {i} about the printer? More detail.", f"Answer {i}. Extra words here.")
+    assert session.turns == 6
+    assert store._history_tokens(session) <= 95
+    assert [turn["question"][:10] for turn in session.history] == [f"Question {i}" for i in range(1, 6)]
+    assert session.summary == "Q: Question 0 about the printer? A: Answer 0."
+    messages = session.messages()
+    assert messages[0]["role"] == "system" and "Answer 0." in messages[0]["content"]
+    assert messages[-1] == {"role": "assistant", "content": "Answer 5. Extra words here."}
+
+
+def test_summary_is_capped_to_the_budget():
+    store = SessionStore(max_sessions=10, ttl_seconds=60, history_token_budget=20)
+    session = store.create()
+    for i in range(20):
+        store.record_turn(session, f"Question number {i}?", f"Answer number {i}.")
+    assert len(session.summary) <= 20 + len("...")
+    assert session.summary.startswith("...")
+    assert session.summary.endswith("Answer number 18.")
+
+
+def test_first_sentence():
+    assert first_sentence("  Restart it. Then wait.") == "Restart it."
+    assert first_sentence("no punctuation at all") == "no punctuation at all"
+    assert first_sentence("x" * 300) == "x" * 200
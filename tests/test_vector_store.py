@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pytest
+
+from services.vector_store import VectorStore, normalize
+
+
+def clustered(count, dimensions=64, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(count // 4 + 1, dimensions))
+    return normalize(np.repeat(centers, 4, axis=0)[:count] + rng.normal(scale=0.1, size=(count, dimensions)))
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_quantized_search_finds_the_exact_neighbours(quantization):
+    vectors = clustered(400)
+    store = VectorStore(64, quantization, rescore_factor=8)
+    store.add(vectors, [str(row) for row in range(400)])
+    exact = VectorStore(64, "none")
+    exact.add(vectors, [str(row) for row in range(400)])
+    recalled = 0
+    for query in vectors[::40]:
+        expected = {hit["row"] for hit in exact.search(query, 3)}
+        recalled += len(expected & {hit["row"] for hit in store.search(query, 3)})
+    assert recalled >= 0.9 * 30
+
+
+def test_search_respects_masks_and_deletes():
+    vectors = clustered(8)
+    store = VectorStore(64, "int8")
+    store.add(vectors, [f"v{row}" for row in range(8)], [{"filename": f"f{row % 2}.txt"} for row in range(8)])
+    assert store.search(vectors[0], 1)[0]["id"] == "v0"
+    store.delete([0])
+    assert store.search(vectors[0], 1)[0]["id"] != "v0"
+    mask = store.rows_matching({"filename": ["f1.txt"]})
+    assert all(int(hit["id"][1:]) % 2 for hit in store.search(vectors[0], 8, mask))
+    assert len(store) == 7
+
+
+def test_save_appends_only_new_rows_and_maps_them(tmp_path):
+    path = str(tmp_path / "store")
+    vectors = clustered(300)
+    store = VectorStore(64, "int8")
+    store.add(vectors[:200], [str(row) for row in range(200)], [{"n": row} for row in range(200)])
+    store.save(path)
+    assert store.memory_usage()["floats"] == 0
+    assert store.memory_usage()["floats_mapped"] == 200 * 64 * 4
+    first_write = os.stat(os.path.join(path, "vectors.bin"))
+
+    store.add(vectors[200:], [str(row) for row in range(200, 300)], [{"n": row} for row in range(200, 300)])
+    assert store.memory_usage()["floats"] == 100 * 64 * 4
+    store.delete([5])
+    store.save(path)
+    # Appended in place: same file, grown by the new rows only
+    assert os.stat(os.path.join(path, "vectors.bin")).st_ino == first_write.st_ino
+    assert os.path.getsize(os.path.join(path, "vectors.bin")) == 300 * 64 * 4
+
+    loaded = VectorStore.load(path)
+    assert isinstance(loaded._vectors.saved, np.memmap)
+    assert loaded.count == 300 and len(loaded) == 299
+    assert loaded.metadata[250] == {"n": 250}
+    assert loaded.search(vectors[250], 1)[0]["id"] == "250"
+    loaded.add(vectors[:1], ["again"])
+    assert loaded.memory_usage()["floats"] == 64 * 4
+    assert isinstance(loaded._vectors.saved, np.memmap)
+
+
+def test_interrupted_save_is_ignored_and_truncated(tmp_path):
+    path = str(tmp_path / "store")
+    vectors = clustered(20)
+    store = VectorStore(64, "binary")
+    store.add(vectors[:10], [str(row) for row in range(10)])
+    store.save(path)
+    # Rows appended by a save that died before committing store.json
+    with open(os.path.join(path, "vectors.bin"), "ab") as f:
+        f.write(b"\xff" * 1000)
+    with open(os.path.join(path, "metadata.jsonl"), "ab") as f:
+        f.write(b'{"id": "torn"')
+
+    loaded = VectorStore.load(path)
+    assert loaded.count == 10 and loaded.ids[-1] == "9"
+    loaded.add(vectors[10:], [str(row) for row in range(10, 20)])
+    loaded.save(path)
+    assert os.path.getsize(os.path.join(path, "vectors.bin")) == 20 * 64 * 4
+    assert VectorStore.load(path).ids == [str(row) for row in range(20)]
+
+
+def test_compact_rewrites_the_live_rows(tmp_path):
+    path = str(tmp_path / "store")
+    vectors = clustered(12)
+    store = VectorStore(64, "int8")
+    store.add(vectors, [str(row) for row in range(12)])
+    store.save(path)
+    store.delete(range(0, 12, 2))
+    store.compact()
+    store.save(path)
+    loaded = VectorStore.load(path)
+    assert loaded.ids == [str(row) for row in range(1, 12, 2)]
+    assert os.path.getsize(os.path.join(path, "vectors.bin")) == 6 * 64 * 4
+    assert loaded.search(vectors[3], 1)[0]["id"] == "3"